@@ -0,0 +1,217 @@
+# agent_registry.py
+import os
+import re
+import ast
+import time
+import importlib
+import threading
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+AGENTS_PACKAGE = "agents"
+AGENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), AGENTS_PACKAGE)
+# How often the agents table and package are re-scanned for new agents (a lookup miss re-scans sooner)
+AGENT_REGISTRY_REFRESH_SECONDS = float(os.getenv("AGENT_REGISTRY_REFRESH_SECONDS", "30"))
+MISS_REFRESH_SECONDS = 1.0
+
+# The built-in specialists and the task_type the orchestrator assigns them
+BUILTIN_AGENTS = {
+    "code_writing": ("agents.code_writer", "CodeWriterAgent"),
+    "repo_init": ("agents.repo_initializer", "RepoInitializerAgent"),
+    "documentation": ("agents.documentation", "DocumentationAgent"),
+    "api_integration": ("agents.api_integrator", "APIIntegratorAgent"),
+}
+
+def snake_case(name: str) -> str:
+    """PascalCase -> snake_case, the same conversion AgentGeneratorAgent uses for file names."""
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+def task_type_for(agent_name: str) -> str:
+    """The task_type a generated agent handles, e.g. OpenMeteoWeatherAgent -> open_meteo_weather."""
+    return snake_case(agent_name).removesuffix("_agent")
+
+def find_agent_classes(path: str) -> list:
+    """Names of the classes in a module that define execute_task, found without importing it."""
+    try:
+        with open(path) as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return []
+    return [
+        node.name for node in tree.body
+        if isinstance(node, ast.ClassDef) and any(
+            isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name == "execute_task"
+            for item in node.body
+        )
+    ]
+
+
+class AgentRegistry:
+    """
+    Maps task types to agent instances for the dispatcher. Besides the built-ins, it
+    discovers generated agents from the `agents` table and the `agents/` package, so a
+    running process picks up new task types without a restart.
+
+    Agents are imported and instantiated on their first dispatch and the instance is
+    reused afterwards. If an agent's module file changes on disk, the next lookup
+    reloads the module and builds a fresh instance.
+
+    Rescans and imports run outside the registry lock and only their results are
+    swapped in under it, so dispatching an already loaded agent never waits on them.
+    """
+    def __init__(self, db=None, agents_dir: str = AGENTS_DIR, package: str = AGENTS_PACKAGE,
+                 refresh_seconds: float = AGENT_REGISTRY_REFRESH_SECONDS):
+        self._db = db
+        self.agents_dir = agents_dir
+        self.package = package
+        self.refresh_seconds = refresh_seconds
+        self._specs = dict(BUILTIN_AGENTS)
+        self._loaded = {}  # task_type -> (instance, module file mtime)
+        self._scanned = {}  # module file -> (mtime, agent class names)
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+        # Serialize rescans, and imports or reloads, among themselves but not with lookups
+        self._refresh_lock = threading.Lock()
+        self._import_lock = threading.Lock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            from db_manager import DBManager
+            self._db = DBManager()
+        return self._db
+
+    def _module_path(self, module_name: str) -> str:
+        return os.path.join(self.agents_dir, module_name.rsplit(".", 1)[-1] + ".py")
+
+    def _mtime(self, module_name: str):
+        try:
+            return os.stat(self._module_path(module_name)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan_package(self) -> dict:
+        """{class name: module name} for every agent class in the package, re-parsing only changed files."""
+        builtin_modules = {module for module, _ in BUILTIN_AGENTS.values()}
+        found = {}
+        for file_name in sorted(os.listdir(self.agents_dir)):
+            if not file_name.endswith(".py") or file_name.startswith("_"):
+                continue
+            module_name = f"{self.package}.{file_name[:-3]}"
+            if module_name in builtin_modules:
+                continue
+            path = os.path.join(self.agents_dir, file_name)
+            mtime = os.stat(path).st_mtime_ns
+            if self._scanned.get(path, (None,))[0] != mtime:
+                self._scanned[path] = (mtime, find_agent_classes(path))
+            for class_name in self._scanned[path][1]:
+                found[class_name] = module_name
+        return found
+
+    def refresh(self, wait: bool = True):
+        """
+        Re-reads the agents table and package and registers any agents not seen before.
+        With wait=False it returns at once if another thread is already refreshing.
+        """
+        if not self._refresh_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                self._refreshed_at = time.monotonic()
+            # A file written since the last import wouldn't otherwise be visible to the import system
+            importlib.invalidate_caches()
+            discovered = self._scan_package()
+
+            try:
+                rows = self.db.query_all("SELECT name FROM agents ORDER BY id")
+            except Exception as e:
+                logger.error("Could not read the agents table.", extra={"error": str(e)})
+                rows = []
+            for row in rows:
+                module_name = f"{self.package}.{snake_case(row['name'])}"
+                if row['name'] not in discovered:
+                    if self._mtime(module_name) is None:
+                        logger.warning("Registered agent has no module.", extra={"agent_name": row['name'], "module_name": module_name})
+                        continue
+                    discovered[row['name']] = module_name
+
+            with self._lock:
+                for class_name, module_name in discovered.items():
+                    task_type = task_type_for(class_name)
+                    if task_type in BUILTIN_AGENTS:
+                        continue
+                    if self._specs.get(task_type) != (module_name, class_name):
+                        logger.info("Discovered agent.", extra={"agent_name": class_name, "task_type": task_type})
+                        self._specs[task_type] = (module_name, class_name)
+                        self._loaded.pop(task_type, None)
+        finally:
+            self._refresh_lock.release()
+
+    def _maybe_refresh(self, task_type: str = None):
+        with self._lock:
+            age = float("inf") if self._refreshed_at is None else time.monotonic() - self._refreshed_at
+            unknown = task_type is not None and task_type not in self._specs
+        # Misses re-scan sooner, but not on every lookup of a type nobody handles (e.g. 'general')
+        if unknown and age >= MISS_REFRESH_SECONDS:
+            self.refresh()
+        elif unknown and self._refresh_lock.locked():
+            # The rescan under way may be the one that finds it
+            with self._refresh_lock:
+                pass
+        elif age >= self.refresh_seconds:
+            # A periodic rescan someone else is already doing needn't hold this lookup up
+            self.refresh(wait=False)
+
+    def task_types(self) -> list:
+        self._maybe_refresh()
+        with self._lock:
+            return sorted(self._specs)
+
+    def __contains__(self, task_type) -> bool:
+        self._maybe_refresh(task_type)
+        with self._lock:
+            return task_type in self._specs
+
+    def _current(self, task_type):
+        """The task type's (module name, class name) and loaded (instance, mtime), read under the lock."""
+        with self._lock:
+            if task_type not in self._specs:
+                raise KeyError(task_type)
+            return self._specs[task_type], self._loaded.get(task_type)
+
+    def __getitem__(self, task_type):
+        self._maybe_refresh(task_type)
+        spec, loaded = self._current(task_type)
+        module_name, class_name = spec
+        mtime = self._mtime(module_name)
+        if loaded and loaded[1] == mtime:
+            return loaded[0]
+
+        with self._import_lock:
+            # Another thread may have loaded it while this one waited
+            spec, loaded = self._current(task_type)
+            if loaded and loaded[1] == mtime:
+                return loaded[0]
+            module = importlib.import_module(module_name)
+            if loaded:
+                logger.info("Reloading changed agent module.", extra={"task_type": task_type, "module_name": module_name})
+                module = importlib.reload(module)
+            instance = getattr(module, class_name)()
+
+        with self._lock:
+            if self._specs.get(task_type) == spec:
+                self._loaded[task_type] = (instance, mtime)
+        return instance
+
+
+_agent_registry = None
+_agent_registry_lock = threading.Lock()
+
+def get_agent_registry() -> AgentRegistry:
+    """Creates and reuses the single process-wide agent registry."""
+    global _agent_registry
+    with _agent_registry_lock:
+        if _agent_registry is None:
+            _agent_registry = AgentRegistry()
+    return _agent_registry
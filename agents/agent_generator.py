@@ -1,16 +1,20 @@
 # agents/agent_generator.py
 import os
 import re
-from vertexai.generative_models import GenerativeModel
 from db_manager import DBManager
 from logger import get_logger
+from llm import generate, get_model
 
 logger = get_logger(__name__)
 
 class AgentGeneratorAgent:
     def __init__(self):
         self.db = DBManager()
-        self.model = GenerativeModel("gemini-1.5-pro")
+        self.model_name = "gemini-1.5-pro"
+
+    @property
+    def model(self):
+        return get_model(self.model_name)
 
     def _generate_agent_code(self, spec: str, agent_name: str) -> str:
         """Uses an LLM to generate the full Python code for a new agent."""
@@ -53,7 +57,7 @@ class {agent_name}:
         ---
         """
         try:
-            response = self.model.generate_content(prompt)
+            response = generate(self.model, prompt)
             return response.text.strip().replace('```python', '').replace('```', '').strip()
         except Exception as e:
             logger.error("Error generating agent code with Gemini.", extra={"error": str(e)})
@@ -65,7 +69,7 @@ class {agent_name}:
         # Ask the LLM to suggest a good BASE name from the spec (e.g., Weather, FileSorter)
         naming_prompt = f"Based on the following agent specification, suggest a short, single-word PascalCase class name. For example, for 'An agent that gets the weather', a good name is 'Weather'. Only output the name. Specification: {spec}"
         try:
-            response = self.model.generate_content(naming_prompt)
+            response = generate(self.model, naming_prompt)
             # Clean up the name and remove the word Agent if the AI adds it anyway
             base_name = response.text.strip().replace("Agent", "")
 
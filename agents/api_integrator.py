@@ -1,19 +1,31 @@
 # agents/api_integrator.py
-from vertexai.generative_models import GenerativeModel
-from db_manager import DBManager
-from executor import run_in_sandbox
+from db_manager import DBManager, AsyncDBManager
+from executor import run_in_sandbox, run_in_sandbox_async, prewarm_sandbox
+from concurrency import run_blocking
+from llm import LLM_STREAMING, CodeFenceStripper, generate, generate_async, generate_stream, get_model
+from sandbox_images import image_for_files
+from task_writer import update_task, update_task_async
 from logger import get_logger
-from cache import cache_result, retry_on_failure
+from cache import cache_generation, retry_on_failure
 
 logger = get_logger(__name__)
 
+def _is_cacheable(code: str) -> bool:
+    return not code.startswith("print('Error generating code")
+
 class APIIntegratorAgent:
     def __init__(self):
         self.db = DBManager()
-        self.model = GenerativeModel("gemini-1.5-pro")
-    @retry_on_failure
-    def _generate_code(self, task_description: str) -> str:
-        prompt = f"""
+        self.async_db = AsyncDBManager(self.db)
+        self.model_name = "gemini-1.5-pro"
+
+    @property
+    def model(self):
+        # Shared across agents and built on first use, so constructing an agent stays cheap
+        return get_model(self.model_name)
+
+    def _build_prompt(self, task_description: str) -> str:
+        return f"""
         You are an expert Python developer specializing in API integration.
         Write a complete Python script to accomplish the following task.
         - The script will be executed in a sandboxed environment.
@@ -25,13 +37,53 @@ class APIIntegratorAgent:
 
         Task: "{task_description}"
         """
+
+    @cache_generation(prompt_version="1", cache_if=_is_cacheable)
+    @retry_on_failure
+    def _generate_code(self, task_description: str) -> str:
+        prompt = self._build_prompt(task_description)
+        try:
+            response = generate(self.model, prompt)
+            return response.text.strip().replace('```python', '').replace('```', '').strip()
+        except Exception as e:
+            logger.error("Error generating code with Gemini.", extra={"error": str(e)})
+            return f"print('Error generating code: {e}')"
+
+    @cache_generation(prompt_version="1", cache_if=_is_cacheable)
+    @retry_on_failure
+    async def _generate_code_async(self, task_description: str) -> str:
+        prompt = self._build_prompt(task_description)
         try:
-            response = self.model.generate_content(prompt)
+            response = await generate_async(self.model, prompt)
             return response.text.strip().replace('```python', '').replace('```', '').strip()
         except Exception as e:
             logger.error("Error generating code with Gemini.", extra={"error": str(e)})
             return f"print('Error generating code: {e}')"
 
+    @cache_generation(prompt_version="1", cache_if=_is_cacheable, name="APIIntegratorAgent._generate_code")
+    def _generate_code_streaming(self, task_description: str) -> str:
+        """
+        Streams the generation, warming a sandbox container while tokens arrive, and
+        returns as soon as the code block closes.
+        """
+        prompt = self._build_prompt(task_description)
+        # The prompt mandates `requests`, so the image can be prepared before the code exists
+        prewarm_sandbox(network_enabled=True, image=lambda: image_for_files({'main.py': 'import requests'}))
+        stripper = CodeFenceStripper()
+        try:
+            stream = generate_stream(self.model, prompt)
+            try:
+                for text in stream:
+                    stripper.feed(text)
+                    if stripper.closed:
+                        break
+            finally:
+                stream.close()
+            return stripper.finish()
+        except Exception as e:
+            logger.error("Error generating code with Gemini.", extra={"error": str(e)})
+            return f"print('Error generating code: {e}')"
+
     def execute_task(self, task_id: int):
         task = self.db.query_one("SELECT description FROM tasks WHERE id = %s", (task_id,))
         if not task:
@@ -41,20 +93,48 @@ class APIIntegratorAgent:
         log_context = {"task_id": task_id, "description": task['description']}
         logger.info("Executing API task.", extra=log_context)
 
-        generated_code = self._generate_code(task['description'])
+        if LLM_STREAMING:
+            generated_code = self._generate_code_streaming(task['description'])
+        else:
+            generated_code = self._generate_code(task['description'])
         logger.info("Generated code for API task.", extra={"task_id": task_id, "code_length": len(generated_code)})
 
+        # Dependencies come pre-installed in an image variant picked from the script's imports
         files = {'main.py': generated_code}
-        command = "pip install -q requests && python main.py"
+        command = "python main.py"
+        image = image_for_files(files)
         
-        result = run_in_sandbox(command, files, network_enabled=True)
+        result = run_in_sandbox(command, files, network_enabled=True, image=image)
         logger.info("Execution result for API task.", extra={"task_id": task_id, "result": result})
 
         status = 'completed' if result['exit_code'] == 0 else 'failed'
         output = result['stdout'] if status == 'completed' else result['stderr']
         
-        self.db.execute(
-            "UPDATE tasks SET code = %s, output = %s, status = %s WHERE id = %s",
-            (generated_code, output, status, task_id)
-        )
+        update_task(self.db, task_id, code=generated_code, output=output, status=status)
+        logger.info(f"Task marked as '{status}'.", extra={"task_id": task_id, "status": status})
+
+    async def execute_task_async(self, task_id: int):
+        """asyncio variant of execute_task for the async pipeline."""
+        task = await self.async_db.query_one("SELECT description FROM tasks WHERE id = %s", (task_id,))
+        if not task:
+            logger.warning("Task not found in DB.", extra={"task_id": task_id})
+            return
+
+        log_context = {"task_id": task_id, "description": task['description']}
+        logger.info("Executing API task.", extra=log_context)
+
+        generated_code = await self._generate_code_async(task['description'])
+        logger.info("Generated code for API task.", extra={"task_id": task_id, "code_length": len(generated_code)})
+
+        files = {'main.py': generated_code}
+        command = "python main.py"
+        image = await run_blocking("sandbox", image_for_files, files)
+
+        result = await run_in_sandbox_async(command, files, network_enabled=True, image=image)
+        logger.info("Execution result for API task.", extra={"task_id": task_id, "result": result})
+
+        status = 'completed' if result['exit_code'] == 0 else 'failed'
+        output = result['stdout'] if status == 'completed' else result['stderr']
+
+        await update_task_async(self.async_db, task_id, code=generated_code, output=output, status=status)
         logger.info(f"Task marked as '{status}'.", extra={"task_id": task_id, "status": status})
@@ -1,18 +1,28 @@
 # agents/documentation.py
-from vertexai.generative_models import GenerativeModel
-from db_manager import DBManager
+from db_manager import DBManager, AsyncDBManager
+from llm import generate, generate_async, get_model
+from task_writer import update_task, update_task_async
 from logger import get_logger
-from cache import cache_result, retry_on_failure
+from cache import cache_generation, retry_on_failure
 
 logger = get_logger(__name__)
 
+def _is_cacheable(docs: str) -> bool:
+    return not docs.startswith("# Error\n")
+
 class DocumentationAgent:
     def __init__(self):
         self.db = DBManager()
-        self.model = GenerativeModel("gemini-1.5-pro")
-    @retry_on_failure
-    def _generate_docs(self, code_to_document: str) -> str:
-        prompt = f"""
+        self.async_db = AsyncDBManager(self.db)
+        self.model_name = "gemini-1.5-pro"
+
+    @property
+    def model(self):
+        # Shared across agents and built on first use, so constructing an agent stays cheap
+        return get_model(self.model_name)
+
+    def _build_prompt(self, code_to_document: str) -> str:
+        return f"""
         You are a technical writer. Your task is to generate a clear and concise
         `README.md` file in Markdown format for the following Python code.
         - Explain the purpose of the code.
@@ -25,8 +35,24 @@ class DocumentationAgent:
         {code_to_document}
         ---
         """
+
+    @cache_generation(prompt_version="1", cache_if=_is_cacheable)
+    @retry_on_failure
+    def _generate_docs(self, code_to_document: str) -> str:
+        prompt = self._build_prompt(code_to_document)
         try:
-            response = self.model.generate_content(prompt)
+            response = generate(self.model, prompt)
+            return response.text.strip()
+        except Exception as e:
+            logger.error("Could not generate documentation.", extra={"error": str(e)})
+            return f"# Error\n\nCould not generate documentation: {e}"
+
+    @cache_generation(prompt_version="1", cache_if=_is_cacheable)
+    @retry_on_failure
+    async def _generate_docs_async(self, code_to_document: str) -> str:
+        prompt = self._build_prompt(code_to_document)
+        try:
+            response = await generate_async(self.model, prompt)
             return response.text.strip()
         except Exception as e:
             logger.error("Could not generate documentation.", extra={"error": str(e)})
@@ -37,7 +63,7 @@ class DocumentationAgent:
         if not source_task or not source_task['code']:
             log_context = {"task_id": task_id, "source_task_id": source_code_task_id}
             logger.warning("No source code found for task to document.", extra=log_context)
-            self.db.execute("UPDATE tasks SET status = 'failed', output = 'Source code not found' WHERE id = %s", (task_id,))
+            update_task(self.db, task_id, output='Source code not found', status='failed')
             return
 
         log_context = {"task_id": task_id, "source_task_id": source_code_task_id}
@@ -46,8 +72,23 @@ class DocumentationAgent:
         documentation = self._generate_docs(source_task['code'])
         logger.info("Generated documentation.", extra={"task_id": task_id, "doc_length": len(documentation)})
 
-        self.db.execute(
-            "UPDATE tasks SET output = %s, status = %s WHERE id = %s",
-            (documentation, 'completed', task_id)
-        )
+        update_task(self.db, task_id, output=documentation, status='completed')
+        logger.info(f"Task marked as 'completed'.", extra={"task_id": task_id, "status": "completed"})
+
+    async def execute_task_async(self, task_id: int, source_code_task_id: int):
+        """asyncio variant of execute_task for the async pipeline."""
+        source_task = await self.async_db.query_one("SELECT code FROM tasks WHERE id = %s", (source_code_task_id,))
+        if not source_task or not source_task['code']:
+            log_context = {"task_id": task_id, "source_task_id": source_code_task_id}
+            logger.warning("No source code found for task to document.", extra=log_context)
+            await update_task_async(self.async_db, task_id, output='Source code not found', status='failed')
+            return
+
+        log_context = {"task_id": task_id, "source_task_id": source_code_task_id}
+        logger.info("Generating documentation.", extra=log_context)
+
+        documentation = await self._generate_docs_async(source_task['code'])
+        logger.info("Generated documentation.", extra={"task_id": task_id, "doc_length": len(documentation)})
+
+        await update_task_async(self.async_db, task_id, output=documentation, status='completed')
         logger.info(f"Task marked as 'completed'.", extra={"task_id": task_id, "status": "completed"})
@@ -1,22 +1,61 @@
 # agents/orchestrator.py
 import os
 import json
-import vertexai
-from vertexai.generative_models import GenerativeModel, GenerationConfig
+import hashlib
 from db_manager import DBManager
 from cache import cache_result, retry_on_failure
 from logger import get_logger
+from llm import generate, get_model, task_priority
+from plan_cache import SEMANTIC_PLAN_CACHE, get_plan_cache
+from agent_registry import get_agent_registry
 
 logger = get_logger(__name__)
 
+# What the planner is told each built-in task type is for; code_writing is the catch-all
+BUILTIN_TASK_TYPES = {
+    "repo_init": "For tasks like initializing a git repository.",
+    "documentation": "For tasks related to writing a README.md or other documentation.",
+    "api_integration": "For tasks that involve fetching data from a third-party API.",
+    "code_writing": "For general Python code that doesn't fit other categories.",
+}
+
+# Bump whenever the planning prompt changes, so plans cached for the old prompt aren't reused
+PLANNING_PROMPT_VERSION = "1"
+
+def planning_task_types() -> list:
+    """
+    [task_type, description] pairs the planner may assign: the built-ins plus every
+    generated agent the registry has discovered, with the catch-all last.
+    """
+    try:
+        registered = get_agent_registry().task_types()
+    except Exception as e:
+        logger.error("Could not list registered task types.", extra={"error": str(e)})
+        registered = []
+    generated = [
+        [task_type, f"For tasks the generated {task_type.replace('_', ' ')} agent specializes in."]
+        for task_type in registered if task_type not in BUILTIN_TASK_TYPES
+    ]
+    builtins = [[task_type, description] for task_type, description in BUILTIN_TASK_TYPES.items()]
+    return builtins[:-1] + generated + builtins[-1:]
+
+def planner_version(task_types: list) -> str:
+    """Identifies the planning prompt and task types a plan was made with, for the plan cache."""
+    digest = hashlib.sha256(json.dumps([PLANNING_PROMPT_VERSION, task_types]).encode("utf-8")).hexdigest()
+    return digest[:16]
+
 class ChiefOrchestratorAgent:
     def __init__(self):
         self.db = DBManager()
 
     @cache_result(ttl_seconds=86400)
     @retry_on_failure
-    def _call_llm_for_planning(self, goal: str) -> dict | None:
-        """Calls the Vertex AI Gemini API to get a categorized project plan."""
+    def _call_llm_for_planning(self, goal: str, task_types: list) -> dict | None:
+        """
+        Calls the Vertex AI Gemini API to get a categorized project plan. `task_types` is
+        part of the cache key, so a newly discovered agent invalidates cached plans.
+        """
+        allowed = "\n".join(f'           - "{task_type}": {description}' for task_type, description in task_types)
         prompt = f"""
         You are an expert software project manager. Break down the following high-level goal
         into a series of specific, ordered, and actionable tasks. For each task, you must
@@ -29,24 +68,49 @@ class ChiefOrchestratorAgent:
         2. "description": A clear, concise command for another agent to execute.
         3. "dependencies": An array of 'task_id's that must be completed before this task can start.
         4. "task_type": The category of the task. Must be one of the following strings:
-           - "repo_init": For tasks like initializing a git repository.
-           - "documentation": For tasks related to writing a README.md or other documentation.
-           - "api_integration": For tasks that involve fetching data from a third-party API.
-           - "code_writing": For general Python code that doesn't fit other categories.
+{allowed}
 
         Goal: "{goal}"
         """
         try:
-            model = GenerativeModel("gemini-1.5-pro")
-            generation_config = GenerationConfig(response_mime_type="application/json")
-            response = model.generate_content(prompt, generation_config=generation_config)
+            model = get_model("gemini-1.5-pro")
+            generation_config = {"response_mime_type": "application/json"}
+            # Planning gates every task of the project, so it jumps the LLM queue
+            with task_priority(0):
+                response = generate(model, prompt, generation_config=generation_config)
             return json.loads(response.text)
         except Exception as e:
             logger.error("Error calling Vertex AI API or parsing JSON.", extra={"error": str(e), "goal": goal})
             return None
 
+    def _plan_for_goal(self, goal: str) -> dict | None:
+        """
+        A stored plan for a goal worded like an earlier one and planned with the current
+        prompt and task types, else a fresh plan from the LLM.
+        """
+        task_types = planning_task_types()
+        if not SEMANTIC_PLAN_CACHE:
+            return self._call_llm_for_planning(goal, task_types)
+        plan_cache = get_plan_cache()
+        version = planner_version(task_types)
+        try:
+            cached = plan_cache.lookup(goal, planner_version=version)
+        except Exception as e:
+            logger.error("Plan cache lookup failed.", extra={"error": str(e), "goal": goal})
+            cached = None
+        if cached is not None:
+            return cached
+
+        plan = self._call_llm_for_planning(goal, task_types)
+        if plan and 'tasks' in plan:
+            try:
+                plan_cache.store(goal, plan, planner_version=version)
+            except Exception as e:
+                logger.error("Could not store plan in the plan cache.", extra={"error": str(e), "goal": goal})
+        return plan
+
     def plan_and_store_tasks(self, project_id: int, goal: str):
-        plan = self._call_llm_for_planning(goal)
+        plan = self._plan_for_goal(goal)
         if not plan or 'tasks' not in plan:
             logger.error("Failed to generate a valid plan from the LLM.", extra={"project_id": project_id, "goal": goal})
             return
@@ -54,15 +118,40 @@ class ChiefOrchestratorAgent:
         task_count = len(plan['tasks'])
         logger.info(f"Generated {task_count} categorized tasks. Storing in database...", extra={"project_id": project_id, "task_count": task_count})
         
-        for task in plan['tasks']:
-            dependencies_json = json.dumps(task.get('dependencies', []))
-            task_type = task.get('task_type', 'general')
-            
-            self.db.execute(
+        tasks = plan['tasks']
+        # One transaction: insert every task in a single statement, then point the
+        # plan-local dependency ids at the ids the database assigned
+        with self.db.transaction():
+            inserted = self.db.execute_values(
                 """
                 INSERT INTO tasks (project_id, description, dependencies, task_type, status)
-                VALUES (%s, %s, %s, %s, 'pending')
+                VALUES %s RETURNING id
                 """,
-                (project_id, task['description'], dependencies_json, task_type)
+                [(project_id, task['description'], '[]', task.get('task_type', 'general'), 'pending') for task in tasks],
+                fetch=True
             )
+            plan_to_db = {
+                task.get('task_id', position): row['id']
+                for position, (task, row) in enumerate(zip(tasks, inserted), start=1)
+            }
+
+            remapped = []
+            for task, row in zip(tasks, inserted):
+                dependencies = []
+                for dep in task.get('dependencies', []):
+                    if dep in plan_to_db:
+                        dependencies.append(plan_to_db[dep])
+                    else:
+                        logger.warning("Dropping unknown plan dependency.", extra={"task_id": row['id'], "dependency": dep})
+                if dependencies:
+                    remapped.append((row['id'], json.dumps(dependencies)))
+            if remapped:
+                self.db.execute_values(
+                    """
+                    UPDATE tasks SET dependencies = data.dependencies
+                    FROM (VALUES %s) AS data (id, dependencies) WHERE tasks.id = data.id
+                    """,
+                    remapped,
+                    template="(%s, %s::jsonb)"
+                )
         logger.info("All tasks have been successfully stored in the database.", extra={"project_id": project_id})
@@ -1,20 +1,29 @@
 # agents/repo_initializer.py
-from vertexai.generative_models import GenerativeModel
-from db_manager import DBManager
-from executor import run_in_sandbox
+from db_manager import DBManager, AsyncDBManager
+from executor import run_in_sandbox, run_in_sandbox_async
+from llm import generate, generate_async, get_model
+from task_writer import update_task, update_task_async
 from logger import get_logger
-from cache import cache_result, retry_on_failure
+from cache import cache_generation, retry_on_failure
 
 logger = get_logger(__name__)
 
+def _is_cacheable(command: str) -> bool:
+    return not command.startswith("echo 'Error generating command")
+
 class RepoInitializerAgent:
     def __init__(self):
         self.db = DBManager()
-        self.model = GenerativeModel("gemini-1.5-pro")
+        self.async_db = AsyncDBManager(self.db)
+        self.model_name = "gemini-1.5-pro"
 
-    @retry_on_failure
-    def _generate_command(self, task_description: str) -> str:
-        prompt = f"""
+    @property
+    def model(self):
+        # Shared across agents and built on first use, so constructing an agent stays cheap
+        return get_model(self.model_name)
+
+    def _build_prompt(self, task_description: str) -> str:
+        return f"""
         You are an expert in shell commands and git. Based on the following task,
         provide a single, executable shell command to accomplish it.
         - Only output the raw shell command.
@@ -24,8 +33,24 @@ class RepoInitializerAgent:
 
         Task: "{task_description}"
         """
+
+    @cache_generation(prompt_version="1", cache_if=_is_cacheable)
+    @retry_on_failure
+    def _generate_command(self, task_description: str) -> str:
+        prompt = self._build_prompt(task_description)
         try:
-            response = self.model.generate_content(prompt)
+            response = generate(self.model, prompt)
+            return response.text.strip().replace('`', '')
+        except Exception as e:
+            logger.error("Error generating command with Gemini.", extra={"error": str(e)})
+            return f"echo 'Error generating command: {e}'"
+
+    @cache_generation(prompt_version="1", cache_if=_is_cacheable)
+    @retry_on_failure
+    async def _generate_command_async(self, task_description: str) -> str:
+        prompt = self._build_prompt(task_description)
+        try:
+            response = await generate_async(self.model, prompt)
             return response.text.strip().replace('`', '')
         except Exception as e:
             logger.error("Error generating command with Gemini.", extra={"error": str(e)})
@@ -49,8 +74,27 @@ class RepoInitializerAgent:
         status = 'completed' if result['exit_code'] == 0 else 'failed'
         output = result['stdout'] if status == 'completed' else result['stderr']
         
-        self.db.execute(
-            "UPDATE tasks SET output = %s, status = %s WHERE id = %s",
-            (output, status, task_id)
-        )
+        update_task(self.db, task_id, output=output, status=status)
+        logger.info(f"Task marked as '{status}'.", extra={"task_id": task_id, "status": status})
+
+    async def execute_task_async(self, task_id: int):
+        """asyncio variant of execute_task for the async pipeline."""
+        task = await self.async_db.query_one("SELECT description FROM tasks WHERE id = %s", (task_id,))
+        if not task:
+            logger.warning("Task not found in DB.", extra={"task_id": task_id})
+            return
+
+        log_context = {"task_id": task_id, "description": task['description']}
+        logger.info("Executing repo task.", extra=log_context)
+
+        command = await self._generate_command_async(task['description'])
+        logger.info("Generated command.", extra={"task_id": task_id, "command": command})
+
+        result = await run_in_sandbox_async(command)
+        logger.info("Execution result.", extra={"task_id": task_id, "result": result})
+
+        status = 'completed' if result['exit_code'] == 0 else 'failed'
+        output = result['stdout'] if status == 'completed' else result['stderr']
+
+        await update_task_async(self.async_db, task_id, output=output, status=status)
         logger.info(f"Task marked as '{status}'.", extra={"task_id": task_id, "status": status})
@@ -1,8 +1,58 @@
 # agents/tester.py
-import vertexai
-from vertexai.generative_models import GenerativeModel
+import os
+import shlex
+import concurrent.futures
+from xml.etree import ElementTree
 from db_manager import DBManager
 from executor import run_in_sandbox
+from sandbox_images import image_for_files
+from cache import cache_generation
+from llm import generate, get_model
+from task_writer import update_task, write_task_now
+
+# Tasks whose tests share one sandbox run, and the pytest processes run side by side in it
+TESTER_BATCH_SIZE = int(os.getenv("TESTER_BATCH_SIZE", "20"))
+TESTER_WORKERS = int(os.getenv("TESTER_WORKERS", "4"))
+# Per-task limit on a pytest run, so one hung main.py or test can't hold up the rest of its batch
+TESTER_TIMEOUT_SECONDS = int(os.getenv("TESTER_TIMEOUT_SECONDS", "120"))
+# Exit code of coreutils `timeout` when it had to stop the command
+TIMEOUT_EXIT_CODE = "124"
+# Longest failure message kept per test result
+TEST_MESSAGE_LIMIT = 2000
+
+JUNIT_OUTCOMES = {"failure": "failed", "error": "error", "skipped": "skipped"}
+
+def parse_junit_xml(report: str) -> list:
+    """Per-test rows {name, classname, outcome, duration_seconds, message} from a pytest JUnit XML report."""
+    results = []
+    for case in ElementTree.fromstring(report).iter("testcase"):
+        outcome, message = "passed", None
+        for tag, tag_outcome in JUNIT_OUTCOMES.items():
+            element = case.find(tag)
+            if element is not None:
+                outcome = tag_outcome
+                message = (element.get("message") or element.text or "")[:TEST_MESSAGE_LIMIT]
+                break
+        results.append({
+            "name": case.get("name"),
+            "classname": case.get("classname"),
+            "outcome": outcome,
+            "duration_seconds": float(case.get("time") or 0),
+            "message": message,
+        })
+    return results
+
+def batch_command(directories: list, workers: int = TESTER_WORKERS, timeout: int = TESTER_TIMEOUT_SECONDS) -> str:
+    """
+    Runs pytest separately in each task directory, `workers` at a time and each for at
+    most `timeout` seconds. Every task has its own main.py, so they can't share a pytest
+    process. Reports, logs and exit codes are collected under reports/ as
+    <directory>.xml, .log and .exit.
+    """
+    names = " ".join(shlex.quote(d) for d in directories)
+    run_one = (f"cd \"$1\" && timeout -k 5 {int(timeout)} python -m pytest -q -p no:cacheprovider "
+               "--junitxml=\"../reports/$1.xml\" > \"../reports/$1.log\" 2>&1; echo $? > \"../reports/$1.exit\"")
+    return f"mkdir -p reports && printf '%s\\n' {names} | xargs -P {workers} -I{{}} sh -c {shlex.quote(run_one)} _ {{}}"
 
 class TesterAgent:
     """
@@ -11,8 +61,14 @@ class TesterAgent:
     """
     def __init__(self):
         self.db = DBManager()
-        self.model = GenerativeModel("gemini-1.5-pro")
+        self.model_name = "gemini-1.5-pro"
+
+    @property
+    def model(self):
+        # Shared across agents and built on first use, so constructing an agent stays cheap
+        return get_model(self.model_name)
 
+    @cache_generation(prompt_version="1")
     def _generate_test_code(self, code_to_test: str) -> str:
         """Uses an LLM to generate pytest code."""
         prompt = f"""
@@ -32,7 +88,7 @@ class TesterAgent:
         ---
         """
         try:
-            response = self.model.generate_content(prompt)
+            response = generate(self.model, prompt)
             return response.text.strip().replace('```python', '').replace('```', '').strip()
         except Exception as e:
             print(f"Error generating test code with Gemini: {e}")
@@ -40,40 +96,98 @@ class TesterAgent:
 
     def run_tests_for_task(self, task_id: int):
         """The main method to generate and run tests for a given task."""
-        task = self.db.query_one("SELECT code FROM tasks WHERE id = %s", (task_id,))
-        if not task or not task['code']:
-            print(f"No code found for task {task_id} to test.")
-            self.db.execute("UPDATE tasks SET test_status = 'no_code' WHERE id = %s", (task_id,))
-            return
-
-        print(f"Generating tests for task {task_id}...")
-        test_code = self._generate_test_code(task['code'])
-        print("--- Generated Test Code ---\n" + test_code)
-
-        if not test_code:
-            print("LLM failed to generate test code.")
-            self.db.execute("UPDATE tasks SET test_status = 'generation_failed' WHERE id = %s", (task_id,))
-            return
-
-        # Prepare the files for the sandbox
-        files = {
-            'main.py': task['code'],
-            'test_main.py': test_code
-        }
-        
-        # Command to install pytest and run it
-        command = "pytest -v --junitxml=report.xml; exit_code=$?; cat report.xml; exit $exit_code"
-
-        print("Running tests in sandbox...")
-        result = run_in_sandbox(command, files)
-        
-        print("--- Test Execution Result ---\n", result)
-
-        # Determine status and update the database
-        test_status = 'pass' if result['exit_code'] == 0 else 'fail'
-        
-        self.db.execute(
-            "UPDATE tasks SET test_status = %s WHERE id = %s",
-            (test_status, task_id)
+        return self.run_tests_for_tasks([task_id]).get(task_id)
+
+    def run_tests_for_project(self, project_id: int) -> dict:
+        """Tests every completed task of a project that produced code."""
+        rows = self.db.query_all(
+            "SELECT id FROM tasks WHERE project_id = %s AND status = 'completed' AND code IS NOT NULL ORDER BY id",
+            (project_id,)
         )
-        print(f"Task {task_id} test status updated to '{test_status}'.")
+        return self.run_tests_for_tasks([row['id'] for row in rows])
+
+    def run_tests_for_tasks(self, task_ids: list, batch_size: int = TESTER_BATCH_SIZE,
+                            workers: int = TESTER_WORKERS) -> dict:
+        """
+        Generates and runs tests for many tasks, `batch_size` tasks per sandbox run: each
+        task gets its own directory and up to `workers` pytest processes run at once.
+        Per-test results go to the test_results table and each task's verdict to its
+        test_status. Returns {task_id: test_status}.
+        """
+        statuses = {}
+        rows = self.db.query_all("SELECT id, code FROM tasks WHERE id = ANY(%s) ORDER BY id", (list(task_ids),))
+        found = {row['id']: row['code'] for row in rows}
+        with_code = []
+        for task_id in task_ids:
+            if found.get(task_id):
+                with_code.append(task_id)
+            else:
+                print(f"No code found for task {task_id} to test.")
+                statuses[task_id] = 'no_code'
+                update_task(self.db, task_id, test_status='no_code')
+
+        print(f"Generating tests for {len(with_code)} tasks...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            test_codes = dict(zip(with_code, pool.map(lambda task_id: self._generate_test_code(found[task_id]), with_code)))
+
+        ready = []
+        for task_id in with_code:
+            if test_codes[task_id]:
+                ready.append(task_id)
+            else:
+                print(f"LLM failed to generate test code for task {task_id}.")
+                statuses[task_id] = 'generation_failed'
+                update_task(self.db, task_id, test_status='generation_failed')
+
+        for start in range(0, len(ready), batch_size):
+            batch = {task_id: (found[task_id], test_codes[task_id]) for task_id in ready[start:start + batch_size]}
+            statuses.update(self._run_batch(batch, workers))
+        return statuses
+
+    def _run_batch(self, batch: dict, workers: int) -> dict:
+        """Runs one sandbox for {task_id: (code, test_code)} and stores what its reports say."""
+        files = {}
+        for task_id, (code, test_code) in batch.items():
+            files[f"task_{task_id}/main.py"] = code
+            files[f"task_{task_id}/test_main.py"] = test_code
+
+        print(f"Running tests for tasks {sorted(batch)} in one sandbox...")
+        command = batch_command([f"task_{task_id}" for task_id in batch], workers)
+        result = run_in_sandbox(command, files, image=image_for_files(files), artifacts=["reports"])
+        reports = result.get('artifacts') or {}
+
+        statuses, rows = {}, []
+        for task_id in batch:
+            exit_code = reports.get(f"reports/task_{task_id}.exit", "").strip()
+            report = reports.get(f"reports/task_{task_id}.xml")
+            if exit_code == TIMEOUT_EXIT_CODE:
+                print(f"Tests for task {task_id} timed out after {TESTER_TIMEOUT_SECONDS}s.")
+                statuses[task_id] = 'error'
+                continue
+            if not exit_code or report is None:
+                # pytest never got to write a report: the run or the sandbox itself failed
+                print(f"No test report for task {task_id}:", result['stderr'] or reports.get(f"reports/task_{task_id}.log"))
+                statuses[task_id] = 'error'
+                continue
+            try:
+                results = parse_junit_xml(report)
+            except ElementTree.ParseError as e:
+                print(f"Unreadable test report for task {task_id}: {e}")
+                statuses[task_id] = 'error'
+                continue
+            statuses[task_id] = 'pass' if exit_code == "0" else 'fail'
+            rows.extend((task_id, r['name'], r['classname'], r['outcome'], r['duration_seconds'], r['message']) for r in results)
+
+        # Replace the batch's previous results and record the verdicts in one commit; the
+        # verdicts bypass the write-behind buffer, which would commit them separately
+        with self.db.transaction():
+            self.db.execute("DELETE FROM test_results WHERE task_id = ANY(%s)", (list(batch),))
+            if rows:
+                self.db.execute_values(
+                    "INSERT INTO test_results (task_id, name, classname, outcome, duration_seconds, message) VALUES %s",
+                    rows
+                )
+            for task_id, test_status in statuses.items():
+                write_task_now(self.db, task_id, {"test_status": test_status})
+        print(f"Test statuses updated: {statuses}")
+        return statuses
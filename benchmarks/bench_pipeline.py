@@ -0,0 +1,539 @@
+# benchmarks/bench_pipeline.py
+"""
+Runs main()'s planning and dispatch path end to end with no network, GPU or Docker,
+and reports throughput, task latency percentiles and peak memory as the plan size and
+worker count grow.
+
+    python benchmarks/bench_pipeline.py [--tasks 10,50,200] [--workers 1,4,16]
+        [--mode thread|async] [--llm-latency lognormal:0.8,0.4] [--sandbox-latency fixed:0.2]
+        [--sandbox fake|subprocess] [--db sqlite|postgres] [--json results.json]
+
+Stand-ins:
+- LLM: a deterministic fake GenerativeModel (installed as vertexai.generative_models)
+  that returns a plan of the requested size and canned code, after a latency drawn
+  from a configurable distribution: fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA.
+- Sandbox: `fake` sleeps for the sandbox latency and succeeds (or fails a --fail-rate
+  share of runs); `subprocess` really runs each command locally in a temp directory.
+- Database: an in-memory SQLite database behind the DBManager interface, or with
+  --db postgres the real schema in a throwaway schema of DATABASE_URL.
+
+Latencies are drawn from a seed, the request content and its attempt number, so a
+run is reproducible whatever order the threads get to it. The LLM rate limiter keeps
+its in-flight cap but gets unlimited RPM/TPM unless --rpm/--tpm are given. The LLM
+tail-latency settings (LLM_DEADLINE_SECONDS, LLM_HEDGE_PERCENTILE, ...) are read from the
+environment as usual, and each run starts with fresh latency history and circuit
+breakers. tasks/s counts dispatched tasks (skipped ones aren't) over the whole run,
+planning included. Peak memory is the tracemalloc peak of Python allocations during
+the run (tracing adds some overhead; --no-memory turns it off).
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import types
+import random
+import sqlite3
+import logging
+import argparse
+import asyncio
+import tempfile
+import threading
+import statistics
+import subprocess
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+import executor
+import llm
+import metrics
+import db_manager
+import agent_registry
+import plan_cache
+import task_writer
+
+PROJECT_ID = 1
+# Tasks per layer of the generated plan; each depends on one or two tasks of the layer before
+PLAN_WIDTH = 8
+POSTGRES_SCHEMA = "metamorph_pipeline_bench"
+
+
+class Latency:
+    """A latency distribution parsed from fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA (seconds)."""
+    def __init__(self, spec: str = "fixed:0", seed: int = 0):
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",")] if args else []
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"Bad latency spec {spec!r}; use fixed:S, uniform:LO,HI or lognormal:MEDIAN,SIGMA")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+        self.seed = seed
+
+    def sample(self, key: str) -> float:
+        """The latency for a request, the same for the same `key` on every run."""
+        rng = random.Random(f"{self.seed}:{key}")
+        if self.kind == "fixed":
+            return self.values[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.values)
+        median, sigma = self.values
+        return median * math.exp(rng.gauss(0, sigma)) if median > 0 else 0.0
+
+
+def make_plan(task_count: int, width: int = PLAN_WIDTH, seed: int = 0) -> dict:
+    """
+    A plan shaped like the orchestrator's output: a repo_init root, layers of code and
+    API tasks that each depend on one or two tasks of the previous layer, and a final
+    documentation task that waits for the last layer.
+    """
+    rng = random.Random(seed)
+    tasks = [{"task_id": 1, "description": "Initialize a git repository", "dependencies": [], "task_type": "repo_init"}]
+    previous_layer = [1]
+    layer = []
+    for task_id in range(2, task_count):
+        task_type = "api_integration" if task_id % 5 == 0 else "code_writing"
+        dependencies = sorted(rng.sample(previous_layer, min(len(previous_layer), rng.randint(1, 2))))
+        tasks.append({"task_id": task_id, "description": f"Write script number {task_id}",
+                      "dependencies": dependencies, "task_type": task_type})
+        layer.append(task_id)
+        if len(layer) == width:
+            previous_layer, layer = layer, []
+    if layer:
+        previous_layer = layer
+    if task_count > 1:
+        tasks.append({"task_id": task_count, "description": "Write the README.md",
+                      "dependencies": previous_layer, "task_type": "documentation"})
+    return {"tasks": tasks[:task_count]}
+
+
+class FakeGenerativeModel:
+    """
+    Stands in for vertexai's GenerativeModel. Answers by recognising which agent's
+    prompt it got; `plan` is what the orchestrator's planning prompt returns.
+    """
+    latency = Latency()
+    plan = make_plan(3)
+    # Requests per prompt so far: a retry or hedge of a prompt draws a fresh latency
+    attempts = {}
+    attempts_lock = threading.Lock()
+
+    def __init__(self, model_name: str, **config):
+        self._model_name = model_name
+        self.config = config
+
+    @classmethod
+    def delay(cls, prompt: str) -> float:
+        with cls.attempts_lock:
+            attempt = cls.attempts.get(prompt, 0)
+            cls.attempts[prompt] = attempt + 1
+        return cls.latency.sample(f"{prompt}:{attempt}")
+
+    @classmethod
+    def answer(cls, prompt: str) -> str:
+        if "project manager" in prompt:
+            return json.dumps(cls.plan)
+        if "technical writer" in prompt:
+            return "# README\n\nGenerated offline."
+        if "shell commands and git" in prompt:
+            return "echo initialized"
+        task = re.search(r'Task: "(.*)"', prompt)
+        description = task.group(1) if task else "ok"
+        return f"```python\ndef main():\n    print({description!r})\n\nif __name__ == \"__main__\":\n    main()\n```"
+
+    @staticmethod
+    def _response(text: str, prompt: str):
+        usage = types.SimpleNamespace(total_token_count=(len(prompt) + len(text)) // 4)
+        return types.SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        prompt = str(prompt)
+        text = self.answer(prompt)
+        delay = self.delay(prompt)
+        if stream:
+            return self._stream(text, prompt, delay)
+        time.sleep(delay)
+        return self._response(text, prompt)
+
+    def _stream(self, text: str, prompt: str, delay: float):
+        chunks = [text[i:i + 32] for i in range(0, len(text), 32)] or [""]
+        for chunk in chunks:
+            time.sleep(delay / len(chunks))
+            yield self._response(chunk, prompt)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        prompt = str(prompt)
+        await asyncio.sleep(self.delay(prompt))
+        return self._response(self.answer(prompt), prompt)
+
+
+class FakeSandbox:
+    """
+    Replaces the Docker backends of executor.run_in_sandbox, so its result caching still
+    runs. `fake` sleeps and reports success; `subprocess` runs the command for real in a
+    temporary directory (no isolation: only for the stand-in code above).
+    """
+    def __init__(self, mode: str = "fake", latency: Latency = None, fail_rate: float = 0.0, seed: int = 0):
+        if mode not in ("fake", "subprocess"):
+            raise ValueError(f"Unknown sandbox mode {mode!r}")
+        self.mode = mode
+        self.latency = latency or Latency()
+        self.fail_rate = fail_rate
+        self.seed = seed
+
+    def __call__(self, command: str, files: dict, network_enabled: bool, on_output=None,
+                 artifacts: list = None, image: str = executor.SANDBOX_IMAGE) -> dict:
+        key = json.dumps([command, sorted((files or {}).items())])
+        if self.mode == "subprocess":
+            result = self._run_subprocess(command, files)
+        else:
+            time.sleep(self.latency.sample(key))
+            failed = random.Random(f"{self.seed}:fail:{key}").random() < self.fail_rate
+            result = {"stdout": "" if failed else "ok\n", "stderr": "injected failure\n" if failed else "",
+                      "exit_code": 1 if failed else 0, "time_to_first_byte": 0.0}
+        if on_output:
+            for stream in ("stdout", "stderr"):
+                for line in result[stream].splitlines():
+                    on_output(stream, line)
+        if artifacts:
+            result["artifacts"] = {}
+        return result
+
+    @staticmethod
+    def _run_subprocess(command: str, files: dict) -> dict:
+        started = time.monotonic()
+        with tempfile.TemporaryDirectory(prefix="metamorph-bench-") as workdir:
+            for name, content in (files or {}).items():
+                path = os.path.join(workdir, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as f:
+                    f.write(content)
+            completed = subprocess.run(command, shell=True, cwd=workdir, capture_output=True, text=True,
+                                       env={**os.environ, "PYTHONPATH": ""})
+        return {"stdout": completed.stdout, "stderr": completed.stderr, "exit_code": completed.returncode,
+                "time_to_first_byte": time.monotonic() - started}
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE projects (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    goal TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE agents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    description TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER REFERENCES projects(id),
+    description TEXT NOT NULL,
+    status TEXT DEFAULT 'pending',
+    code TEXT,
+    output TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    lease_owner TEXT,
+    lease_expires_at TEXT,
+    task_type TEXT NOT NULL DEFAULT 'code_writing',
+    dependencies TEXT NOT NULL DEFAULT '[]',
+    test_status TEXT
+);
+CREATE INDEX tasks_project_status_id_idx ON tasks (project_id, status, id);
+CREATE TABLE plan_cache (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    goal TEXT NOT NULL,
+    vectorizer TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    plan TEXT NOT NULL,
+    planner_version TEXT NOT NULL DEFAULT '',
+    expires_at REAL NOT NULL DEFAULT 0,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+def sqlite_sql(sql: str) -> str:
+    """Rewrites the Postgres dialect the pipeline uses into SQLite's."""
+    sql = re.sub(r"::\w+", "", sql)
+    sql = re.sub(r"\bnow\(\)", "CURRENT_TIMESTAMP", sql)
+    sql = sql.replace("FOR UPDATE SKIP LOCKED", "")
+    return sql.replace("%s", "?")
+
+def _values_alias(sql: str) -> str:
+    # FROM (VALUES ...) AS data (id, x): SQLite names VALUES columns column1, column2, ...
+    def rewrite(match):
+        columns = ", ".join(f"column{i} AS {name.strip()}" for i, name in enumerate(match.group(2).split(","), start=1))
+        return f"(SELECT {columns} FROM (VALUES %s)) AS {match.group(1)}"
+    return re.sub(r"\(VALUES %s\)\s+AS\s+(\w+)\s*\(([^)]*)\)", rewrite, sql)
+
+
+class SQLiteDatabase:
+    """One in-memory database shared by every SQLiteDBManager; statements are serialized."""
+    def __init__(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.lock = threading.RLock()
+
+    def close(self):
+        self.conn.close()
+
+_database = None
+
+class SQLiteDBManager:
+    """
+    DBManager's interface over the current SQLiteDatabase. SQLite serializes writers, so
+    this measures the pipeline's own overheads rather than Postgres concurrency.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def database(self) -> SQLiteDatabase:
+        return _database
+
+    @contextmanager
+    def transaction(self):
+        if getattr(self._local, "depth", 0):
+            self._local.depth += 1
+            try:
+                yield self
+            finally:
+                self._local.depth -= 1
+            return
+        with self.database.lock:
+            self.database.conn.execute("BEGIN")
+            self._local.depth = 1
+            try:
+                yield self
+                self.database.conn.execute("COMMIT")
+            except Exception:
+                self.database.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._local.depth = 0
+
+    def _run(self, sql, params=None):
+        with self.database.lock:
+            return self.database.conn.execute(sqlite_sql(sql), tuple(params or ())).fetchall()
+
+    def execute(self, sql, params=None):
+        self._run(sql, params)
+
+    def query_one(self, sql, params=None):
+        rows = self._run(sql, params)
+        return rows[0] if rows else None
+
+    def query_all(self, sql, params=None):
+        return self._run(sql, params)
+
+    def iter_query(self, sql, params=None, fetch_size: int = db_manager.DB_FETCH_SIZE, row_type: str = "dict"):
+        for row in self._run(sql, params):
+            yield tuple(row) if row_type == "tuple" else row
+
+    def execute_values(self, sql, rows, template=None, page_size=1000, fetch=False):
+        sql = _values_alias(sql)
+        results = []
+        for start in range(0, len(rows), page_size):
+            page = [tuple(row) for row in rows[start:start + page_size]]
+            row_template = template or "(" + ", ".join(["%s"] * len(page[0])) + ")"
+            statement = sql.replace("VALUES %s", "VALUES " + ", ".join([row_template] * len(page)), 1)
+            results.extend(self._run(statement, [value for row in page for value in row]))
+        return results if fetch else None
+
+
+def _replace_everywhere(stack: ExitStack, name: str, original, replacement):
+    # Modules bind DBManager at import, so patch it wherever it was already imported
+    for module in list(sys.modules.values()):
+        if module is not None and getattr(module, name, None) is original:
+            stack.enter_context(mock.patch.object(module, name, replacement))
+
+@contextmanager
+def offline(plan: dict, llm_latency: Latency, sandbox: FakeSandbox, db: str = "sqlite",
+            rpm: int = 10 ** 9, tpm: int = 10 ** 12):
+    """Installs the stand-ins for the duration of the block."""
+    fake_vertexai = types.ModuleType("vertexai")
+    fake_vertexai.init = lambda **kwargs: None
+    fake_models = types.ModuleType("vertexai.generative_models")
+    fake_models.GenerativeModel = FakeGenerativeModel
+    fake_vertexai.generative_models = fake_models
+
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.dict(sys.modules, {"vertexai": fake_vertexai,
+                                                          "vertexai.generative_models": fake_models}))
+        stack.enter_context(mock.patch.dict(llm._models, clear=True))
+        stack.enter_context(mock.patch.object(FakeGenerativeModel, "plan", plan))
+        stack.enter_context(mock.patch.object(FakeGenerativeModel, "latency", llm_latency))
+        stack.enter_context(mock.patch.object(FakeGenerativeModel, "attempts", {}))
+        stack.enter_context(mock.patch.dict(llm._breakers, clear=True))
+        stack.enter_context(mock.patch.dict(llm._latency_trackers, clear=True))
+        stack.enter_context(mock.patch.object(llm, "_rate_limiter", llm.LLMRateLimiter(rpm=rpm, tpm=tpm)))
+        stack.enter_context(mock.patch.object(cache, "get_redis_client", lambda: None))
+        stack.enter_context(mock.patch.object(executor, "SANDBOX_POOL_SIZE", 0))
+        stack.enter_context(mock.patch.object(executor, "_run_cold", sandbox))
+        stack.enter_context(mock.patch.object(executor, "_sandbox_image_id", lambda image=None: "sha256:offline"))
+        stack.enter_context(mock.patch.object(agent_registry, "_agent_registry", None))
+        stack.enter_context(mock.patch.object(task_writer, "_task_writer", None))
+        stack.enter_context(mock.patch.object(plan_cache, "_plan_cache", None))
+        stack.enter_context(mock.patch.object(metrics, "METRICS_PORT", None))
+        if db == "sqlite":
+            _replace_everywhere(stack, "DBManager", db_manager.DBManager, SQLiteDBManager)
+        yield
+
+
+def _percentile(samples: list, pct: int) -> float:
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+def _reset_database(db: str):
+    global _database
+    if db == "sqlite":
+        if _database is not None:
+            _database.close()
+        _database = SQLiteDatabase()
+        SQLiteDBManager().execute("INSERT INTO projects (id, name, goal) VALUES (%s, %s, %s)",
+                                  (PROJECT_ID, "bench", "offline benchmark"))
+    else:
+        real = db_manager.DBManager()
+        real.execute("TRUNCATE tasks, projects, plan_cache RESTART IDENTITY CASCADE")
+        real.execute("INSERT INTO projects (id, name, goal) VALUES (%s, %s, %s)", (PROJECT_ID, "bench", "offline benchmark"))
+
+def run_pipeline(tasks: int, workers: int, mode: str = "thread", llm_latency: Latency = None,
+                 sandbox: FakeSandbox = None, db: str = "sqlite", trace_memory: bool = True,
+                 keep_cache: bool = False, rpm: int = 10 ** 9, tpm: int = 10 ** 12, seed: int = 0) -> dict:
+    """Plans and runs one project of `tasks` tasks through main.main() and returns its measurements."""
+    plan = make_plan(tasks, seed=seed)
+    with offline(plan, llm_latency or Latency(seed=seed), sandbox or FakeSandbox(seed=seed), db, rpm, tpm), \
+            mock.patch.dict(os.environ, {"MAX_WORKERS": str(workers), "EXECUTION_MODE": mode}):
+        import main
+
+        _reset_database(db)
+        if not keep_cache:
+            cache.get_generation_cache().clear()
+            cache.get_sandbox_result_cache().clear()
+
+        latencies = []
+        latencies_lock = threading.Lock()
+
+        def timed(dispatch):
+            def run(*args):
+                started = time.perf_counter()
+                try:
+                    return dispatch(*args)
+                finally:
+                    with latencies_lock:
+                        latencies.append(time.perf_counter() - started)
+            return run
+
+        def timed_async(dispatch):
+            async def run(*args):
+                started = time.perf_counter()
+                try:
+                    return await dispatch(*args)
+                finally:
+                    with latencies_lock:
+                        latencies.append(time.perf_counter() - started)
+            return run
+
+        with mock.patch.object(main, "dispatch_task", timed(main.dispatch_task)), \
+                mock.patch.object(main, "dispatch_task_async", timed_async(main.dispatch_task_async)):
+            if trace_memory:
+                tracemalloc.start()
+            started = time.perf_counter()
+            main.main()
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+            if trace_memory:
+                tracemalloc.stop()
+
+        rows = (SQLiteDBManager() if db == "sqlite" else db_manager.DBManager()).query_all(
+            "SELECT status, count(*) AS n FROM tasks WHERE project_id = %s GROUP BY status", (PROJECT_ID,))
+        statuses = {row['status']: row['n'] for row in rows}
+
+    latencies.sort()
+    result = {
+        "tasks": tasks, "workers": workers, "mode": mode,
+        "seconds": elapsed,
+        "tasks_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "peak_mb": peak / 2 ** 20 if peak is not None else None,
+        "completed": statuses.get("completed", 0),
+        "failed": statuses.get("failed", 0),
+        "skipped": statuses.get("skipped", 0),
+    }
+    for pct in (50, 95, 99):
+        result[f"p{pct}_ms"] = _percentile(latencies, pct) * 1000 if latencies else None
+    return result
+
+
+@contextmanager
+def _postgres_schema():
+    # Every pooled connection (including the migration runner's) works in the bench schema
+    from dotenv import load_dotenv
+    import migrate
+    load_dotenv()
+    os.environ["PGOPTIONS"] = f"-c search_path={POSTGRES_SCHEMA}"
+    admin = db_manager.DBManager()
+    admin.execute(f"DROP SCHEMA IF EXISTS {POSTGRES_SCHEMA} CASCADE; CREATE SCHEMA {POSTGRES_SCHEMA}")
+    migrate.migrate()
+    try:
+        yield
+    finally:
+        admin.execute(f"DROP SCHEMA {POSTGRES_SCHEMA} CASCADE")
+
+def _int_list(value: str) -> list:
+    return [int(v) for v in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the planning and dispatch path.")
+    parser.add_argument("--tasks", type=_int_list, default=[10, 50, 200], help="plan sizes, comma separated")
+    parser.add_argument("--workers", type=_int_list, default=[1, 4, 16], help="MAX_WORKERS values, comma separated")
+    parser.add_argument("--mode", choices=("thread", "async"), default="thread")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.4")
+    parser.add_argument("--sandbox-latency", default="fixed:0.2")
+    parser.add_argument("--sandbox", choices=("fake", "subprocess"), default="fake")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of fake sandbox runs that exit 1")
+    parser.add_argument("--db", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--rpm", type=int, default=10 ** 9)
+    parser.add_argument("--tpm", type=int, default=10 ** 12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-cache", action="store_true", help="keep generation and sandbox caches between runs")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    llm_latency = Latency(args.llm_latency, seed=args.seed)
+    sandbox = FakeSandbox(args.sandbox, Latency(args.sandbox_latency, seed=args.seed), args.fail_rate, seed=args.seed)
+    # The pipeline logs every step; keep only errors
+    logging.disable(logging.WARNING)
+
+    results = []
+    with ExitStack() as stack:
+        if args.db == "postgres":
+            stack.enter_context(_postgres_schema())
+        print(f"{'tasks':>6}{'workers':>8}{'tasks/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'peak MB':>9}  done/failed/skipped")
+        for tasks in args.tasks:
+            for workers in args.workers:
+                result = run_pipeline(tasks, workers, args.mode, llm_latency, sandbox, args.db,
+                                      trace_memory=not args.no_memory, keep_cache=args.keep_cache,
+                                      rpm=args.rpm, tpm=args.tpm, seed=args.seed)
+                results.append(result)
+                cells = [f"{result[k]:.0f}" if result[k] is not None else "-" for k in ("p50_ms", "p95_ms", "p99_ms")]
+                peak = f"{result['peak_mb']:.1f}" if result["peak_mb"] is not None else "-"
+                print(f"{tasks:>6}{workers:>8}{result['tasks_per_sec']:>9.2f}" + "".join(f"{c:>9}" for c in cells) + f"{peak:>9}"
+                      f"  {result['completed']}/{result['failed']}/{result['skipped']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
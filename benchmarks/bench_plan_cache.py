@@ -0,0 +1,63 @@
+# benchmarks/bench_plan_cache.py
+"""
+Measures the semantic plan cache's in-memory side: embedding a goal and searching an
+index of N cached goals, for growing N. No database is involved.
+
+    python benchmarks/bench_plan_cache.py [--sizes 1000,10000,50000] [--runs 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from plan_cache import GoalVectorizer, PlanIndex
+
+VERBS = ["write", "build", "create", "fetch", "parse", "scrape", "plot", "test", "document", "deploy"]
+NOUNS = ["script", "api", "csv", "report", "dashboard", "bitcoin price", "weather forecast", "readme",
+         "git repository", "database", "flask app", "cli tool", "json file", "chart", "unit tests"]
+
+def synthetic_goal(rng: random.Random) -> str:
+    return ", then ".join(f"{rng.choice(VERBS)} a {rng.choice(NOUNS)} for project {rng.randint(1, 10 ** 6)}"
+                          for _ in range(rng.randint(2, 4)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the semantic plan cache index.")
+    parser.add_argument("--sizes", type=lambda v: [int(n) for n in v.split(",")], default=[1000, 10000, 50000])
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    vectorizer = GoalVectorizer()
+    queries = [synthetic_goal(rng) for _ in range(args.runs)]
+
+    started = time.perf_counter()
+    query_vectors = [vectorizer.embed(goal) for goal in queries]
+    embed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    print(f"embed: {embed_ms:.3f} ms per goal ({vectorizer.dim} dims)")
+
+    print(f"{'plans':>8}{'index MB':>10}{'median ms':>11}{'p99 ms':>9}")
+    index = PlanIndex(vectorizer.dim)
+    for size in sorted(args.sizes):
+        missing = size - len(index)
+        # Random unit vectors stand in for embeddings: search cost doesn't depend on content
+        vectors = np.random.default_rng(size).standard_normal((missing, vectorizer.dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        # Every entry shares one content key and never expires: the worst case, all ranked
+        index.add(np.arange(len(index) + 1, size + 1), vectors, np.zeros(missing, dtype=np.int64), np.inf)
+
+        samples = []
+        for vector in query_vectors:
+            started = time.perf_counter()
+            index.best(vector, 0, time.time())
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        megabytes = size * vectorizer.dim * 4 / 2 ** 20
+        print(f"{size:>8}{megabytes:>10.1f}{statistics.median(samples):>11.3f}{samples[int(len(samples) * 0.99) - 1]:>9.3f}")
+
+if __name__ == "__main__":
+    main()
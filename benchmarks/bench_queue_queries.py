@@ -0,0 +1,122 @@
+# benchmarks/bench_queue_queries.py
+"""
+Shows the plans and latency of the queue's hot queries on a large tasks table,
+before and after the queue indexes (migration 0004).
+
+    DATABASE_URL=... python benchmarks/bench_queue_queries.py [--tasks 1000000] [--runs 20]
+
+Everything happens in a throwaway schema (metamorph_bench) that is dropped at the end.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from db_manager import get_connection_pool
+import migrate
+
+BENCH_SCHEMA = "metamorph_bench"
+INDEX_VERSION = 4
+TASKS_PER_PROJECT = 50
+
+# (label, sql, params) with the shapes used by main.py, dispatcher.py and worker.py
+def hot_queries(project_id: int) -> list:
+    return [
+        ("project load (main.py)",
+         "SELECT id, status, dependencies FROM tasks WHERE project_id = %s ORDER BY id", (project_id,)),
+        ("pending tasks of a project",
+         "SELECT id FROM tasks WHERE project_id = %s AND status = 'pending' ORDER BY id", (project_id,)),
+        ("latest completed code task (dispatcher.py)",
+         "SELECT id FROM tasks WHERE project_id = %s AND status = 'completed' "
+         "AND task_type IN ('code_writing', 'api_integration') ORDER BY id DESC LIMIT 1", (project_id,)),
+        ("claim scan (worker.py)",
+         "SELECT id, project_id FROM tasks WHERE status = 'pending' ORDER BY id LIMIT 20 FOR UPDATE SKIP LOCKED", None),
+        ("expired lease reclaim (worker.py)",
+         "SELECT id FROM tasks WHERE status = 'running' AND lease_expires_at < now()", None),
+    ]
+
+SEED_SQL = f"""
+INSERT INTO projects (name, goal)
+SELECT 'bench ' || g, 'benchmark project' FROM generate_series(1, %(projects)s) AS g;
+
+-- Mostly finished history with a thin pending/running frontier, like a long-lived queue
+INSERT INTO tasks (project_id, description, status, task_type, dependencies, lease_expires_at)
+SELECT
+    1 + (g - 1) / {TASKS_PER_PROJECT},
+    'task ' || g,
+    CASE WHEN mod(g, 100) = 0 THEN 'pending' WHEN mod(g, 997) = 0 THEN 'running'
+         WHEN mod(g, 50) = 0 THEN 'failed' ELSE 'completed' END,
+    (ARRAY['code_writing', 'api_integration', 'documentation', 'repo_init'])[1 + mod(g, 4)],
+    CASE WHEN mod(g, {TASKS_PER_PROJECT}) = 1 THEN '[]'::jsonb ELSE jsonb_build_array(g - 1) END,
+    now() - interval '1 hour'
+FROM generate_series(1, %(tasks)s) AS g;
+"""
+
+def measure(cur, sql, params, runs: int) -> tuple:
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+    plan = "\n".join(row[0] for row in cur.fetchall())
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    cur.connection.rollback()  # release the claim scan's row locks
+    return plan, statistics.median(samples)
+
+def report(title: str, cur, project_id: int, runs: int) -> dict:
+    print(f"\n=== {title} ===")
+    latencies = {}
+    for label, sql, params in hot_queries(project_id):
+        plan, median_ms = measure(cur, sql, params, runs)
+        latencies[label] = median_ms
+        print(f"\n--- {label}: median {median_ms:.2f} ms over {runs} runs\n{plan}")
+    return latencies
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark the task queue's hot queries.")
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    # Every pooled connection (including the migration runner's) works in the bench schema
+    os.environ["PGOPTIONS"] = f"-c search_path={BENCH_SCHEMA}"
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE; CREATE SCHEMA {BENCH_SCHEMA}")
+            conn.commit()
+
+            migrate.migrate(target=INDEX_VERSION - 1)
+            projects = -(-args.tasks // TASKS_PER_PROJECT)
+            print(f"Seeding {args.tasks} tasks across {projects} projects...")
+            cur.execute(SEED_SQL, {"tasks": args.tasks, "projects": projects})
+            cur.execute("ANALYZE projects; ANALYZE tasks")
+            conn.commit()
+
+            # A project in the middle of the id range, so neither end of an index is a shortcut
+            project_id = projects // 2
+            before = report("without queue indexes", cur, project_id, args.runs)
+
+            migrate.migrate()
+            cur.execute("ANALYZE tasks")
+            conn.commit()
+            after = report("with queue indexes", cur, project_id, args.runs)
+
+            print(f"\n{'query':<45}{'before ms':>11}{'after ms':>11}")
+            for label in before:
+                print(f"{label:<45}{before[label]:>11.2f}{after[label]:>11.2f}")
+
+            cur.execute(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE")
+            conn.commit()
+    finally:
+        pool.putconn(conn)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# benchmarks/bench_startup.py
+"""
+Measures how long each entry point takes to import, in a fresh interpreter per
+module, and whether the heavy client stacks (vertexai, docker) were pulled in.
+
+    python benchmarks/bench_startup.py [--runs 5] [module ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["dashboard", "db_manager", "dispatcher", "worker", "main"]
+HEAVY_MODULES = ["vertexai", "docker"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def time_import(module: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    args = parser.parse_args()
+
+    print(f"{'module':<14}{'median ms':>11}{'min ms':>9}  heavy imports")
+    for module in args.modules:
+        samples = [time_import(module) for _ in range(args.runs)]
+        seconds = [s["seconds"] for s in samples]
+        loaded = ", ".join(samples[-1]["loaded"]) or "-"
+        print(f"{module:<14}{statistics.median(seconds) * 1000:>11.1f}{min(seconds) * 1000:>9.1f}  {loaded}")
+
+if __name__ == "__main__":
+    main()
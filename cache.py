@@ -1,9 +1,15 @@
 # cache.py
 import os
 import redis
+import asyncio
 import functools
+import hashlib
+import inspect
 import json
+import threading
+from collections import OrderedDict
 from tenacity import retry, stop_after_attempt, wait_exponential
+from metrics import record_cache, record_retry
 
 # This is a "singleton" pattern to hold our connection
 _redis_client = None
@@ -48,11 +54,156 @@ def cache_result(ttl_seconds=3600):
         return wrapper
     return decorator
 
+# Entries kept in the in-process front tier of each two-tier cache
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "256"))
+SANDBOX_RESULT_CACHE_SIZE = int(os.getenv("SANDBOX_RESULT_CACHE_SIZE", "256"))
+
+class TwoTierCache:
+    """
+    An in-process LRU in front of Redis, for JSON-serializable values.
+    Callers pass SHA-256 digest keys, so prompts and code never appear in Redis in plaintext.
+    """
+    def __init__(self, max_entries: int = GENERATION_CACHE_SIZE, name: str = "generation"):
+        self.max_entries = max_entries
+        self.name = name
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"local_hits": 0, "remote_hits": 0, "misses": 0, "evictions": 0}
+
+    def get_local(self, key):
+        with self._lock:
+            if key not in self._local:
+                return None
+            self._local.move_to_end(key)
+            self.stats["local_hits"] += 1
+            value = self._local[key]
+        record_cache(self.name, "local_hit")
+        return value
+
+    def get_remote(self, key):
+        redis_client = get_redis_client()
+        if not redis_client:
+            return None
+        try:
+            cached_value = redis_client.get(key)
+        except redis.exceptions.RedisError:
+            return None
+        if cached_value is None:
+            return None
+        value = json.loads(cached_value)
+        with self._lock:
+            self.stats["remote_hits"] += 1
+        record_cache(self.name, "remote_hit")
+        self.put_local(key, value)
+        return value
+
+    def put_local(self, key, value):
+        with self._lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def put(self, key, value, ttl_seconds: int):
+        self.put_local(key, value)
+        redis_client = get_redis_client()
+        if redis_client:
+            try:
+                redis_client.setex(key, ttl_seconds, json.dumps(value))
+            except redis.exceptions.RedisError:
+                pass
+
+    def record_miss(self):
+        with self._lock:
+            self.stats["misses"] += 1
+        record_cache(self.name, "miss")
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+def digest_key(prefix: str, *parts) -> str:
+    """Builds a cache key from the SHA-256 of the JSON-encoded parts."""
+    payload = json.dumps(list(parts), sort_keys=True)
+    return f"{prefix}:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+_generation_cache = TwoTierCache(GENERATION_CACHE_SIZE, name="generation")
+_sandbox_result_cache = TwoTierCache(SANDBOX_RESULT_CACHE_SIZE, name="sandbox_result")
+
+def get_generation_cache() -> TwoTierCache:
+    return _generation_cache
+
+def get_sandbox_result_cache() -> TwoTierCache:
+    return _sandbox_result_cache
+
+def cache_generation(prompt_version: str, ttl_seconds=86400, cache_if=bool, name: str = None):
+    """
+    Memoizes an agent's LLM generation method through the shared generation cache.
+
+    The key covers the method, the agent's `model_name`, `prompt_version` (bump it when
+    the prompt template changes) and the call arguments. Sync and `_async` variants of
+    a method share entries, and `name` lets another method (e.g. a streaming variant)
+    share them too. Results failing `cache_if` (e.g. error fallbacks) are not stored.
+    """
+    def decorator(func):
+        key_name = name or func.__qualname__.removesuffix("_async")
+
+        def key_for(args, kwargs):
+            model_name = getattr(args[0], "model_name", "")
+            return digest_key("gen", key_name, model_name, prompt_version, list(args[1:]), sorted(kwargs.items()))
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                cache = get_generation_cache()
+                key = key_for(args, kwargs)
+                cached = cache.get_local(key)
+                if cached is None:
+                    cached = await asyncio.to_thread(cache.get_remote, key)
+                if cached is not None:
+                    return cached
+
+                cache.record_miss()
+                result = await func(*args, **kwargs)
+                if cache_if(result):
+                    await asyncio.to_thread(cache.put, key, result, ttl_seconds)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_generation_cache()
+            key = key_for(args, kwargs)
+            cached = cache.get_local(key)
+            if cached is None:
+                cached = cache.get_remote(key)
+            if cached is not None:
+                return cached
+
+            cache.record_miss()
+            result = func(*args, **kwargs)
+            if cache_if(result):
+                cache.put(key, result, ttl_seconds)
+            return result
+        return wrapper
+    return decorator
+
 def retry_on_failure(func):
-    @retry(
+    retrying = retry(
         stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10)
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        before_sleep=lambda retry_state: record_retry(func.__qualname__)
     )
+    # tenacity retries coroutines natively, as long as the wrapper itself is async
+    if inspect.iscoroutinefunction(func):
+        @retrying
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            return await func(*args, **kwargs)
+        return async_wrapper
+
+    @retrying
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         return func(*args, **kwargs)
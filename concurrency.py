@@ -0,0 +1,27 @@
+# concurrency.py
+import os
+import asyncio
+import weakref
+
+# How many coroutines may use each resource class at once in asyncio mode
+RESOURCE_LIMITS = {
+    "llm": int(os.getenv("LLM_CONCURRENCY", "16")),
+    "sandbox": int(os.getenv("SANDBOX_CONCURRENCY", "8")),
+    "db": int(os.getenv("DB_CONCURRENCY", "10")),
+}
+
+# Semaphores belong to an event loop, so keep one set per loop
+_semaphores = weakref.WeakKeyDictionary()
+
+def limiter(resource: str) -> asyncio.Semaphore:
+    """Returns the running loop's semaphore for a resource class ('llm', 'sandbox' or 'db')."""
+    loop = asyncio.get_running_loop()
+    per_loop = _semaphores.setdefault(loop, {})
+    if resource not in per_loop:
+        per_loop[resource] = asyncio.Semaphore(RESOURCE_LIMITS[resource])
+    return per_loop[resource]
+
+async def run_blocking(resource: str, func, *args, **kwargs):
+    """Runs a blocking call on a worker thread while holding the resource's semaphore."""
+    async with limiter(resource):
+        return await asyncio.to_thread(func, *args, **kwargs)
@@ -1,6 +1,14 @@
 # dashboard.py
-from flask import Flask, render_template_string
+import os
+import json
+import queue
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from flask import Flask, Response, jsonify, render_template_string, request
 from db_manager import DBManager
+from events import get_task_event_listener
+from metrics import render_latest
 from dotenv import load_dotenv
 
 # Load environment variables to get the database URL
@@ -8,6 +16,18 @@ load_dotenv()
 
 app = Flask(__name__)
 
+# One query helper for the app; its connections come from the process-wide pool
+db = DBManager()
+
+PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 500
+# Pages kept in memory until a task event invalidates them
+PAGE_CACHE_SIZE = 128
+# Recent events remembered so a page loaded while they arrived isn't cached stale
+PAGE_CACHE_EVENT_LOG = 1024
+# Comment lines that keep idle event streams open through proxies
+SSE_KEEPALIVE_SECONDS = 15
+
 # This is our simple HTML template with some basic styling
 HTML_TEMPLATE = """
 <!doctype html>
@@ -19,6 +39,7 @@ HTML_TEMPLATE = """
     <style>
       body { font-family: sans-serif; background-color: #f4f4f9; color: #333; margin: 2em; }
       h1 { color: #444; }
+      form { margin-bottom: 1em; }
       table { width: 100%; border-collapse: collapse; box-shadow: 0 2px 3px rgba(0,0,0,0.1); }
       th, td { padding: 12px; border: 1px solid #ddd; text-align: left; }
       th { background-color: #6c7ae0; color: white; }
@@ -26,23 +47,39 @@ HTML_TEMPLATE = """
       .status-completed { color: green; font-weight: bold; }
       .status-failed { color: red; font-weight: bold; }
       .status-pending { color: orange; font-weight: bold; }
+      .status-running { color: #6c7ae0; font-weight: bold; }
+      .status-skipped { color: gray; font-weight: bold; }
     </style>
   </head>
   <body>
     <h1>Metamorph Agent - Task Dashboard</h1>
+    <form method="get">
+      <label>Project <input name="project_id" value="{{ filters.project_id or '' }}" size="6"></label>
+      <label>Status
+        <select name="status">
+          <option value="">any</option>
+          {% for s in statuses %}
+          <option value="{{ s }}" {% if filters.status == s %}selected{% endif %}>{{ s }}</option>
+          {% endfor %}
+        </select>
+      </label>
+      <button type="submit">Filter</button>
+    </form>
     <table>
       <thead>
         <tr>
           <th>ID</th>
+          <th>Project</th>
           <th>Type</th>
           <th>Description</th>
           <th>Status</th>
         </tr>
       </thead>
-      <tbody>
-        {% for task in tasks %}
-        <tr>
+      <tbody id="tasks">
+        {% for task in page.tasks %}
+        <tr id="task-{{ task.id }}">
           <td>{{ task.id }}</td>
+          <td>{{ task.project_id }}</td>
           <td>{{ task.task_type }}</td>
           <td>{{ task.description }}</td>
           <td class="status-{{ task.status.lower() }}">{{ task.status }}</td>
@@ -50,17 +87,230 @@ HTML_TEMPLATE = """
         {% endfor %}
       </tbody>
     </table>
+    {% if page.next_before %}
+    <p><a href="?{{ older_query }}">Older tasks &rarr;</a></p>
+    {% endif %}
+    <script>
+      // Status changes are pushed over Server-Sent Events and patched into the table
+      const filters = {{ filters | tojson }};
+      const firstPage = {{ (filters.before is none) | tojson }};
+      const source = new EventSource("/events" + (filters.project_id ? "?project_id=" + filters.project_id : ""));
+      source.onmessage = (message) => {
+        const event = JSON.parse(message.data);
+        const row = document.getElementById("task-" + event.id);
+        if (row && filters.status && filters.status !== event.status) {
+          row.remove();  // no longer matches the status filter
+        } else if (row) {
+          const cell = row.lastElementChild;
+          cell.textContent = event.status;
+          cell.className = "status-" + event.status;
+        } else if (event.op === "insert" && firstPage && (!filters.status || filters.status === event.status)) {
+          const tr = document.createElement("tr");
+          tr.id = "task-" + event.id;
+          for (const value of [event.id, event.project_id, event.task_type, "(new task)", event.status]) {
+            const td = document.createElement("td");
+            td.textContent = value;
+            tr.appendChild(td);
+          }
+          tr.lastElementChild.className = "status-" + event.status;
+          document.getElementById("tasks").prepend(tr);
+        }
+      };
+    </script>
   </body>
 </html>
 """
 
+STATUSES = ("pending", "running", "completed", "failed", "skipped")
+
+
+def fetch_tasks(project_id: int = None, status: str = None, before: int = None, limit: int = PAGE_SIZE) -> dict:
+    """
+    One page of tasks, newest first, using keyset pagination: pass the returned
+    `next_before` as `before` to get the next page. Unlike OFFSET, every page costs
+    the same however deep it is, and rows don't shift while new tasks arrive.
+    """
+    conditions, params = [], []
+    if project_id is not None:
+        conditions.append("project_id = %s")
+        params.append(project_id)
+    if status is not None:
+        conditions.append("status = %s")
+        params.append(status)
+    if before is not None:
+        conditions.append("id < %s")
+        params.append(before)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    rows = db.query_all(
+        f"SELECT id, project_id, task_type, description, status FROM tasks {where}ORDER BY id DESC LIMIT %s",
+        tuple(params) + (limit + 1,)
+    )
+    tasks = [dict(row) for row in rows[:limit]]
+    next_before = tasks[-1]['id'] if len(rows) > limit else None
+    return {"tasks": tasks, "next_before": next_before}
+
+
+def page_affected_by(filters: dict, event: dict) -> bool:
+    """Whether a task event can change the page fetched with these filters."""
+    if filters["project_id"] is not None and event.get("project_id") != filters["project_id"]:
+        return False
+    if filters["status"] is not None and filters["status"] not in (event.get("status"), event.get("previous_status")):
+        return False
+    # New tasks have the highest ids, so they only ever appear on a first page
+    if event["op"] == "insert":
+        return filters["before"] is None
+    return filters["before"] is None or event.get("id") is None or event["id"] < filters["before"]
+
+
+class PageCache:
+    """
+    Pages by query. A task insert or status change drops only the pages it can
+    affect; any other event (e.g. a listener reconnect) drops them all. Entries are
+    only served while the event listener is connected, since missed events would
+    leave them stale.
+    """
+    def __init__(self, max_entries: int = PAGE_CACHE_SIZE, event_log: int = PAGE_CACHE_EVENT_LOG):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._generation = 0
+        self._cleared_at = 0
+        self._recent = deque(maxlen=event_log)  # (generation, event)
+        self._lock = threading.Lock()
+
+    def invalidate(self, event=None):
+        with self._lock:
+            self._generation += 1
+            if event is None or event.get("op") not in ("insert", "update"):
+                self._pages.clear()
+                self._recent.clear()
+                self._cleared_at = self._generation
+                return
+            self._recent.append((self._generation, event))
+            for key in [key for key in self._pages if page_affected_by(dict(key), event)]:
+                del self._pages[key]
+
+    def _stale(self, key, generation: int) -> bool:
+        """Whether an event since `generation` may have changed the page for `key` (lock held)."""
+        if generation < self._cleared_at:
+            return True
+        if generation == self._generation:
+            return False
+        if not self._recent or self._recent[0][0] > generation + 1:
+            return True  # some of the events since then are no longer in the log
+        filters = dict(key)
+        return any(page_affected_by(filters, event) for seen, event in self._recent if seen > generation)
+
+    def get(self, key, load):
+        """Returns (page, etag), calling `load()` on a miss."""
+        listener = get_task_event_listener()
+        with self._lock:
+            if key in self._pages and listener.connected.is_set():
+                self._pages.move_to_end(key)
+                return self._pages[key]
+            generation = self._generation
+
+        page = load()
+        body = json.dumps(page, sort_keys=True, default=str)
+        entry = (page, hashlib.sha1(body.encode("utf-8")).hexdigest())
+        with self._lock:
+            # Don't keep a page that an event arriving mid-query already made stale
+            if not self._stale(key, generation):
+                self._pages[key] = entry
+                while len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+        return entry
+
+
+page_cache = PageCache()
+_subscribed = False
+_subscribed_lock = threading.Lock()
+
+def _ensure_subscribed():
+    global _subscribed
+    with _subscribed_lock:
+        if not _subscribed:
+            get_task_event_listener().subscribe(page_cache.invalidate)
+            _subscribed = True
+
+
+def _filters_from_request() -> dict:
+    def optional_int(name):
+        value = request.args.get(name, "").strip()
+        return int(value) if value.isdigit() else None
+    status = request.args.get("status") or None
+    return {
+        "project_id": optional_int("project_id"),
+        "status": status if status in STATUSES else None,
+        "before": optional_int("before"),
+        "limit": min(optional_int("limit") or PAGE_SIZE, MAX_PAGE_SIZE),
+    }
+
+def _page_for_request():
+    _ensure_subscribed()
+    filters = _filters_from_request()
+    key = tuple(sorted(filters.items()))
+    page, etag = page_cache.get(key, lambda: fetch_tasks(**filters))
+    return filters, page, etag
+
+
 @app.route('/')
 def index():
-    db = DBManager()
-    # Fetch the 15 most recent tasks, ordered by most recent first
-    tasks = db.query_all("SELECT id, task_type, description, status FROM tasks ORDER BY id DESC LIMIT 15")
-    return render_template_string(HTML_TEMPLATE, tasks=tasks)
+    filters, page, etag = _page_for_request()
+    older = {k: v for k, v in filters.items() if v is not None and k not in ("before", "limit")}
+    older["before"] = page["next_before"]
+    older_query = "&".join(f"{k}={v}" for k, v in older.items())
+    response = Response(render_template_string(
+        HTML_TEMPLATE, page=page, filters=filters, statuses=STATUSES, older_query=older_query
+    ))
+    response.set_etag(etag, weak=True)
+    return response.make_conditional(request)
+
+@app.route('/api/tasks')
+def api_tasks():
+    """JSON page of tasks; honours If-None-Match, so an unchanged page costs a 304 and no query."""
+    _, page, etag = _page_for_request()
+    response = jsonify(page)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint for this process; main.py and worker.py export theirs on METRICS_PORT."""
+    body, content_type = render_latest()
+    return Response(body, mimetype=content_type)
+
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of task creations and status changes, optionally for one project."""
+    project_id = request.args.get("project_id", type=int)
+    updates = queue.Queue(maxsize=1000)
+
+    def on_event(event):
+        if project_id is None or event.get("project_id") == project_id:
+            try:
+                updates.put_nowait(event)
+            except queue.Full:
+                pass  # a stalled client only misses updates; it never blocks the listener
+
+    unsubscribe = get_task_event_listener().subscribe(on_event)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = updates.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            unsubscribe()
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == '__main__':
-    # Run the app, making it accessible from your VM's public IP
-    app.run(host='0.0.0.0', port=8080)
+    # Run the app, making it accessible from your VM's public IP. Each open event
+    # stream holds a request thread, so serve with threads.
+    app.run(host='0.0.0.0', port=8080, threaded=True)
@@ -1,34 +1,196 @@
 # db_manager.py
 import os
+import time
+import uuid
+import threading
+from contextlib import contextmanager
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+from concurrency import run_blocking
+from metrics import DB_QUERY_SECONDS
 
-class DBManager:
-    def __init__(self):
-        self.conn = None # <-- Don't connect on initialization
+# Pool bounds, shared by every DBManager in the process
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+# How long a thread waits for a free connection once all DB_POOL_MAX are checked out
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+# Rows per round trip when streaming a result with iter_query
+DB_FETCH_SIZE = int(os.getenv("DB_FETCH_SIZE", "2000"))
+
+# Row shapes iter_query can produce: DictRow (row['id']), namedtuple (row.id) or a plain tuple
+ROW_CURSORS = {
+    "dict": psycopg2.extras.DictCursor,
+    "namedtuple": psycopg2.extras.NamedTupleCursor,
+    "tuple": psycopg2.extensions.cursor,
+}
+
+# This is a "singleton" pattern to hold our connection pool
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool.getconn() raises PoolError instead of waiting when it is empty,
+# so threads queue here for one of its DB_POOL_MAX connections first
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
 
-    def _ensure_connection(self):
-        """Checks if a connection exists and creates one if not."""
-        if self.conn is None or self.conn.closed:
+def get_connection_pool():
+    """Creates and reuses a single thread-safe connection pool for the process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
             db_url = os.getenv("DATABASE_URL")
             if not db_url:
                 raise ValueError("DATABASE_URL environment variable is not set.")
-            self.conn = psycopg2.connect(db_url)
+            _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, db_url)
+    return _pool
+
+def close_connection_pool():
+    """Closes every pooled connection, e.g. on worker shutdown."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
+
+class DBManager:
+    """
+    Thin query helper over the process-wide connection pool. Each call borrows a
+    connection just-in-time and commits on its own, unless it runs inside a
+    `transaction()` block on the same thread, in which case it joins that transaction.
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    @contextmanager
+    def _connection(self):
+        """Yields the current thread's transaction connection, or a pooled one that commits on exit."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        if not _pool_slots.acquire(timeout=DB_POOL_TIMEOUT_SECONDS):
+            raise psycopg2.pool.PoolError(
+                f"No database connection became free within {DB_POOL_TIMEOUT_SECONDS}s (DB_POOL_MAX={DB_POOL_MAX})."
+            )
+        try:
+            pool = get_connection_pool()
+            conn = pool.getconn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            _pool_slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups several statements into one commit:
+
+            with db.transaction():
+                db.execute(...)
+                db.execute(...)
+
+        Rolls back if the block raises. Nested blocks join the outer transaction.
+        """
+        if getattr(self._local, "conn", None) is not None:
+            yield self
+            return
+
+        with self._connection() as conn:
+            self._local.conn = conn
+            try:
+                yield self
+            finally:
+                self._local.conn = None
 
     def execute(self, sql, params=None):
-        self._ensure_connection() # <-- Connect just-in-time
-        with self.conn.cursor() as cur:
-            cur.execute(sql, params)
-            self.conn.commit()
+        with DB_QUERY_SECONDS.labels("execute").time(), self._connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
 
     def query_one(self, sql, params=None):
-        self._ensure_connection() # <-- Connect just-in-time
-        with self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute(sql, params)
-            return cur.fetchone()
+        with DB_QUERY_SECONDS.labels("query_one").time(), self._connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                cur.execute(sql, params)
+                return cur.fetchone()
 
     def query_all(self, sql, params=None):
-        self._ensure_connection() # <-- Connect just-in-time
-        with self.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-            cur.execute(sql, params)
-            return cur.fetchall()
+        with DB_QUERY_SECONDS.labels("query_all").time(), self._connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                cur.execute(sql, params)
+                return cur.fetchall()
+
+    def iter_query(self, sql, params=None, fetch_size: int = DB_FETCH_SIZE, row_type: str = "dict"):
+        """
+        Streams a result through a server-side (named) cursor, `fetch_size` rows per round
+        trip, so large results never sit in memory all at once:
+
+            for task_id, status in db.iter_query("SELECT id, status FROM tasks", row_type="tuple"):
+                ...
+
+        The connection is held until the iteration finishes or the generator is closed.
+        """
+        cursor_factory = ROW_CURSORS[row_type]
+        with self._connection() as conn:
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}", cursor_factory=cursor_factory) as cur:
+                cur.itersize = fetch_size
+                # Time spent in the database: the DECLARE plus each batch fetched as the
+                # caller iterates, but not the caller's own work between rows
+                elapsed = 0.0
+                try:
+                    started = time.perf_counter()
+                    try:
+                        cur.execute(sql, params)
+                        rows = iter(cur)
+                    finally:
+                        elapsed += time.perf_counter() - started
+                    while True:
+                        started = time.perf_counter()
+                        try:
+                            row = next(rows)
+                        except StopIteration:
+                            break
+                        finally:
+                            elapsed += time.perf_counter() - started
+                        yield row
+                finally:
+                    DB_QUERY_SECONDS.labels("iter_query").observe(elapsed)
+
+    def execute_values(self, sql, rows, template=None, page_size=1000, fetch=False):
+        """
+        Runs a statement with a single `VALUES %s` placeholder for many rows at once,
+        one round trip per `page_size` rows. With fetch=True, returns the RETURNING rows
+        in the order of `rows`.
+        """
+        with DB_QUERY_SECONDS.labels("execute_values").time(), self._connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                return psycopg2.extras.execute_values(cur, sql, rows, template=template, page_size=page_size, fetch=fetch)
+
+
+class AsyncDBManager:
+    """
+    Awaitable facade over DBManager for the asyncio pipeline. psycopg2 is blocking, so
+    each query runs on a worker thread and the 'db' limit keeps the number in flight
+    within what the connection pool can serve.
+    """
+    def __init__(self, db: DBManager = None):
+        self.db = db or DBManager()
+
+    async def execute(self, sql, params=None):
+        return await run_blocking("db", self.db.execute, sql, params)
+
+    async def query_one(self, sql, params=None):
+        return await run_blocking("db", self.db.query_one, sql, params)
+
+    async def query_all(self, sql, params=None):
+        return await run_blocking("db", self.db.query_all, sql, params)
+
+    async def execute_values(self, sql, rows, template=None, page_size=1000, fetch=False):
+        return await run_blocking("db", self.db.execute_values, sql, rows, template, page_size, fetch)
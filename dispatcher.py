@@ -0,0 +1,124 @@
+# dispatcher.py
+import time
+import asyncio
+from logger import get_logger
+from metrics import TASK_SECONDS, TASKS_TOTAL, record_failure, task_type_context
+from llm import task_priority
+from agent_registry import get_agent_registry
+from task_writer import flush_task_writes, task_status, task_status_async, update_task, update_task_async
+
+logger = get_logger(__name__)
+
+# The most recent completed code task of a project is what a documentation task documents
+SOURCE_CODE_TASK_SQL = (
+    "SELECT id FROM tasks WHERE project_id = %s AND status = 'completed' "
+    "AND task_type IN ('code_writing', 'api_integration') ORDER BY id DESC LIMIT 1"
+)
+
+def build_agents():
+    """
+    Our specialist agents keyed by the task_type they handle, built-in and generated.
+    Each is imported and instantiated on its first dispatch (see agent_registry.py).
+    """
+    return get_agent_registry()
+
+def _resolve_agent(agents, task_type: str):
+    return agents[task_type] if task_type in agents else agents["code_writing"]
+
+async def _execute_async(agents, task_type: str, *args):
+    # Resolving may import a module or re-read the agents table, so keep it off the loop
+    agent = await asyncio.to_thread(_resolve_agent, agents, task_type)
+    # Generated agents only implement the blocking execute_task
+    if hasattr(agent, "execute_task_async"):
+        return await agent.execute_task_async(*args)
+    return await asyncio.to_thread(agent.execute_task, *args)
+
+def _record_outcome(task_type: str, status: str, started: float, error: bool = False):
+    task_type = task_type or "none"
+    TASK_SECONDS.labels(task_type).observe(time.monotonic() - started)
+    TASKS_TOTAL.labels(task_type, status or "unknown").inc()
+    if error:
+        with task_type_context(task_type):
+            record_failure("dispatch")
+    elif status != 'completed':
+        with task_type_context(task_type):
+            record_failure("agent")
+
+def dispatch_task(db, agents, task_id: int) -> bool:
+    """
+    Routes a task to its agent and runs it. Returns True when the task ended up
+    'completed'; dispatch errors are recorded on the task as 'failed'.
+    """
+    task_type = None
+    started = time.monotonic()
+
+    try:
+        task = db.query_one("SELECT id, project_id, task_type FROM tasks WHERE id = %s", (task_id,))
+        if not task:
+            logger.error("Task not found; nothing to dispatch.", extra={"task_id": task_id})
+            return False
+        task_type = task['task_type']
+        logger.info("Dispatching task", extra={"task_id": task_id, "task_type": task_type})
+
+        # Older tasks get LLM quota first
+        with task_priority(task_id), task_type_context(task_type):
+            if task_type == 'documentation':
+                # Handle the documentation agent's special requirement. It reads another
+                # task's row, so buffered outcomes must reach the database first.
+                flush_task_writes()
+                source_task = db.query_one(SOURCE_CODE_TASK_SQL, (task['project_id'],))
+                if source_task:
+                    agents[task_type].execute_task(task_id, source_task['id'])
+                else:
+                    raise ValueError("No prior code task found to document.")
+            elif task_type in agents:
+                agents[task_type].execute_task(task_id)
+            else:
+                # Default to the general code writer if type is unknown
+                agents["code_writing"].execute_task(task_id)
+    except Exception as e:
+        logger.error("An error occurred during task dispatch.", extra={"task_id": task_id, "error": str(e)})
+        update_task(db, task_id, output=f"Dispatch error: {e}", status='failed')
+        _record_outcome(task_type, 'failed', started, error=True)
+        return False
+
+    # Agents record their own outcome, so read it back to decide whether children may run
+    status = task_status(db, task_id)
+    logger.info("Task finished.", extra={"task_id": task_id, "status": status})
+    _record_outcome(task_type, status, started)
+    return status == 'completed'
+
+async def dispatch_task_async(async_db, agents, task_id: int) -> bool:
+    """The same routing for EXECUTION_MODE=async, awaiting the agents' execute_task_async."""
+    task_type = None
+    started = time.monotonic()
+
+    try:
+        task = await async_db.query_one("SELECT id, project_id, task_type FROM tasks WHERE id = %s", (task_id,))
+        if not task:
+            logger.error("Task not found; nothing to dispatch.", extra={"task_id": task_id})
+            return False
+        task_type = task['task_type']
+        logger.info("Dispatching task", extra={"task_id": task_id, "task_type": task_type})
+
+        with task_priority(task_id), task_type_context(task_type):
+            if task_type == 'documentation':
+                await asyncio.to_thread(flush_task_writes)
+                source_task = await async_db.query_one(SOURCE_CODE_TASK_SQL, (task['project_id'],))
+                if source_task:
+                    await _execute_async(agents, task_type, task_id, source_task['id'])
+                else:
+                    raise ValueError("No prior code task found to document.")
+            else:
+                # Unknown types default to the general code writer
+                await _execute_async(agents, task_type, task_id)
+    except Exception as e:
+        logger.error("An error occurred during task dispatch.", extra={"task_id": task_id, "error": str(e)})
+        await update_task_async(async_db, task_id, output=f"Dispatch error: {e}", status='failed')
+        _record_outcome(task_type, 'failed', started, error=True)
+        return False
+
+    status = await task_status_async(async_db, task_id)
+    logger.info("Task finished.", extra={"task_id": task_id, "status": status})
+    _record_outcome(task_type, status, started)
+    return status == 'completed'
@@ -0,0 +1,121 @@
+# events.py
+import os
+import json
+import select
+import threading
+import psycopg2
+import psycopg2.extensions
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Channel the tasks table triggers publish to (migrations/0005_task_events.sql)
+TASK_EVENTS_CHANNEL = "task_events"
+# How long the listener blocks in select() before checking whether it should stop
+LISTEN_TIMEOUT_SECONDS = 1.0
+RECONNECT_MAX_SECONDS = 30
+
+
+class TaskEventListener:
+    """
+    Delivers task events (creation and status transitions) to subscribers in this
+    process. One dedicated connection LISTENs on the channel from a background thread;
+    it's kept outside the pool because a listening connection must stay open and idle.
+
+    Callbacks receive the decoded payload, e.g.
+    {"op": "update", "id": 7, "project_id": 1, "status": "completed", ...},
+    and run on the listener thread, so they should only hand work off (set an event,
+    put on a queue). If the connection drops, the listener reconnects with backoff and
+    subscribers get a {"op": "reconnect"} event, since notifications sent meanwhile
+    are lost and they may want to re-read the table.
+    """
+    def __init__(self, dsn: str = None, channel: str = TASK_EVENTS_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.connected = threading.Event()
+
+    def subscribe(self, callback):
+        """Registers `callback(event)` and starts listening if needed. Returns an unsubscribe function."""
+        with self._lock:
+            self._subscribers.append(callback)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="task-events", daemon=True)
+                self._thread.start()
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def _publish(self, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error("Task event subscriber failed.", extra={"error": str(e)})
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn or os.getenv("DATABASE_URL"))
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {self.channel}")
+        return conn
+
+    def _drain(self, conn):
+        conn.poll()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                event = json.loads(notify.payload)
+            except ValueError:
+                event = {"op": "unknown", "payload": notify.payload}
+            self._publish(event)
+
+    def _run(self):
+        backoff = 1
+        reconnecting = False
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                self.connected.set()
+                backoff = 1
+                if reconnecting:
+                    self._publish({"op": "reconnect"})
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], LISTEN_TIMEOUT_SECONDS)[0]:
+                        self._drain(conn)
+            except Exception as e:
+                self.connected.clear()
+                reconnecting = True
+                logger.error("Task event listener disconnected.", extra={"error": str(e), "retry_in": backoff})
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()
+        self.connected.clear()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+def get_task_event_listener() -> TaskEventListener:
+    """Creates and reuses the single process-wide task event listener."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = TaskEventListener()
+    return _listener
@@ -1,57 +1,532 @@
 # executor.py
-import docker
 import os
+import io
+import time
+import atexit
+import tarfile
 import tempfile
 import shutil
+import threading
+from logger import get_logger
+from concurrency import run_blocking
+from cache import digest_key, get_sandbox_result_cache
+from metrics import record_failure, sandbox_phase
 
-def run_in_sandbox(command: str, files: dict = None, network_enabled: bool = False) -> dict:
+logger = get_logger(__name__)
+
+SANDBOX_IMAGE = "metamorph-tester"
+SANDBOX_MEM_LIMIT = "256m"
+SANDBOX_WORKDIR = "/app"
+
+# Idle containers kept warm per (network, memory) key; 0 disables pooling entirely
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", "2"))
+# A pooled container is thrown away after this many runs so leaked state can't pile up
+SANDBOX_MAX_USES = int(os.getenv("SANDBOX_MAX_USES", "50"))
+
+# Marks when a pooled container started; anything installed after it is leftover state
+POOL_MARKER = "/run/metamorph-pool"
+# Run between uses of a pooled container. It fails, so the container is recycled instead,
+# if the last run left processes behind (a daemon, or a zombie: PID 1 is a bare `sleep`
+# that never reaps) or installed packages; otherwise it clears the workspace and /tmp.
+# The process check is all shell builtins, so this script's own children never count.
+POOL_RESET_SCRIPT = f"""
+for proc in /proc/[0-9]*; do
+    pid=${{proc#/proc/}}
+    [ "$pid" = 1 ] || [ "$pid" = $$ ] || exit 1
+done
+if [ -e {POOL_MARKER} ]; then
+    changed=$(find /usr/local/lib /usr/lib/python3* "$HOME/.local" -maxdepth 3 -name site-packages -newer {POOL_MARKER} 2>/dev/null)
+    [ -z "$changed" ] || exit 1
+fi
+find {SANDBOX_WORKDIR} /tmp /var/tmp -mindepth 1 -delete
+"""
+
+# How long a cached result of a deterministic, offline run stays valid
+SANDBOX_RESULT_TTL = int(os.getenv("SANDBOX_RESULT_TTL", "86400"))
+# Re-resolve the image id this often so a rebuilt image invalidates cached results
+IMAGE_ID_REFRESH_SECONDS = 60
+
+# How files reach a cold container: "archive" streams an in-memory tar with put_archive,
+# "bind" writes a temp dir on the host and bind-mounts it (needs a shared filesystem)
+SANDBOX_FILE_MODE = os.getenv("SANDBOX_FILE_MODE", "archive")
+
+# Bytes of stdout and of stderr kept per run; past this only the head and tail survive
+SANDBOX_OUTPUT_LIMIT = int(os.getenv("SANDBOX_OUTPUT_LIMIT", "65536"))
+
+def _docker():
+    # The Docker SDK is imported on first use so importing this module stays cheap
+    import docker
+    return docker
+
+# Reuse one Docker client per process instead of building one per run
+_docker_client = None
+_docker_client_lock = threading.Lock()
+
+def get_docker_client():
+    """Creates and reuses a single Docker client."""
+    global _docker_client
+    with _docker_client_lock:
+        if _docker_client is None:
+            _docker_client = _docker().from_env()
+    return _docker_client
+
+def _build_archive(files: dict) -> bytes:
+    """Packs a {filename: content} dict into an in-memory tar archive."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        # Explicit entries for parent directories, so nested paths like "pkg/mod.py" extract cleanly
+        directories = set()
+        for name in files:
+            parent = os.path.dirname(name)
+            while parent:
+                directories.add(parent)
+                parent = os.path.dirname(parent)
+        for directory in sorted(directories):
+            info = tarfile.TarInfo(name=directory)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            info.mtime = int(time.time())
+            tar.addfile(info)
+        for filename, content in files.items():
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(name=filename)
+            info.size = len(data)
+            info.mode = 0o644
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def _fetch_artifacts(container, paths: list) -> dict:
+    """Pulls files (or whole directories) out of /app with get_archive, as {relative path: text}."""
+    artifacts = {}
+    for path in paths:
+        try:
+            chunks, _ = container.get_archive(f"{SANDBOX_WORKDIR}/{path}")
+        except _docker().errors.NotFound:
+            continue
+        # Members are named relative to the requested path's parent ("a.json" for "out/a.json")
+        parent = os.path.dirname(path.rstrip("/"))
+        with tarfile.open(fileobj=io.BytesIO(b"".join(chunks))) as tar:
+            for member in tar.getmembers():
+                if member.isfile():
+                    name = os.path.join(parent, member.name) if parent else member.name
+                    artifacts[name] = tar.extractfile(member).read().decode('utf-8', errors='ignore')
+    return artifacts
+
+
+class _BoundedStream:
+    """Keeps the first and last `limit / 2` bytes of a stream and splits it into lines for a callback."""
+    def __init__(self, name: str, limit: int, on_output=None):
+        self.name = name
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+        self.on_output = on_output
+        self._partial = bytearray()
+
+    def feed(self, chunk: bytes):
+        self.total += len(chunk)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+        rest = chunk[max(room, 0):]
+        if rest:
+            self.tail += rest
+            if len(self.tail) > self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+
+        if self.on_output:
+            self._partial += chunk
+            *lines, remainder = self._partial.split(b"\n")
+            # A single endless line still gets forwarded once it outgrows the cap
+            if len(remainder) > self.head_limit + self.tail_limit:
+                lines.append(remainder)
+                remainder = b""
+            self._partial = bytearray(remainder)
+            for line in lines:
+                self._emit(line)
+
+    def _emit(self, line):
+        try:
+            self.on_output(self.name, bytes(line).decode('utf-8', errors='ignore'))
+        except Exception as e:
+            logger.warning("Sandbox output callback failed.", extra={"error": str(e)})
+
+    def close(self):
+        if self.on_output and self._partial:
+            self._emit(self._partial)
+            self._partial = bytearray()
+
+    def text(self) -> str:
+        dropped = self.total - len(self.head) - len(self.tail)
+        if dropped > 0:
+            data = bytes(self.head) + f"\n... [{dropped} bytes truncated] ...\n".encode() + bytes(self.tail)
+        else:
+            data = bytes(self.head) + bytes(self.tail)
+        return data.decode('utf-8', errors='ignore').strip()
+
+
+class OutputCapture:
     """
-    Runs a command inside our custom, pre-configured Docker container.
+    Collects demultiplexed (stdout, stderr) chunks while a command runs, with bounded
+    memory, live per-line forwarding and the time to the first output byte.
     """
-    client = docker.from_env()
-    container = None
+    def __init__(self, limit: int = SANDBOX_OUTPUT_LIMIT, on_output=None):
+        self.stdout = _BoundedStream("stdout", limit, on_output)
+        self.stderr = _BoundedStream("stderr", limit, on_output)
+        self.started_at = time.monotonic()
+        self.first_byte_at = None
+
+    def feed(self, stdout_chunk, stderr_chunk):
+        if (stdout_chunk or stderr_chunk) and self.first_byte_at is None:
+            self.first_byte_at = time.monotonic()
+        if stdout_chunk:
+            self.stdout.feed(stdout_chunk)
+        if stderr_chunk:
+            self.stderr.feed(stderr_chunk)
+
+    def result(self, exit_code: int) -> dict:
+        self.stdout.close()
+        self.stderr.close()
+        first_byte = None if self.first_byte_at is None else round(self.first_byte_at - self.started_at, 4)
+        return {
+            "stdout": self.stdout.text(),
+            "stderr": self.stderr.text(),
+            "exit_code": exit_code,
+            "time_to_first_byte": first_byte,
+        }
+
+
+class ContainerPool:
+    """
+    Keeps pre-created, idle sandbox containers warm so a run only pays for an exec
+    instead of a full create/start/wait/remove cycle. Containers are keyed by image,
+    network mode and memory limit, health-checked on checkout and recycled after
+    `max_uses` runs.
+    """
+    def __init__(self, client=None, pool_size: int = SANDBOX_POOL_SIZE, max_uses: int = SANDBOX_MAX_USES):
+        self._client = client
+        self.pool_size = pool_size
+        self.max_uses = max_uses
+        self._idle = {}
+        self._uses = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_docker_client()
+        return self._client
+
+    def _create(self, network_enabled: bool, mem_limit: str, image: str = SANDBOX_IMAGE):
+        # The container just idles; every run is an exec into it
+        container = self.client.containers.create(
+            image=image,
+            command=["/bin/sh", "-c", f"touch {POOL_MARKER}; exec sleep infinity"],
+            working_dir=SANDBOX_WORKDIR,
+            mem_limit=mem_limit,
+            network_disabled=(not network_enabled),
+            labels={"metamorph.pool": "1"},
+        )
+        container.start()
+        self._uses[container.id] = 0
+        return container
+
+    def _is_healthy(self, container) -> bool:
+        try:
+            container.reload()
+            return container.status == "running"
+        except _docker().errors.APIError:
+            return False
+
+    def _discard(self, container):
+        self._uses.pop(container.id, None)
+        try:
+            container.remove(force=True)
+        except _docker().errors.APIError:
+            pass
+
+    def warm(self, network_enabled: bool = False, mem_limit: str = SANDBOX_MEM_LIMIT, image: str = SANDBOX_IMAGE,
+             count: int = None):
+        """Pre-creates idle containers for a key until it has `count` (default: the pool size)."""
+        key = (image, network_enabled, mem_limit)
+        target = self.pool_size if count is None else min(count, self.pool_size)
+        with self._lock:
+            missing = target - len(self._idle.setdefault(key, []))
+        # Create outside the lock so checkouts aren't stalled behind container startup
+        created = [self._create(network_enabled, mem_limit, image) for _ in range(max(missing, 0))]
+        surplus = []
+        with self._lock:
+            idle = self._idle[key]
+            for container in created:
+                if len(idle) < self.pool_size:
+                    idle.append(container)
+                else:
+                    surplus.append(container)
+        for container in surplus:
+            self._discard(container)
+
+    def acquire(self, network_enabled: bool = False, mem_limit: str = SANDBOX_MEM_LIMIT, image: str = SANDBOX_IMAGE):
+        """Checks out a healthy idle container, creating one if none is available."""
+        key = (image, network_enabled, mem_limit)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            while idle:
+                container = idle.pop()
+                if self._is_healthy(container):
+                    return container
+                logger.warning("Discarding unhealthy sandbox container.", extra={"container_id": container.id})
+                self._discard(container)
+        return self._create(network_enabled, mem_limit, image)
+
+    def release(self, container, network_enabled: bool = False, mem_limit: str = SANDBOX_MEM_LIMIT, healthy: bool = True,
+                image: str = SANDBOX_IMAGE):
+        """
+        Resets the workspace and /tmp and returns the container to the pool, or recycles it
+        when the run left processes or installed packages behind (see POOL_RESET_SCRIPT).
+        """
+        key = (image, network_enabled, mem_limit)
+        self._uses[container.id] = self._uses.get(container.id, 0) + 1
+
+        if healthy and self._uses[container.id] < self.max_uses:
+            reset = container.exec_run(["/bin/sh", "-c", POOL_RESET_SCRIPT])
+            healthy = reset.exit_code == 0
+            if not healthy:
+                logger.info("Recycling sandbox container with leftover state.", extra={"container_id": container.id})
+        else:
+            healthy = False
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if healthy and len(idle) < self.pool_size:
+                idle.append(container)
+                return
+        self._discard(container)
+
+    def shutdown(self):
+        """Removes every idle container."""
+        with self._lock:
+            containers = [c for idle in self._idle.values() for c in idle]
+            self._idle = {}
+        for container in containers:
+            self._discard(container)
+
+
+_container_pool = None
+_container_pool_lock = threading.Lock()
+
+def get_container_pool() -> ContainerPool:
+    """Creates and reuses a single process-wide container pool."""
+    global _container_pool
+    with _container_pool_lock:
+        if _container_pool is None:
+            _container_pool = ContainerPool()
+            atexit.register(_container_pool.shutdown)
+    return _container_pool
+
+
+def prewarm_sandbox(network_enabled: bool = False, image=SANDBOX_IMAGE):
+    """
+    Makes sure a warm container for this key exists, in the background, so a caller can
+    overlap container startup with other work (e.g. while LLM tokens are streaming in).
+    `image` may be a callable, resolved on the background thread too.
+    """
+    if SANDBOX_POOL_SIZE <= 0:
+        return
+
+    def warm():
+        try:
+            resolved = image() if callable(image) else image
+            get_container_pool().warm(network_enabled, SANDBOX_MEM_LIMIT, resolved, count=1)
+        except Exception as e:
+            logger.warning("Sandbox prewarm failed.", extra={"error": str(e)})
 
+    threading.Thread(target=warm, daemon=True).start()
+
+
+def _run_pooled(command: str, files: dict, network_enabled: bool, on_output=None, artifacts: list = None,
+                image: str = SANDBOX_IMAGE) -> dict:
+    pool = get_container_pool()
+    container = None
+    healthy = True
     try:
-        temp_dir = tempfile.mkdtemp()
+        with sandbox_phase("pooled", "acquire"):
+            container = pool.acquire(network_enabled, SANDBOX_MEM_LIMIT, image)
         if files:
-            for filename, content in files.items():
-                with open(os.path.join(temp_dir, filename), "w") as f:
-                    f.write(content)
+            with sandbox_phase("pooled", "copy"):
+                container.put_archive(SANDBOX_WORKDIR, _build_archive(files))
 
-        volume_mount = {os.path.abspath(temp_dir): {'bind': '/app', 'mode': 'rw'}}
-        shell_command = ['/bin/sh', '-c', command]
+        # The low-level exec API is needed to both stream the output and read the exit code
+        api = container.client.api
+        with sandbox_phase("pooled", "exec"):
+            exec_id = api.exec_create(container.id, ["/bin/sh", "-c", command], workdir=SANDBOX_WORKDIR)['Id']
+            capture = OutputCapture(on_output=on_output)
+            for stdout_chunk, stderr_chunk in api.exec_start(exec_id, stream=True, demux=True):
+                capture.feed(stdout_chunk, stderr_chunk)
+            result = capture.result(api.exec_inspect(exec_id)['ExitCode'])
 
-        # Create the container, now with the network_disabled flag
-        container = client.containers.create(
-            image="metamorph-tester",
-            command=shell_command,
-            working_dir="/app",
-            volumes=volume_mount,
-            mem_limit="256m",
-            network_disabled=(not network_enabled) # <-- ADD THIS LINE
-        )
+        if artifacts:
+            with sandbox_phase("pooled", "artifacts"):
+                result["artifacts"] = _fetch_artifacts(container, artifacts)
+        return result
 
-        # Start, wait, and get logs
-        container.start()
-        result = container.wait()
-        exit_code = result['StatusCode']
+    except Exception as e:
+        healthy = False
+        record_failure("sandbox")
+        return {"stdout": "", "stderr": f"An unexpected executor error: {str(e)}", "exit_code": -1}
+    finally:
+        if container:
+            try:
+                with sandbox_phase("pooled", "release"):
+                    pool.release(container, network_enabled, SANDBOX_MEM_LIMIT, healthy=healthy, image=image)
+            except Exception as e:
+                logger.warning("Failed to return sandbox container to the pool.", extra={"error": str(e)})
+
+
+def _run_cold(command: str, files: dict, network_enabled: bool, on_output=None, artifacts: list = None,
+              image: str = SANDBOX_IMAGE) -> dict:
+    container = None
 
-        stdout_bytes = container.logs(stdout=True, stderr=False)
-        stderr_bytes = container.logs(stdout=False, stderr=True)
+    try:
+        client = get_docker_client()
+        volume_mount = None
+        if SANDBOX_FILE_MODE == "bind":
+            temp_dir = tempfile.mkdtemp()
+            if files:
+                for filename, content in files.items():
+                    path = os.path.join(temp_dir, filename)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path, "w") as f:
+                        f.write(content)
+            volume_mount = {os.path.abspath(temp_dir): {'bind': SANDBOX_WORKDIR, 'mode': 'rw'}}
+
+        shell_command = ['/bin/sh', '-c', command]
+
+        # Create the container, now with the network_disabled flag
+        with sandbox_phase("cold", "create"):
+            container = client.containers.create(
+                image=image,
+                command=shell_command,
+                working_dir=SANDBOX_WORKDIR,
+                volumes=volume_mount,
+                mem_limit=SANDBOX_MEM_LIMIT,
+                network_disabled=(not network_enabled)
+            )
+        if files and volume_mount is None:
+            # Copy the files straight into the created container; nothing touches the host disk
+            with sandbox_phase("cold", "copy"):
+                container.put_archive(SANDBOX_WORKDIR, _build_archive(files))
 
-        stdout = stdout_bytes.decode('utf-8', errors='ignore').strip()
-        stderr = stderr_bytes.decode('utf-8', errors='ignore').strip()
+        # Start, stream the demultiplexed output while it runs, then collect the exit code
+        with sandbox_phase("cold", "start"):
+            container.start()
+        capture = OutputCapture(on_output=on_output)
+        with sandbox_phase("cold", "logs"):
+            for stdout_chunk, stderr_chunk in container.attach(stdout=True, stderr=True, stream=True, logs=True, demux=True):
+                capture.feed(stdout_chunk, stderr_chunk)
+        with sandbox_phase("cold", "wait"):
+            exit_code = container.wait()['StatusCode']
 
-        return {"stdout": stdout, "stderr": stderr, "exit_code": exit_code}
+        result = capture.result(exit_code)
+        if artifacts:
+            with sandbox_phase("cold", "artifacts"):
+                result["artifacts"] = _fetch_artifacts(container, artifacts)
+        return result
 
     except Exception as e:
+        record_failure("sandbox")
         return {"stdout": "", "stderr": f"An unexpected executor error: {str(e)}", "exit_code": -1}
     finally:
         if container:
             try:
-                container.remove()
-            except docker.errors.NotFound:
-                pass 
+                with sandbox_phase("cold", "remove"):
+                    container.remove()
+            except _docker().errors.NotFound:
+                pass
 
         if 'temp_dir' in locals() and os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
+
+
+# image tag -> (image id, when it was resolved)
+_image_ids = {}
+
+def _sandbox_image_id(image: str = SANDBOX_IMAGE) -> str:
+    """The id behind an image tag, so results never outlive an image rebuild."""
+    image_id, resolved_at = _image_ids.get(image, (None, 0.0))
+    if image_id is None or time.monotonic() - resolved_at > IMAGE_ID_REFRESH_SECONDS:
+        image_id = get_docker_client().images.get(image).id
+        _image_ids[image] = (image_id, time.monotonic())
+    return image_id
+
+def _result_cache_key(command: str, files: dict, network_enabled: bool, artifacts: list = None,
+                      image: str = SANDBOX_IMAGE):
+    try:
+        image_id = _sandbox_image_id(image)
+    except Exception as e:
+        logger.warning("Could not resolve sandbox image; result caching skipped.", extra={"error": str(e)})
+        return None
+    return digest_key("sandbox", command, sorted((files or {}).items()), image_id, network_enabled, sorted(artifacts or []))
+
+
+def run_in_sandbox(command: str, files: dict = None, network_enabled: bool = False, use_cache: bool = True,
+                   on_output=None, artifacts: list = None, image: str = SANDBOX_IMAGE) -> dict:
+    """
+    Runs a command inside our custom, pre-configured Docker container.
+
+    When SANDBOX_POOL_SIZE > 0 the command is exec'd in a warm container from the
+    pool; otherwise a fresh container is created and removed for this run.
+
+    Successful network-disabled runs are content-addressed by command, files and image
+    id, and a repeat returns the cached {stdout, stderr, exit_code}; this is what lets
+    the code writer, tester and repo initializer skip re-running unchanged code. Failures
+    are never cached, so a retried task always runs again. Pass use_cache=False for
+    commands whose output isn't determined by those inputs (clocks, randomness, ...).
+
+    Output is streamed while the command runs and capped at SANDBOX_OUTPUT_LIMIT bytes
+    per stream (head and tail kept). `on_output(stream, line)` receives each line live;
+    `time_to_first_byte` in the result is seconds from start to the first output.
+
+    Files are streamed into the container as an in-memory tar. Paths listed in
+    `artifacts` (relative to /app) are pulled back the same way after the run and
+    returned under result["artifacts"] as {path: text}.
+
+    `image` selects a variant of the sandbox image, e.g. one from
+    sandbox_images.image_for_files with the run's dependencies pre-installed.
+    """
+    cache_key = None
+    if use_cache and not network_enabled:
+        cache_key = _result_cache_key(command, files, network_enabled, artifacts, image)
+    if cache_key:
+        cache = get_sandbox_result_cache()
+        cached = cache.get_local(cache_key) or cache.get_remote(cache_key)
+        if cached is not None:
+            logger.info("Sandbox result cache hit.", extra={"cache_key": cache_key})
+            if on_output:
+                for stream in ("stdout", "stderr"):
+                    for line in cached[stream].splitlines():
+                        on_output(stream, line)
+            return dict(cached)
+        cache.record_miss()
+
+    if SANDBOX_POOL_SIZE > 0:
+        result = _run_pooled(command, files, network_enabled, on_output, artifacts, image)
+    else:
+        result = _run_cold(command, files, network_enabled, on_output, artifacts, image)
+
+    # Only successes are replayed: a failure may be an OOM kill, a signal or an executor
+    # error (-1), and a re-run after a failed task must actually run again
+    if cache_key and result['exit_code'] == 0:
+        get_sandbox_result_cache().put(cache_key, result, SANDBOX_RESULT_TTL)
+    return result
+
+
+async def run_in_sandbox_async(command: str, files: dict = None, network_enabled: bool = False, use_cache: bool = True,
+                               on_output=None, artifacts: list = None, image: str = SANDBOX_IMAGE) -> dict:
+    """
+    Awaitable run_in_sandbox. The Docker SDK is blocking, so the run happens on a worker
+    thread while holding the 'sandbox' concurrency limit.
+    """
+    return await run_blocking("sandbox", run_in_sandbox, command, files, network_enabled, use_cache, on_output, artifacts, image)
@@ -0,0 +1,651 @@
+# llm.py
+import os
+import json
+import heapq
+import itertools
+import threading
+import time
+import asyncio
+import contextvars
+import concurrent.futures
+from collections import deque
+from contextlib import contextmanager
+from concurrency import limiter
+from logger import get_logger
+from metrics import (LLM_BREAKER_REJECTIONS_TOTAL, LLM_HEDGED_TOTAL, LLM_QUEUE_SECONDS, LLM_REQUEST_SECONDS,
+                     record_failure)
+
+logger = get_logger(__name__)
+
+# Vertex quota we pace ourselves against
+LLM_RPM = int(os.getenv("LLM_RPM", "60"))
+LLM_TPM = int(os.getenv("LLM_TPM", "1000000"))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+# Stream code generations and start the sandbox as soon as the code block closes
+LLM_STREAMING = os.getenv("LLM_STREAMING") == "1"
+# Output tokens we budget for before the response tells us the real count
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "1024"))
+
+# Tail-latency controls for generate/generate_async (0 turns each off):
+# give up on a call LLM_DEADLINE_SECONDS after it was sent; waiting for the rate limiter
+# is bounded separately by the same amount
+LLM_DEADLINE_SECONDS = int(os.getenv("LLM_DEADLINE_SECONDS", "120"))
+# send a duplicate request once a call is slower than this percentile of recent calls...
+LLM_HEDGE_PERCENTILE = int(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+# ...as long as at most this share of recent calls were hedged
+LLM_HEDGE_BUDGET_PERCENT = int(os.getenv("LLM_HEDGE_BUDGET_PERCENT", "10"))
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+# fail fast for LLM_BREAKER_RESET_SECONDS after this many consecutive failures of a model
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = int(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Lower numbers go first. The dispatcher sets this to the task id, so older tasks win ties for quota.
+DEFAULT_PRIORITY = 1_000_000
+_task_priority = contextvars.ContextVar("llm_task_priority", default=DEFAULT_PRIORITY)
+
+@contextmanager
+def task_priority(priority: int):
+    """Runs the block's LLM calls at the given queue priority (lower is sooner)."""
+    token = _task_priority.set(priority)
+    try:
+        yield
+    finally:
+        _task_priority.reset(token)
+
+DEFAULT_MODEL = "gemini-1.5-pro"
+
+# Process-wide model registry: one client per (model name, config), built on first use.
+# vertexai and the Google client stack are only imported at that point.
+_models = {}
+_models_lock = threading.Lock()
+
+def init_vertex(project: str, location: str):
+    """Initializes Vertex AI, importing it only now."""
+    import vertexai
+    vertexai.init(project=project, location=location)
+
+def get_model(model_name: str = DEFAULT_MODEL, **config):
+    """Returns the shared GenerativeModel for a name and constructor config (e.g. generation_config)."""
+    key = (model_name, json.dumps(config, sort_keys=True))
+    with _models_lock:
+        if key not in _models:
+            from vertexai.generative_models import GenerativeModel
+            _models[key] = GenerativeModel(model_name, **config)
+        return _models[key]
+
+def estimate_tokens(prompt) -> int:
+    # Roughly four characters per token for English text and code
+    return len(str(prompt)) // 4 + LLM_EXPECTED_OUTPUT_TOKENS
+
+
+class LLMRateLimiter:
+    """
+    Process-wide governor for Vertex calls. A call may start only when it is at the head
+    of a priority queue (FIFO within a priority), a request token is available in the
+    requests-per-minute bucket, its estimated tokens fit in the tokens-per-minute bucket,
+    and fewer than `max_in_flight` calls are running. Estimates are reconciled against
+    the real usage reported by the response.
+    """
+    def __init__(self, rpm: int = LLM_RPM, tpm: int = LLM_TPM, max_in_flight: int = LLM_MAX_IN_FLIGHT, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_in_flight = max_in_flight
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._request_tokens = float(rpm)
+        self._llm_tokens = float(tpm)
+        self._refilled_at = clock()
+        self.in_flight = 0
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._request_tokens = min(self.rpm, self._request_tokens + elapsed * self.rpm / 60)
+        self._llm_tokens = min(self.tpm, self._llm_tokens + elapsed * self.tpm / 60)
+
+    def _try_take(self, ticket, cost: int):
+        """Takes capacity for `ticket` if it's its turn. Returns None on success, else seconds to wait."""
+        self._refill()
+        if self._queue[0] != ticket or self.in_flight >= self.max_in_flight:
+            return 0.05
+        wait = 0.0
+        if self._request_tokens < 1:
+            wait = (1 - self._request_tokens) * 60 / self.rpm
+        if self._llm_tokens < cost:
+            wait = max(wait, (cost - self._llm_tokens) * 60 / self.tpm)
+        if wait > 0:
+            return wait
+
+        heapq.heappop(self._queue)
+        self._request_tokens -= 1
+        self._llm_tokens -= cost
+        self.in_flight += 1
+        self._cond.notify_all()
+        return None
+
+    def _enqueue(self, priority):
+        ticket = (priority, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _dequeue(self, ticket):
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def acquire(self, estimated_tokens: int, priority: int = None, timeout: float = None) -> int:
+        """
+        Blocks until the call may start. Returns the charged token estimate for release().
+        Raises LLMQueueTimeout if that takes longer than `timeout` seconds.
+        """
+        cost = min(estimated_tokens, self.tpm)
+        give_up_at = None if timeout is None else self._clock() + timeout
+        with self._cond:
+            ticket = self._enqueue(_task_priority.get() if priority is None else priority)
+            while True:
+                wait = self._try_take(ticket, cost)
+                if wait is None:
+                    return cost
+                if give_up_at is not None:
+                    remaining = give_up_at - self._clock()
+                    if remaining <= 0:
+                        self._dequeue(ticket)
+                        raise LLMQueueTimeout(f"No LLM quota within {timeout}s")
+                    wait = min(wait, remaining)
+                self._cond.wait(timeout=wait)
+
+    def try_acquire(self, estimated_tokens: int):
+        """Takes a slot only if one is free right now and no call is queued for it, else returns None."""
+        cost = min(estimated_tokens, self.tpm)
+        with self._cond:
+            if self._queue:
+                return None
+            ticket = self._enqueue(DEFAULT_PRIORITY)
+            if self._try_take(ticket, cost) is None:
+                return cost
+            self._dequeue(ticket)
+            return None
+
+    async def acquire_async(self, estimated_tokens: int, priority: int = None) -> int:
+        """acquire() for coroutines: polls instead of parking a thread while queued."""
+        cost = min(estimated_tokens, self.tpm)
+        with self._cond:
+            ticket = self._enqueue(_task_priority.get() if priority is None else priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(ticket, cost)
+                if wait is None:
+                    return cost
+                await asyncio.sleep(min(wait, 0.25))
+        except asyncio.CancelledError:
+            with self._cond:
+                self._dequeue(ticket)
+            raise
+
+    def release(self, charged_tokens: int, actual_tokens: int = None):
+        """Frees the in-flight slot and corrects the token bucket with the real usage if known."""
+        with self._cond:
+            self.in_flight -= 1
+            if actual_tokens is not None:
+                self._llm_tokens -= actual_tokens - charged_tokens
+            self._cond.notify_all()
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> LLMRateLimiter:
+    """Creates and reuses the single process-wide LLM rate limiter."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = LLMRateLimiter()
+    return _rate_limiter
+
+class LLMUnavailableError(RuntimeError):
+    """Raised without calling the model while its circuit breaker is open."""
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when no answer arrived within the call's deadline."""
+
+class LLMQueueTimeout(LLMDeadlineExceeded):
+    """
+    Raised when the call never got rate limiter quota within its deadline. Nothing was
+    sent, so it says nothing about the model's health and doesn't count against its breaker.
+    """
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while a model keeps failing. After `failure_threshold` consecutive
+    failures (errors or missed deadlines) the circuit opens and calls raise
+    LLMUnavailableError for `reset_seconds`. Then one probe call is let through, and
+    its outcome closes the circuit or opens it again.
+    """
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_seconds: float = LLM_BREAKER_RESET_SECONDS,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"  # closed -> open -> half_open -> closed | open
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def before_call(self):
+        """Raises LLMUnavailableError if the call may not go out now."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == "open":
+                if self._clock() - self._opened_at < self.reset_seconds:
+                    raise LLMUnavailableError("LLM circuit breaker is open")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probing:
+                    raise LLMUnavailableError("LLM circuit breaker is waiting on a probe call")
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def abandon(self):
+        """For a call cancelled before it had an outcome: lets another probe through."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("LLM circuit breaker opened.", extra={"failures": self._failures})
+                self.state = "open"
+                self._opened_at = self._clock()
+
+
+class LatencyTracker:
+    """
+    Recent end-to-end latencies of a model's calls, and which of them were hedged.
+    Hedging after the p95 duplicates roughly one call in twenty; the budget caps it
+    when latencies shift faster than the window catches up.
+    """
+    def __init__(self, percentile: int = LLM_HEDGE_PERCENTILE, budget_percent: int = LLM_HEDGE_BUDGET_PERCENT,
+                 window: int = LLM_LATENCY_WINDOW, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.percentile = percentile
+        self.budget_percent = budget_percent
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._hedged = deque(maxlen=window)
+
+    def observe(self, seconds: float, hedged: bool = False):
+        with self._lock:
+            self._latencies.append(seconds)
+            self._hedged.append(hedged)
+
+    def hedge_delay(self):
+        """Seconds after which a call should be hedged, or None while hedging is off or undecided."""
+        with self._lock:
+            if self.percentile <= 0 or len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, len(ordered) * self.percentile // 100)]
+
+    def try_hedge(self) -> bool:
+        """Whether the hedge budget allows one more duplicate request."""
+        with self._lock:
+            return sum(self._hedged) < len(self._hedged) * self.budget_percent / 100
+
+
+# One breaker and latency tracker per model name
+_breakers = {}
+_latency_trackers = {}
+_resilience_lock = threading.Lock()
+
+def _resilience_for(model_label: str) -> tuple:
+    with _resilience_lock:
+        if model_label not in _breakers:
+            _breakers[model_label] = CircuitBreaker()
+            _latency_trackers[model_label] = LatencyTracker()
+        return _breakers[model_label], _latency_trackers[model_label]
+
+# Threads that carry blocking calls with a deadline or hedge, so the caller can stop waiting.
+# Each pooled call holds a rate limiter slot until it returns, so no more than
+# LLM_MAX_IN_FLIGHT of them ever run and the pool never queues.
+_call_pool = None
+_call_pool_lock = threading.Lock()
+
+def _get_call_pool() -> concurrent.futures.ThreadPoolExecutor:
+    global _call_pool
+    with _call_pool_lock:
+        if _call_pool is None:
+            _call_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(32, LLM_MAX_IN_FLIGHT * 4),
+                                                               thread_name_prefix="llm-call")
+    return _call_pool
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None)
+    return total if isinstance(total, int) else None
+
+def _model_label(model) -> str:
+    name = getattr(model, "_model_name", None)
+    return name.rsplit("/", 1)[-1] if isinstance(name, str) else "unknown"
+
+def _acquire(prompt, deadline: float):
+    """Waits for rate limiter quota, for at most `deadline` seconds (0 waits as long as it takes)."""
+    with LLM_QUEUE_SECONDS.time():
+        return get_rate_limiter().acquire(estimate_tokens(prompt), timeout=deadline or None)
+
+def _request(model, prompt, **kwargs):
+    """One model.generate_content call, on quota the caller already holds."""
+    try:
+        with LLM_REQUEST_SECONDS.labels(_model_label(model), "sync").time():
+            return model.generate_content(prompt, **kwargs)
+    except Exception:
+        record_failure("llm")
+        raise
+
+
+class _PooledRequest:
+    """
+    A _request on the call pool that owns one rate limiter slot and gives it back when it
+    finishes. Abandoning it cancels it if it hasn't started; one that starts after being
+    abandoned returns without calling the model. A request already sent can't be
+    recalled (the SDK call blocks), so it runs to completion and then frees its slot.
+    """
+    def __init__(self, model, prompt, charged: int, kwargs: dict):
+        self._abandoned = threading.Event()
+        rate_limiter = get_rate_limiter()
+
+        def run():
+            if self._abandoned.is_set():
+                return None
+            return _request(model, prompt, **kwargs)
+
+        def release(future):
+            response = None if future.cancelled() or future.exception() is not None else future.result()
+            rate_limiter.release(charged, _usage_tokens(response))
+
+        # Pool threads don't inherit context: carry the task priority and metrics labels over
+        self.future = _get_call_pool().submit(contextvars.copy_context().run, run)
+        self.future.add_done_callback(release)
+
+    def abandon(self):
+        self._abandoned.set()
+        self.future.cancel()
+
+
+def _first_answer(model, prompt, label: str, tracker: LatencyTracker, charged: int, started: float,
+                  deadline: float, kwargs: dict) -> tuple:
+    """
+    Waits for the call sent at `started` and, past the hedge delay, a duplicate of it.
+    Returns (response, hedged).
+    """
+    primary = _PooledRequest(model, prompt, charged, kwargs)
+    requests = {primary.future: primary}
+    pending = {primary.future}
+    hedge_delay = tracker.hedge_delay()
+    hedge_at = started + hedge_delay if hedge_delay is not None else None
+    deadline_at = started + deadline if deadline else None
+    hedged = False
+    error = None
+    try:
+        while pending:
+            wake_at = min((t for t in (hedge_at, deadline_at) if t is not None), default=None)
+            timeout = None if wake_at is None else max(0.0, wake_at - time.monotonic())
+            done, pending = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if hedged:
+                        LLM_HEDGED_TOTAL.labels(label, "primary" if future is primary.future else "hedge").inc()
+                    return future.result(), hedged
+                error = future.exception()
+            now = time.monotonic()
+            if pending and deadline_at is not None and now >= deadline_at:
+                raise LLMDeadlineExceeded(f"No answer from {label} within {deadline}s")
+            if pending and hedge_at is not None and now >= hedge_at:
+                # Only ever one duplicate, and only on spare quota: a hedge that had to queue
+                # behind other calls would arrive too late to help
+                hedge_at = None
+                hedge_charge = get_rate_limiter().try_acquire(estimate_tokens(prompt)) if tracker.try_hedge() else None
+                if hedge_charge is not None:
+                    hedge = _PooledRequest(model, prompt, hedge_charge, kwargs)
+                    requests[hedge.future] = hedge
+                    pending.add(hedge.future)
+                    hedged = True
+        raise error
+    finally:
+        for future in pending:
+            requests[future].abandon()
+
+def _check_breaker(breaker: CircuitBreaker, label: str):
+    try:
+        breaker.before_call()
+    except LLMUnavailableError:
+        LLM_BREAKER_REJECTIONS_TOTAL.labels(label).inc()
+        raise
+
+def generate(model, prompt, deadline: float = None, **kwargs):
+    """
+    Calls model.generate_content through the shared rate limiter, guarded for tail latency:
+    - fails fast with LLMUnavailableError while the model's circuit breaker is open
+    - sends one duplicate request if the call outlasts the LLM_HEDGE_PERCENTILE of recent
+      calls, and returns whichever answer arrives first
+    - raises LLMDeadlineExceeded `deadline` seconds (default LLM_DEADLINE_SECONDS) after
+      the call was sent, or LLMQueueTimeout if it waited that long for quota
+
+    Hedge delays, deadlines and the breaker only see time spent on the model, never time
+    queued behind our own rate limit.
+    """
+    label = _model_label(model)
+    breaker, tracker = _resilience_for(label)
+    _check_breaker(breaker, label)
+    deadline = LLM_DEADLINE_SECONDS if deadline is None else deadline
+    try:
+        charged = _acquire(prompt, deadline)
+    except LLMQueueTimeout:
+        breaker.abandon()
+        record_failure("llm_queue")
+        raise
+
+    started = time.monotonic()
+    try:
+        if deadline or tracker.hedge_delay() is not None:
+            response, hedged = _first_answer(model, prompt, label, tracker, charged, started, deadline, kwargs)
+        else:
+            response, hedged = None, False
+            try:
+                response = _request(model, prompt, **kwargs)
+            finally:
+                get_rate_limiter().release(charged, _usage_tokens(response))
+    except Exception as e:
+        if isinstance(e, LLMDeadlineExceeded):
+            record_failure("llm_deadline")
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    tracker.observe(time.monotonic() - started, hedged)
+    return response
+
+def generate_stream(model, prompt, **kwargs):
+    """
+    Streams model.generate_content text chunks through the shared rate limiter. The slot
+    is held until the generator is exhausted or closed, so callers may stop early. The
+    model's circuit breaker applies; streams are neither hedged nor given a deadline.
+    """
+    breaker, _ = _resilience_for(_model_label(model))
+    _check_breaker(breaker, _model_label(model))
+    rate_limiter = get_rate_limiter()
+    with LLM_QUEUE_SECONDS.time():
+        charged = rate_limiter.acquire(estimate_tokens(prompt))
+    last_chunk = None
+    started = time.monotonic()
+    try:
+        for chunk in model.generate_content(prompt, stream=True, **kwargs):
+            last_chunk = chunk
+            yield chunk.text
+        breaker.record_success()
+    except GeneratorExit:
+        # The caller stopped early, e.g. once the code block closed
+        breaker.record_success()
+        raise
+    except Exception:
+        record_failure("llm")
+        breaker.record_failure()
+        raise
+    finally:
+        LLM_REQUEST_SECONDS.labels(_model_label(model), "stream").observe(time.monotonic() - started)
+        rate_limiter.release(charged, _usage_tokens(last_chunk))
+
+
+class CodeFenceStripper:
+    """
+    Incrementally strips markdown code fences from streamed LLM output. Text is
+    processed line by line (a partial line is held back until it completes), and
+    `closed` turns True as soon as a fenced code block ends, so the caller can act on
+    the code without waiting for any trailing prose.
+    """
+    def __init__(self):
+        self.state = "start"  # start -> fenced | raw; fenced -> closed
+        self.lines = []
+        self._pending = ""
+
+    @property
+    def closed(self) -> bool:
+        return self.state == "closed"
+
+    def _handle(self, line: str):
+        is_fence = line.strip().startswith("```")
+        if self.state == "start":
+            if not line.strip():
+                return
+            self.state = "fenced" if is_fence else "raw"
+            if is_fence:
+                return
+        if self.state == "fenced" and is_fence:
+            self.state = "closed"
+        elif self.state in ("fenced", "raw") and not is_fence:
+            self.lines.append(line)
+
+    def feed(self, text: str):
+        if self.closed:
+            return
+        self._pending += text
+        *complete, self._pending = self._pending.split("\n")
+        for line in complete:
+            self._handle(line)
+            if self.closed:
+                return
+
+    def finish(self) -> str:
+        """Flushes the held-back partial line and returns the code."""
+        if self._pending and not self.closed:
+            self._handle(self._pending)
+        self._pending = ""
+        return "\n".join(self.lines).strip()
+
+
+async def _request_async(model, prompt, **kwargs):
+    try:
+        with LLM_REQUEST_SECONDS.labels(_model_label(model), "async").time():
+            return await model.generate_content_async(prompt, **kwargs)
+    except Exception:
+        record_failure("llm")
+        raise
+
+def _start_request_async(model, prompt, charged: int, kwargs: dict) -> asyncio.Task:
+    """Sends a request on quota already held; the slot is freed when the task ends, even if cancelled before it ran."""
+    rate_limiter = get_rate_limiter()
+
+    def release(task):
+        response = None if task.cancelled() or task.exception() is not None else task.result()
+        rate_limiter.release(charged, _usage_tokens(response))
+
+    task = asyncio.ensure_future(_request_async(model, prompt, **kwargs))
+    task.add_done_callback(release)
+    return task
+
+async def _first_answer_async(model, prompt, label: str, tracker: LatencyTracker, charged: int, started: float,
+                              kwargs: dict) -> tuple:
+    primary = _start_request_async(model, prompt, charged, kwargs)
+    pending = {primary}
+    hedge_delay = tracker.hedge_delay()
+    hedge_at = started + hedge_delay if hedge_delay is not None else None
+    hedged = False
+    error = None
+    try:
+        while pending:
+            timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if hedged:
+                        LLM_HEDGED_TOTAL.labels(label, "primary" if task is primary else "hedge").inc()
+                    return task.result(), hedged
+                error = task.exception()
+            if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+                hedge_at = None
+                hedge_charge = get_rate_limiter().try_acquire(estimate_tokens(prompt)) if tracker.try_hedge() else None
+                if hedge_charge is not None:
+                    pending.add(_start_request_async(model, prompt, hedge_charge, kwargs))
+                    hedged = True
+        raise error
+    finally:
+        # Unlike threads, the losing request really is cancelled
+        for task in pending:
+            task.cancel()
+
+async def generate_async(model, prompt, deadline: float = None, **kwargs):
+    """
+    Awaits model.generate_content_async through the shared rate limiter and the loop's
+    'llm' limit, with the same circuit breaker, hedging and deadline as generate().
+    """
+    label = _model_label(model)
+    breaker, tracker = _resilience_for(label)
+    _check_breaker(breaker, label)
+    deadline = LLM_DEADLINE_SECONDS if deadline is None else deadline
+    async with limiter("llm"):
+        try:
+            with LLM_QUEUE_SECONDS.time():
+                async with asyncio.timeout(deadline or None):
+                    charged = await get_rate_limiter().acquire_async(estimate_tokens(prompt))
+        except TimeoutError as e:
+            breaker.abandon()
+            record_failure("llm_queue")
+            raise LLMQueueTimeout(f"No LLM quota within {deadline}s") from e
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+
+        started = time.monotonic()
+        timeout = asyncio.timeout(deadline or None)
+        try:
+            async with timeout:
+                response, hedged = await _first_answer_async(model, prompt, label, tracker, charged, started, kwargs)
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
+        except Exception as e:
+            breaker.record_failure()
+            if timeout.expired():
+                record_failure("llm_deadline")
+                raise LLMDeadlineExceeded(f"No answer from {label} within {deadline}s") from e
+            raise
+    breaker.record_success()
+    tracker.observe(time.monotonic() - started, hedged)
+    return response
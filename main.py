@@ -1,15 +1,14 @@
 # main.py
-import vertexai
-from db_manager import DBManager
+import os
+import asyncio
+from llm import init_vertex
+from db_manager import DBManager, AsyncDBManager
 from logger import get_logger
-import concurrent.futures
-
-# Import all the agents
+from scheduler import DAGScheduler, AsyncDAGScheduler, build_task_graph
+from dispatcher import build_agents, dispatch_task, dispatch_task_async
+from metrics import start_metrics_server
+from task_writer import flush_task_writes, update_task, update_task_async
 from agents.orchestrator import ChiefOrchestratorAgent
-from agents.code_writer import CodeWriterAgent
-from agents.repo_initializer import RepoInitializerAgent
-from agents.documentation import DocumentationAgent
-from agents.api_integrator import APIIntegratorAgent
 
 logger = get_logger(__name__)
 
@@ -18,12 +17,14 @@ def main():
     try:
         PROJECT_ID = "ai-engineer-472512" 
         LOCATION = "asia-south1"
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
+        init_vertex(PROJECT_ID, LOCATION)
         logger.info("Vertex AI Initialized.", extra={"project_id": PROJECT_ID, "location": LOCATION})
     except Exception as e:
         logger.error("Error initializing Vertex AI", extra={"error": str(e)})
         return
 
+    start_metrics_server()
+
     PROJECT_ID = 1
     PROJECT_GOAL = (
         "Initialize a git repository, then write a Python script to fetch the current "
@@ -37,66 +38,53 @@ def main():
     logger.info("--- Starting Planning Step ---", extra={"project_id": PROJECT_ID, "goal": PROJECT_GOAL})
     orchestrator = ChiefOrchestratorAgent()
     
-    existing_tasks = db.query_all("SELECT id FROM tasks WHERE project_id = %s", (PROJECT_ID,))
-    if not existing_tasks:
+    existing_task = db.query_one("SELECT 1 FROM tasks WHERE project_id = %s LIMIT 1", (PROJECT_ID,))
+    if not existing_task:
         orchestrator.plan_and_store_tasks(PROJECT_ID, PROJECT_GOAL)
     else:
         logger.info("Tasks for this project already exist. Skipping planning.")
 
-    # --- 2. Execution Step (Now with Parallelism) ---
+    # --- 2. Execution Step (Dependency-Aware Parallelism) ---
     logger.info("--- Starting Parallel Execution Step ---")
     
     # Instantiate all our specialist agents
-    agents = {
-        "code_writing": CodeWriterAgent(),
-        "repo_init": RepoInitializerAgent(),
-        "documentation": DocumentationAgent(),
-        "api_integration": APIIntegratorAgent()
-    }
-
-    # This helper function will contain our routing logic
-    def dispatch_task(task):
-        task_type = task['task_type']
-        task_id = task['id']
-        log_context = {"task_id": task_id, "task_type": task_type}
-        logger.info("Dispatching task", extra=log_context)
-        
-        try:
-            if task_type == 'documentation':
-                # Handle the documentation agent's special requirement
-                source_task = db.query_one("SELECT id FROM tasks WHERE project_id = %s AND status = 'completed' AND task_type IN ('code_writing', 'api_integration') ORDER BY id DESC LIMIT 1", (PROJECT_ID,))
-                if source_task:
-                    agents[task_type].execute_task(task_id, source_task['id'])
-                else:
-                    raise ValueError("No prior code task found to document.")
-            elif task_type in agents:
-                agents[task_type].execute_task(task_id)
-            else:
-                # Default to the general code writer if type is unknown
-                agents["code_writing"].execute_task(task_id)
-            return f"Task {task_id} completed."
-        except Exception as e:
-            logger.error("An error occurred during task dispatch.", extra={"task_id": task_id, "error": str(e)})
-            db.execute("UPDATE tasks SET status = 'failed', output = %s WHERE id = %s", (f"Dispatch error: {e}", task_id))
-            return f"Task {task_id} failed."
-
-    # Fetch all pending tasks that can be run (for simplicity, we assume all pending tasks are ready)
-    pending_tasks = db.query_all("SELECT * FROM tasks WHERE project_id = %s AND status = 'pending' ORDER BY id", (PROJECT_ID,))
-    
-    if pending_tasks:
-        # Use a ThreadPoolExecutor to run tasks in parallel
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            # Submit all tasks to the executor
-            future_to_task = {executor.submit(dispatch_task, task): task for task in pending_tasks}
-            
-            # Wait for tasks to complete and log the results
-            for future in concurrent.futures.as_completed(future_to_task):
-                task = future_to_task[future]
-                try:
-                    result = future.result()
-                    logger.info("Task finished.", extra={"task_id": task['id'], "result": result})
-                except Exception as exc:
-                    logger.error(f"Task generated an exception.", extra={"task_id": task['id'], "exception": str(exc)})
+    agents = build_agents()
+    async_db = AsyncDBManager(db)
+
+    def run_task(task_id):
+        return dispatch_task(db, agents, task_id)
+
+    def skip_task(task_id, reason):
+        update_task(db, task_id, output=reason, status='skipped')
+
+    # The same pair for EXECUTION_MODE=async, where every task is a coroutine on one event loop
+    async def run_task_async(task_id):
+        return await dispatch_task_async(async_db, agents, task_id)
+
+    async def skip_task_async(task_id, reason):
+        await update_task_async(async_db, task_id, output=reason, status='skipped')
+
+    # Build the task DAG from the stored dependencies and run each task as soon as its parents complete
+    # Only the columns the scheduler needs, streamed: code and output can be large
+    project_tasks = list(db.iter_query("SELECT id, status, dependencies FROM tasks WHERE project_id = %s ORDER BY id", (PROJECT_ID,)))
+    full_graph = build_task_graph(project_tasks)
+    pending_ids = {task['id'] for task in project_tasks if task['status'] == 'pending'}
+    completed_ids = {task['id'] for task in project_tasks if task['status'] == 'completed'}
+    failed_ids = {task['id'] for task in project_tasks if task['status'] in ('failed', 'skipped')}
+
+    if pending_ids:
+        graph = {task_id: parents for task_id, parents in full_graph.items() if task_id in pending_ids}
+        if os.getenv("EXECUTION_MODE") == "async":
+            scheduler = AsyncDAGScheduler()
+            results = asyncio.run(scheduler.run(graph, run_task_async, completed=completed_ids, failed=failed_ids, on_skip=skip_task_async))
+        else:
+            scheduler = DAGScheduler(max_workers=int(os.getenv("MAX_WORKERS", "4")))
+            results = scheduler.run(graph, run_task, completed=completed_ids, failed=failed_ids, on_skip=skip_task)
+        summary = {status: list(results.values()).count(status) for status in ('completed', 'failed', 'skipped')}
+        logger.info("Execution summary.", extra={"project_id": PROJECT_ID, **summary})
+
+    # Buffered outcomes (TASK_WRITE_BEHIND) are committed before we report completion
+    flush_task_writes()
 
     logger.info("All tasks have been processed.")
 
@@ -0,0 +1,82 @@
+# metrics.py
+import os
+import contextvars
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest, start_http_server
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Port for the standalone exporter in main.py / worker.py; the dashboard serves /metrics itself
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+# Buckets spanning fast DB queries (ms) up to long LLM calls and sandbox runs (minutes)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "metamorph_llm_request_seconds", "Time spent in generate_content, by model and call mode.",
+    ["model", "mode"], buckets=LATENCY_BUCKETS)
+LLM_QUEUE_SECONDS = Histogram(
+    "metamorph_llm_queue_seconds", "Time an LLM call waited for the shared rate limiter.",
+    buckets=LATENCY_BUCKETS)
+SANDBOX_PHASE_SECONDS = Histogram(
+    "metamorph_sandbox_phase_seconds", "Time spent in each phase of a sandbox run.",
+    ["mode", "phase"], buckets=LATENCY_BUCKETS)
+DB_QUERY_SECONDS = Histogram(
+    "metamorph_db_query_seconds", "DBManager query latency, by method.",
+    ["operation"], buckets=LATENCY_BUCKETS)
+TASK_SECONDS = Histogram(
+    "metamorph_task_seconds", "End-to-end task execution time.",
+    ["task_type"], buckets=LATENCY_BUCKETS)
+
+LLM_HEDGED_TOTAL = Counter(
+    "metamorph_llm_hedged_total", "LLM calls that sent a hedge request, by which request answered first.",
+    ["model", "winner"])
+LLM_BREAKER_REJECTIONS_TOTAL = Counter(
+    "metamorph_llm_breaker_rejections_total", "LLM calls failed fast by an open circuit breaker.", ["model"])
+TASKS_TOTAL = Counter(
+    "metamorph_tasks_total", "Tasks dispatched, by type and final status.", ["task_type", "status"])
+CACHE_REQUESTS_TOTAL = Counter(
+    "metamorph_cache_requests_total", "Cache lookups by cache and result (local_hit, remote_hit, miss).",
+    ["cache", "result", "task_type"])
+RETRIES_TOTAL = Counter(
+    "metamorph_retries_total", "Retried calls, by function and task type.", ["function", "task_type"])
+FAILURES_TOTAL = Counter(
+    "metamorph_failures_total", "Errors by where they happened and task type.", ["stage", "task_type"])
+
+# The task type being dispatched in this context, so shared code (caches, retries) can label by it
+_current_task_type = contextvars.ContextVar("metrics_task_type", default="none")
+
+@contextmanager
+def task_type_context(task_type: str):
+    token = _current_task_type.set(task_type or "none")
+    try:
+        yield
+    finally:
+        _current_task_type.reset(token)
+
+def current_task_type() -> str:
+    return _current_task_type.get()
+
+def record_cache(cache: str, result: str):
+    CACHE_REQUESTS_TOTAL.labels(cache, result, current_task_type()).inc()
+
+def record_retry(function: str):
+    RETRIES_TOTAL.labels(function, current_task_type()).inc()
+
+def record_failure(stage: str):
+    FAILURES_TOTAL.labels(stage, current_task_type()).inc()
+
+def sandbox_phase(mode: str, phase: str):
+    """Times a block as one phase of a sandbox run: `with sandbox_phase("cold", "create"): ...`"""
+    return SANDBOX_PHASE_SECONDS.labels(mode, phase).time()
+
+def render_latest() -> tuple:
+    """The current metrics in Prometheus text format, with its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def start_metrics_server():
+    """Serves /metrics on METRICS_PORT from a background thread, if the port is configured."""
+    if METRICS_PORT:
+        start_http_server(int(METRICS_PORT))
+        logger.info("Metrics exporter started.", extra={"port": int(METRICS_PORT)})
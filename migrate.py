@@ -0,0 +1,186 @@
+# migrate.py
+"""
+Brings the database schema up to date by applying the numbered SQL files in
+migrations/ that haven't run yet, in order.
+
+    python migrate.py            # apply everything pending
+    python migrate.py --to 3     # stop after version 3
+    python migrate.py --status   # list applied and pending versions
+"""
+import os
+import re
+import argparse
+from dotenv import load_dotenv
+from db_manager import get_connection_pool
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Serializes concurrent runners (e.g. several workers starting at once) on one database
+MIGRATION_LOCK_ID = 72_019_001
+# First-line marker for migrations that can't run in a transaction, such as CREATE INDEX CONCURRENTLY
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+_FILE_PATTERN = re.compile(r"^(\d+)_(\w+)\.sql$")
+_CONCURRENT_INDEX_PATTERN = re.compile(r"^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+
+class Migration:
+    def __init__(self, version: int, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+
+    @property
+    def sql(self) -> str:
+        with open(self.path) as f:
+            return f.read()
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self) -> list:
+        """Splits the file on statement-ending semicolons; only used for no-transaction migrations."""
+        lines = [line for line in self.sql.splitlines() if not line.lstrip().startswith("--")]
+        return [stmt.strip() for stmt in re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE) if stmt.strip()]
+
+
+def discover_migrations(directory: str = MIGRATIONS_DIR) -> list:
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = _FILE_PATTERN.match(file_name)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, file_name)))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def _applied_versions(cur) -> set:
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def _drop_invalid_index(cur, statement: str):
+    """
+    A failed or cancelled CREATE INDEX CONCURRENTLY leaves an INVALID index behind, which
+    IF NOT EXISTS would then skip for good. Drops it so the statement builds it again.
+    """
+    match = _CONCURRENT_INDEX_PATTERN.match(statement)
+    if not match:
+        return
+    cur.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (match.group(1),))
+    row = cur.fetchone()
+    if row and row[0]:
+        logger.warning("Dropping invalid index left by an interrupted build.", extra={"index": match.group(1)})
+        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+def _check_indexes_valid(cur, statements: list):
+    """Raises if an index these statements create is still INVALID, e.g. after a build lost a race."""
+    names = [match.group(1) for match in map(_CONCURRENT_INDEX_PATTERN.match, statements) if match]
+    if not names:
+        return
+    cur.execute(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = ANY(%s) AND pg_table_is_visible(c.oid) AND NOT i.indisvalid",
+        (names,)
+    )
+    invalid = [row[0] for row in cur.fetchall()]
+    if invalid:
+        raise RuntimeError(f"Indexes left INVALID after migration: {invalid}")
+
+
+def migrate(target: int = None, directory: str = MIGRATIONS_DIR) -> list:
+    """
+    Applies pending migrations up to `target` (all by default) and returns their versions.
+    Each transactional migration commits together with its schema_migrations row, so a
+    failure leaves the database at the last fully applied version.
+    """
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    applied_now = []
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+            try:
+                applied = _applied_versions(cur)
+                for migration in discover_migrations(directory):
+                    if migration.version in applied or (target is not None and migration.version > target):
+                        continue
+                    log_context = {"version": migration.version, "migration": migration.name}
+                    logger.info("Applying migration.", extra=log_context)
+                    if migration.transactional:
+                        conn.autocommit = False
+                        try:
+                            cur.execute(migration.sql)
+                            cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (migration.version, migration.name))
+                            conn.commit()
+                        except Exception:
+                            conn.rollback()
+                            raise
+                        finally:
+                            conn.autocommit = True
+                    else:
+                        # Statements are idempotent (IF NOT EXISTS), and an invalid index an
+                        # interrupted build left behind is dropped first, so a rerun after a
+                        # failure builds whatever is missing or broken
+                        statements = migration.statements()
+                        for statement in statements:
+                            _drop_invalid_index(cur, statement)
+                            cur.execute(statement)
+                        _check_indexes_valid(cur, statements)
+                        cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (migration.version, migration.name))
+                    applied_now.append(migration.version)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    finally:
+        conn.autocommit = False
+        pool.putconn(conn, close=bool(conn.closed))
+    if applied_now:
+        logger.info("Schema is up to date.", extra={"applied": applied_now})
+    return applied_now
+
+
+def status(directory: str = MIGRATIONS_DIR) -> list:
+    """(version, name, applied) for every migration on disk."""
+    pool = get_connection_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            applied = _applied_versions(cur)
+        conn.commit()
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
+    return [(m.version, m.name, m.version in applied) for m in discover_migrations(directory)]
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument("--to", type=int, default=None, help="last version to apply")
+    parser.add_argument("--status", action="store_true", help="list migrations instead of applying them")
+    args = parser.parse_args()
+
+    if args.status:
+        for version, name, applied in status():
+            print(f"{version:04d} {name:<30} {'applied' if applied else 'pending'}")
+        return
+    migrate(target=args.to)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+-- Task leasing for worker.py: the worker that claimed a running task and when its claim lapses
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(255);
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
@@ -0,0 +1,17 @@
+-- Columns the agents already write: the planner's task_type and dependencies, and the tester's verdict
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS task_type VARCHAR(50) NOT NULL DEFAULT 'code_writing';
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS dependencies JSONB NOT NULL DEFAULT '[]'::jsonb;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS test_status VARCHAR(50);
+
+-- Databases set up by hand before migrations may hold dependencies as JSON text
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'tasks' AND column_name = 'dependencies') <> 'jsonb' THEN
+        ALTER TABLE tasks ALTER COLUMN dependencies DROP DEFAULT;
+        ALTER TABLE tasks ALTER COLUMN dependencies TYPE JSONB USING COALESCE(NULLIF(dependencies::text, ''), '[]')::jsonb;
+        ALTER TABLE tasks ALTER COLUMN dependencies SET DEFAULT '[]'::jsonb;
+        UPDATE tasks SET dependencies = '[]'::jsonb WHERE dependencies IS NULL;
+        ALTER TABLE tasks ALTER COLUMN dependencies SET NOT NULL;
+    END IF;
+END $$;
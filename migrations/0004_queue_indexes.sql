@@ -0,0 +1,13 @@
+-- migrate: no-transaction
+-- Built CONCURRENTLY so a live queue keeps accepting writes while these are created.
+-- A failed build leaves an INVALID index; migrate.py drops it before rerunning the statement.
+
+-- Per-project scans by status, in id order: main.py's project load, the latest completed
+-- code task lookup (backwards over completed ids) and the worker's dependency check
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_project_status_id_idx ON tasks (project_id, status, id);
+
+-- The claim queue: oldest pending tasks first, small because finished tasks drop out
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_pending_id_idx ON tasks (id) WHERE status = 'pending';
+
+-- Lease reclaim only ever looks at running tasks
+CREATE INDEX CONCURRENTLY IF NOT EXISTS tasks_running_lease_idx ON tasks (lease_expires_at) WHERE status = 'running';
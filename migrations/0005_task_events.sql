@@ -0,0 +1,24 @@
+-- Publishes task creation and every status transition on the task_events channel, so
+-- workers and the dashboard can LISTEN instead of polling. Covers every write path,
+-- including batched write-behind updates and hand-run SQL.
+CREATE OR REPLACE FUNCTION notify_task_event() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('task_events', json_build_object(
+        'op', lower(TG_OP),
+        'id', NEW.id,
+        'project_id', NEW.project_id,
+        'task_type', NEW.task_type,
+        'status', NEW.status,
+        'previous_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tasks_notify_insert ON tasks;
+CREATE TRIGGER tasks_notify_insert AFTER INSERT ON tasks
+    FOR EACH ROW EXECUTE FUNCTION notify_task_event();
+
+DROP TRIGGER IF EXISTS tasks_notify_status ON tasks;
+CREATE TRIGGER tasks_notify_status AFTER UPDATE OF status ON tasks
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status) EXECUTE FUNCTION notify_task_event();
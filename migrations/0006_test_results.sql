@@ -0,0 +1,14 @@
+-- Per-test outcomes of TesterAgent runs, parsed from pytest's JUnit XML report. A task's
+-- rows are replaced each time its tests run; tasks.test_status keeps the overall verdict.
+CREATE TABLE IF NOT EXISTS test_results (
+    id SERIAL PRIMARY KEY,
+    task_id INTEGER NOT NULL REFERENCES tasks(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    classname TEXT,
+    outcome VARCHAR(20) NOT NULL,
+    duration_seconds DOUBLE PRECISION,
+    message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS test_results_task_id_idx ON test_results (task_id);
@@ -0,0 +1,10 @@
+-- Plans by goal for the semantic plan cache (plan_cache.py). `embedding` is the goal's
+-- float32 vector from the named vectorizer, so processes can load it without re-embedding.
+CREATE TABLE IF NOT EXISTS plan_cache (
+    id SERIAL PRIMARY KEY,
+    goal TEXT NOT NULL,
+    vectorizer VARCHAR(64) NOT NULL,
+    embedding BYTEA NOT NULL,
+    plan JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
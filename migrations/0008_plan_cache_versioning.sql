@@ -0,0 +1,5 @@
+-- A cached plan is only served to the planner version (prompt and task types) that made
+-- it, and only until expires_at (Unix seconds). Rows from before this have neither and
+-- are never served again.
+ALTER TABLE plan_cache ADD COLUMN IF NOT EXISTS planner_version TEXT NOT NULL DEFAULT '';
+ALTER TABLE plan_cache ADD COLUMN IF NOT EXISTS expires_at DOUBLE PRECISION NOT NULL DEFAULT 0;
@@ -0,0 +1,236 @@
+# plan_cache.py
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import threading
+from collections import Counter
+import numpy as np
+from db_manager import DBManager
+from metrics import record_cache
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Reuse a stored plan for a goal worded like one planned before, skipping the planning call
+SEMANTIC_PLAN_CACHE = os.getenv("SEMANTIC_PLAN_CACHE", "1") == "1"
+# A stored plan is only a candidate for a goal with exactly the same content words
+# (after stemming, minus STOPWORDS): cosine similarity can't be trusted to tell goals
+# apart, since in a long goal one swapped or added clause still scores above 0.95.
+# Among candidates it ranks, and this floor rejects the same words in another order.
+PLAN_CACHE_THRESHOLD = float(os.getenv("PLAN_CACHE_THRESHOLD", "0.9"))
+# Stored plans stop being served after this long
+PLAN_CACHE_TTL_SECONDS = int(os.getenv("PLAN_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Embedding width: 50,000 cached goals take 50,000 x 512 x 4 bytes = ~100 MB
+PLAN_CACHE_DIM = int(os.getenv("PLAN_CACHE_DIM", "512"))
+# How often to pick up plans cached by other processes
+PLAN_CACHE_REFRESH_SECONDS = int(os.getenv("PLAN_CACHE_REFRESH_SECONDS", "30"))
+
+# Words that change a goal's wording but not what it asks for
+STOPWORDS = frozenset(
+    "a an and the to of for in on with then finally that which it its this please also "
+    "should must will would can could i we you me us".split()
+)
+# Inflections folded together, longest first: "fetches" and "fetching" both count as "fetch"
+SUFFIXES = ("ing", "ed", "es", "s")
+# Relative weight of each feature kind in the embedding
+FEATURE_WEIGHTS = {"word": 1.0, "pair": 0.6, "trigram": 0.25}
+
+
+class GoalVectorizer:
+    """
+    Embeds a goal as a signed feature-hashing vector of its words, adjacent word pairs
+    and character trigrams, L2-normalized so a dot product is the cosine similarity.
+    Hashing needs no fitted vocabulary or IDF table, so an embedding never changes as
+    the cache grows and every process computes the same one.
+    """
+    def __init__(self, dim: int = PLAN_CACHE_DIM):
+        self.dim = dim
+
+    @property
+    def version(self) -> str:
+        """Stored next to each embedding; rows from another vectorizer are re-embedded on load."""
+        return f"hash-v1-{self.dim}"
+
+    @staticmethod
+    def stem(word: str) -> str:
+        for suffix in SUFFIXES:
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                return word[:-len(suffix)]
+        return word
+
+    def words(self, text: str) -> list:
+        return [self.stem(word) for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+    def features(self, text: str) -> Counter:
+        words = self.words(text)
+        features = Counter()
+        for word in words:
+            features[("word", word)] += 1
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                features[("trigram", padded[i:i + 3])] += 1
+        for first, second in zip(words, words[1:]):
+            features[("pair", f"{first} {second}")] += 1
+        return features
+
+    def content_key(self, text: str, planner_version: str = "") -> int:
+        """
+        Identifies the goal's set of content words under one planner version: two goals
+        may share a plan only if their keys are equal.
+        """
+        content = " ".join(sorted(set(self.words(text))))
+        digest = hashlib.blake2b(f"{planner_version}\n{content}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little", signed=True)
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for (kind, feature), count in self.features(text).items():
+            digest = int.from_bytes(hashlib.blake2b(f"{kind}:{feature}".encode("utf-8"), digest_size=8).digest(), "little")
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dim] += sign * FEATURE_WEIGHTS[kind] * (1 + math.log(count))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class PlanIndex:
+    """
+    Cached plan ids with their goal embeddings, content keys and expiry times, in arrays
+    that grow by doubling. A lookup masks the entries with the goal's content key and
+    ranks just those with a matrix-vector product: a few milliseconds at tens of
+    thousands of plans.
+    """
+    def __init__(self, dim: int = PLAN_CACHE_DIM):
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._keys = np.empty(0, dtype=np.int64)
+        self._expires = np.empty(0, dtype=np.float64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self, needed: int):
+        capacity = max(needed, 2 * len(self._ids), 1024)
+        vectors = np.empty((capacity, self._vectors.shape[1]), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        self._vectors = vectors
+        for name in ("_ids", "_keys", "_expires"):
+            current = getattr(self, name)
+            grown = np.empty(capacity, dtype=current.dtype)
+            grown[:self._size] = current[:self._size]
+            setattr(self, name, grown)
+
+    def add(self, plan_ids, vectors, keys, expires):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self._vectors.shape[1])
+        needed = self._size + len(vectors)
+        if needed > len(self._ids):
+            self._grow(needed)
+        self._vectors[self._size:needed] = vectors
+        self._ids[self._size:needed] = plan_ids
+        self._keys[self._size:needed] = keys
+        self._expires[self._size:needed] = expires
+        self._size = needed
+
+    def best(self, vector: np.ndarray, key: int, now: float):
+        """The (plan_id, similarity) of the closest live entry with this content key, or None."""
+        candidates = np.flatnonzero((self._keys[:self._size] == key) & (self._expires[:self._size] > now))
+        if not len(candidates):
+            return None
+        scores = self._vectors[candidates] @ vector
+        position = int(np.argmax(scores))
+        return int(self._ids[candidates[position]]), float(scores[position])
+
+
+class SemanticPlanCache:
+    """
+    Plans keyed by what their goal says rather than its exact text, for the planner
+    version (prompt and task types) that produced them. Plans live in the plan_cache
+    table (migrations 0007 and 0008) and this process keeps only their embeddings in
+    memory; the plan itself is read back on a hit.
+    """
+    def __init__(self, db: DBManager = None, threshold: float = PLAN_CACHE_THRESHOLD,
+                 vectorizer: GoalVectorizer = None, refresh_seconds: float = PLAN_CACHE_REFRESH_SECONDS,
+                 ttl_seconds: float = PLAN_CACHE_TTL_SECONDS):
+        self.db = db or DBManager()
+        self.threshold = threshold
+        self.vectorizer = vectorizer or GoalVectorizer()
+        self.refresh_seconds = refresh_seconds
+        self.ttl_seconds = ttl_seconds
+        self.index = PlanIndex(self.vectorizer.dim)
+        self._last_id = 0
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        """Loads unexpired plans cached since the last refresh, by this or any other process."""
+        with self._lock:
+            if not force and self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.refresh_seconds:
+                return
+            ids, vectors, keys, expires = [], [], [], []
+            rows = self.db.iter_query(
+                "SELECT id, goal, vectorizer, embedding, planner_version, expires_at FROM plan_cache "
+                "WHERE id > %s AND expires_at > %s ORDER BY id",
+                (self._last_id, time.time()), row_type="tuple"
+            )
+            for plan_id, goal, vectorizer, embedding, planner_version, expires_at in rows:
+                ids.append(plan_id)
+                if vectorizer == self.vectorizer.version:
+                    vectors.append(np.frombuffer(bytes(embedding), dtype=np.float32))
+                else:
+                    vectors.append(self.vectorizer.embed(goal))
+                keys.append(self.vectorizer.content_key(goal, planner_version))
+                expires.append(expires_at)
+            if ids:
+                self.index.add(ids, np.vstack(vectors), keys, expires)
+                self._last_id = ids[-1]
+            self._refreshed_at = time.monotonic()
+
+    def lookup(self, goal: str, planner_version: str = ""):
+        """
+        The unexpired plan cached by this planner version for a goal with the same content
+        words, the most similar one if several, else None.
+        """
+        self.refresh()
+        vector = self.vectorizer.embed(goal)
+        key = self.vectorizer.content_key(goal, planner_version)
+        with self._lock:
+            match = self.index.best(vector, key, time.time())
+        if match is None or match[1] < self.threshold:
+            record_cache("plan", "miss")
+            return None
+
+        plan_id, similarity = match
+        row = self.db.query_one("SELECT goal, plan FROM plan_cache WHERE id = %s", (plan_id,))
+        if not row:
+            return None
+        logger.info("Reusing cached plan for a similar goal.",
+                    extra={"goal": goal, "cached_goal": row['goal'], "similarity": round(similarity, 3)})
+        record_cache("plan", "semantic_hit")
+        plan = row['plan']
+        return json.loads(plan) if isinstance(plan, str) else plan
+
+    def store(self, goal: str, plan: dict, planner_version: str = ""):
+        vector = self.vectorizer.embed(goal)
+        self.db.execute(
+            "INSERT INTO plan_cache (goal, vectorizer, embedding, plan, planner_version, expires_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (goal, self.vectorizer.version, vector.tobytes(), json.dumps(plan), planner_version,
+             time.time() + self.ttl_seconds)
+        )
+        # Picks the new row up through the same path as other processes' plans
+        self.refresh(force=True)
+
+
+_plan_cache = None
+_plan_cache_lock = threading.Lock()
+
+def get_plan_cache() -> SemanticPlanCache:
+    """Creates and reuses the process-wide semantic plan cache."""
+    global _plan_cache
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            _plan_cache = SemanticPlanCache()
+    return _plan_cache
@@ -1,5 +1,5 @@
 # run_generator.py
-import vertexai
+from llm import init_vertex
 from dotenv import load_dotenv
 from agents.agent_generator import AgentGeneratorAgent
 from logger import get_logger
@@ -12,7 +12,7 @@ def main():
     try:
         PROJECT_ID = "ai-engineer-472512" 
         LOCATION = "asia-south1"
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
+        init_vertex(PROJECT_ID, LOCATION)
         logger.info("Vertex AI Initialized.")
     except Exception as e:
         logger.error("Error initializing Vertex AI", extra={"error": str(e)})
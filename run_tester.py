@@ -1,11 +1,13 @@
 # run_tester.py
-import vertexai
+import sys
+from llm import init_vertex
 from agents.tester import TesterAgent
 from dotenv import load_dotenv
 
 # --- IMPORTANT ---
-# Change this to the ID of the task that the CodeWriterAgent completed.
-TASK_TO_TEST = 11 
+# Change this to the ID of the task that the CodeWriterAgent completed,
+# or pass several task IDs on the command line to test them in batches.
+TASK_TO_TEST = 11
 # ---
 
 def main():
@@ -16,7 +18,7 @@ def main():
     try:
         PROJECT_ID = "ai-engineer-472512" 
         LOCATION = "asia-south1"
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
+        init_vertex(PROJECT_ID, LOCATION)
         print("Vertex AI Initialized.")
     except Exception as e:
         print(f"Error initializing Vertex AI: {e}")
@@ -24,7 +26,8 @@ def main():
 
     # Run the agent
     tester = TesterAgent()
-    tester.run_tests_for_task(TASK_TO_TEST)
+    task_ids = [int(arg) for arg in sys.argv[1:]] or [TASK_TO_TEST]
+    tester.run_tests_for_tasks(task_ids)
 
 if __name__ == "__main__":
     main()
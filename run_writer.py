@@ -1,5 +1,5 @@
 # run_writer.py
-import vertexai
+from llm import init_vertex
 from agents.code_writer import CodeWriterAgent
 from dotenv import load_dotenv
 
@@ -16,7 +16,7 @@ def main():
     try:
         PROJECT_ID = "ai-engineer-472512" 
         LOCATION = "asia-south1"
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
+        init_vertex(PROJECT_ID, LOCATION)
         print("Vertex AI Initialized.")
     except Exception as e:
         print(f"Error initializing Vertex AI: {e}")
@@ -0,0 +1,187 @@
+# sandbox_images.py
+import io
+import os
+import ast
+import sys
+import json
+import time
+import hashlib
+import threading
+from executor import IMAGE_ID_REFRESH_SECONDS, SANDBOX_IMAGE, _docker, get_docker_client
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Packages already installed in the base metamorph-tester image
+BASE_PACKAGES = {"pytest", "pytest-mock"}
+
+# A failed image build is not retried for this long; runs use the base image meanwhile
+SANDBOX_BUILD_RETRY_SECONDS = int(os.getenv("SANDBOX_BUILD_RETRY_SECONDS", "600"))
+
+# Import name -> pip distribution. This is an allowlist: the imports come from
+# LLM-generated code and are installed at image build time with network access, so a
+# module that isn't listed is never installed (a hallucinated or typo-squatted name
+# would otherwise pull and run arbitrary code from PyPI) and the run reports
+# ModuleNotFoundError instead. SANDBOX_PACKAGE_INDEX may point at a JSON file with the
+# same shape to replace this list.
+DEFAULT_PACKAGE_INDEX = {
+    "requests": "requests",
+    "httpx": "httpx",
+    "numpy": "numpy",
+    "pandas": "pandas",
+    "matplotlib": "matplotlib",
+    "scipy": "scipy",
+    "flask": "flask",
+    "fastapi": "fastapi",
+    "pydantic": "pydantic",
+    "lxml": "lxml",
+    "bs4": "beautifulsoup4",
+    "yaml": "pyyaml",
+    "PIL": "pillow",
+    "cv2": "opencv-python-headless",
+    "sklearn": "scikit-learn",
+    "dateutil": "python-dateutil",
+    "dotenv": "python-dotenv",
+    "pytest": "pytest",
+    "pytest_mock": "pytest-mock",
+}
+
+_package_index = None
+
+def get_package_index() -> dict:
+    global _package_index
+    if _package_index is None:
+        index_path = os.getenv("SANDBOX_PACKAGE_INDEX")
+        if index_path:
+            with open(index_path) as f:
+                _package_index = json.load(f)
+        else:
+            _package_index = dict(DEFAULT_PACKAGE_INDEX)
+    return _package_index
+
+def detect_imports(code: str) -> set:
+    """Returns the top-level module names a Python source imports (empty if it doesn't parse)."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return set()
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and node.level == 0:
+            modules.add(node.module.split(".")[0])
+    return modules
+
+def required_packages(files: dict) -> set:
+    """Third-party distributions needed by the Python files of a run, minus what the base image has."""
+    local_modules = {os.path.splitext(os.path.basename(name))[0] for name in files if name.endswith(".py")}
+    index = get_package_index()
+    packages = set()
+    for name, content in files.items():
+        if not name.endswith(".py"):
+            continue
+        for module in detect_imports(content):
+            if module in sys.stdlib_module_names or module in local_modules:
+                continue
+            if module not in index:
+                logger.warning("Not installing unknown module; it is not in the package index.",
+                               extra={"module_name": module, "file": name})
+                continue
+            packages.add(index[module])
+    return packages - BASE_PACKAGES
+
+def image_tag_for(packages: set, base_id: str = "") -> str:
+    """The variant's tag, from its packages and the id of the base image it is built on."""
+    digest = hashlib.sha256(f"{base_id}\n{' '.join(sorted(packages))}".encode("utf-8")).hexdigest()[:16]
+    return f"{SANDBOX_IMAGE}:deps-{digest}"
+
+
+class ImageBuilder:
+    """
+    Builds and remembers image variants of the sandbox image with a dependency set
+    pre-installed, so runs never pip-install at execution time. Each package set is
+    built once and then reused from the local Docker image cache; concurrent requests
+    for the same set wait on a single build. A failed build is remembered and not
+    retried for SANDBOX_BUILD_RETRY_SECONDS.
+
+    Variant tags include the base image's id, so rebuilding SANDBOX_IMAGE (a new Python,
+    security patches) makes every variant be rebuilt on top of it on its next use.
+    """
+    def __init__(self, client=None, retry_seconds: float = SANDBOX_BUILD_RETRY_SECONDS):
+        self._client = client
+        self.retry_seconds = retry_seconds
+        self._ready = set()
+        self._failed = {}
+        self._base = (None, 0.0)  # (image id, resolved at)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_docker_client()
+        return self._client
+
+    def _base_id(self) -> str:
+        base_id, resolved_at = self._base
+        if base_id is None or time.monotonic() - resolved_at > IMAGE_ID_REFRESH_SECONDS:
+            base_id = self.client.images.get(SANDBOX_IMAGE).id
+            self._base = (base_id, time.monotonic())
+        return base_id
+
+    def ensure(self, packages: set) -> str:
+        """Returns the tag of an image with `packages` installed, building it if needed."""
+        if not packages:
+            return SANDBOX_IMAGE
+        base_id = self._base_id()
+        tag = image_tag_for(packages, base_id)
+        if tag in self._ready:
+            return tag
+
+        with self._lock:
+            build_lock = self._locks.setdefault(tag, threading.Lock())
+        with build_lock:
+            if tag in self._ready:
+                return tag
+            failed_at, error = self._failed.get(tag, (None, None))
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_seconds:
+                raise RuntimeError(f"Image build for {tag} failed recently: {error}")
+            try:
+                self.client.images.get(tag)
+            except _docker().errors.ImageNotFound:
+                logger.info("Building sandbox image variant.", extra={"tag": tag, "packages": sorted(packages)})
+                # FROM the id, not the tag, so a concurrent base rebuild can't mismatch the tag
+                dockerfile = f"FROM {base_id}\nRUN pip install --no-cache-dir {' '.join(sorted(packages))}\n"
+                try:
+                    self.client.images.build(fileobj=io.BytesIO(dockerfile.encode("utf-8")), tag=tag, rm=True)
+                except Exception as e:
+                    self._failed[tag] = (time.monotonic(), str(e))
+                    raise
+            self._failed.pop(tag, None)
+            self._ready.add(tag)
+        return tag
+
+
+_image_builder = None
+_image_builder_lock = threading.Lock()
+
+def get_image_builder() -> ImageBuilder:
+    global _image_builder
+    with _image_builder_lock:
+        if _image_builder is None:
+            _image_builder = ImageBuilder()
+    return _image_builder
+
+def image_for_files(files: dict) -> str:
+    """
+    Picks the sandbox image for a run from the imports in its files. Falls back to the
+    base image (and logs) if a variant can't be built, so the run itself reports the
+    missing module.
+    """
+    packages = required_packages(files)
+    try:
+        return get_image_builder().ensure(packages)
+    except Exception as e:
+        logger.error("Could not prepare sandbox image variant.", extra={"packages": sorted(packages), "error": str(e)})
+        return SANDBOX_IMAGE
@@ -0,0 +1,210 @@
+# scheduler.py
+import json
+import asyncio
+import concurrent.futures
+from collections import deque
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def parse_dependencies(value) -> list:
+    """Normalizes a stored `dependencies` value (JSON text, jsonb list or NULL) to a list of ints."""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [int(dep) for dep in value]
+
+
+def build_task_graph(tasks) -> dict:
+    """
+    Builds {task_id: [parent task_ids]} for a project's tasks.
+
+    The planner stores dependencies as real task ids. Projects planned before that stored
+    plan-local `task_id`s (1, 2, 3, ...), the 1-based positions of the tasks in insertion
+    order; if any dependency of the project isn't one of its task ids, the project is
+    read that way instead. `tasks` must contain every task of the project ordered by id.
+    """
+    task_ids = {task['id'] for task in tasks}
+    dependencies = {task['id']: parse_dependencies(task['dependencies']) for task in tasks}
+    if all(dep in task_ids for deps in dependencies.values() for dep in deps):
+        resolve = {task_id: task_id for task_id in task_ids}
+    else:
+        resolve = {position: task['id'] for position, task in enumerate(tasks, start=1)}
+
+    graph = {}
+    for task_id, deps in dependencies.items():
+        parents = []
+        for dep in deps:
+            if dep in resolve:
+                parents.append(resolve[dep])
+            else:
+                logger.warning("Ignoring unknown dependency.", extra={"task_id": task_id, "dependency": dep})
+        graph[task_id] = parents
+    return graph
+
+
+class _DAGState:
+    """Bookkeeping shared by the thread and asyncio schedulers: readiness, results and skip propagation."""
+    def __init__(self, graph: dict, completed=(), failed=()):
+        completed = set(completed)
+        failed = set(failed)
+        self.graph = graph
+        self.results = {}
+        self.skipped = []  # (task_id, reason) pairs not yet reported to on_skip
+
+        self.children = {task_id: [] for task_id in graph}
+        self.waiting_on = {}
+        doomed = []
+        for task_id, parents in graph.items():
+            open_parents = set()
+            for parent in parents:
+                if parent in failed:
+                    doomed.append((task_id, parent))
+                elif parent in graph:
+                    open_parents.add(parent)
+                    self.children[parent].append(task_id)
+                elif parent not in completed:
+                    # Neither runnable nor finished (e.g. still pending in another run); treat as failed
+                    doomed.append((task_id, parent))
+            self.waiting_on[task_id] = open_parents
+
+        for task_id, parent in doomed:
+            if task_id not in self.results:
+                reason = f"Dependency {parent} did not complete."
+                self._skip(task_id, reason)
+                self._skip_downstream(task_id, reason)
+
+    def _skip(self, task_id, reason):
+        self.results[task_id] = 'skipped'
+        self.skipped.append((task_id, reason))
+        logger.info("Skipping task.", extra={"task_id": task_id, "reason": reason})
+
+    def _skip_downstream(self, root, reason):
+        queue = deque([root])
+        while queue:
+            current = queue.popleft()
+            for child in self.children[current]:
+                if child not in self.results:
+                    self._skip(child, reason)
+                    queue.append(child)
+
+    def initial_ready(self) -> list:
+        return [task_id for task_id in self.graph if task_id not in self.results and not self.waiting_on[task_id]]
+
+    def mark_completed(self, task_id) -> list:
+        """Records a success and returns the children that just became ready."""
+        self.results[task_id] = 'completed'
+        ready = []
+        for child in self.children[task_id]:
+            self.waiting_on[child].discard(task_id)
+            if not self.waiting_on[child] and child not in self.results:
+                ready.append(child)
+        return ready
+
+    def mark_failed(self, task_id):
+        self.results[task_id] = 'failed'
+        self._skip_downstream(task_id, f"Dependency {task_id} did not complete.")
+
+    def finish(self) -> dict:
+        # Anything left over sits on a dependency cycle and can never become ready
+        for task_id in self.graph:
+            if task_id not in self.results:
+                self._skip(task_id, "Dependency cycle detected.")
+        return self.results
+
+    def drain_skipped(self) -> list:
+        skipped, self.skipped = self.skipped, []
+        return skipped
+
+
+class DAGScheduler:
+    """
+    Runs tasks on a thread pool in dependency order. A task is released the moment all
+    of its parents have completed, and everything downstream of a failed task is skipped
+    without being dispatched.
+    """
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+
+    def run(self, graph: dict, run_task, completed=(), failed=(), on_skip=None) -> dict:
+        """
+        Executes the DAG and returns {task_id: 'completed' | 'failed' | 'skipped'}.
+
+        - graph: maps every runnable task id to the ids it depends on.
+        - run_task: callable(task_id) -> bool, True when the task succeeded.
+        - completed / failed: ids of tasks that already finished outside this run.
+        - on_skip: optional callable(task_id, reason) invoked for every skipped task.
+        """
+        state = _DAGState(graph, completed, failed)
+
+        def report_skips():
+            for task_id, reason in state.drain_skipped():
+                if on_skip:
+                    on_skip(task_id, reason)
+
+        report_skips()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = {executor.submit(run_task, task_id): task_id for task_id in state.initial_ready()}
+
+            while in_flight:
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task_id = in_flight.pop(future)
+                    try:
+                        succeeded = bool(future.result())
+                    except Exception as exc:
+                        logger.error("Task raised an exception.", extra={"task_id": task_id, "exception": str(exc)})
+                        succeeded = False
+
+                    if succeeded:
+                        for child in state.mark_completed(task_id):
+                            in_flight[executor.submit(run_task, child)] = child
+                    else:
+                        state.mark_failed(task_id)
+                        report_skips()
+
+        results = state.finish()
+        report_skips()
+        return results
+
+
+class AsyncDAGScheduler:
+    """
+    The asyncio counterpart of DAGScheduler. Every ready task becomes a coroutine on the
+    event loop; how many of them touch the LLM, sandbox or database at once is governed
+    by the per-resource limits in `concurrency`, not by a worker count.
+    """
+    async def run(self, graph: dict, run_task, completed=(), failed=(), on_skip=None) -> dict:
+        """Same contract as DAGScheduler.run, with `run_task` and `on_skip` as coroutine functions."""
+        state = _DAGState(graph, completed, failed)
+
+        async def report_skips():
+            for task_id, reason in state.drain_skipped():
+                if on_skip:
+                    await on_skip(task_id, reason)
+
+        await report_skips()
+        in_flight = {asyncio.ensure_future(run_task(task_id)): task_id for task_id in state.initial_ready()}
+
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                task_id = in_flight.pop(future)
+                try:
+                    succeeded = bool(future.result())
+                except Exception as exc:
+                    logger.error("Task raised an exception.", extra={"task_id": task_id, "exception": str(exc)})
+                    succeeded = False
+
+                if succeeded:
+                    for child in state.mark_completed(task_id):
+                        in_flight[asyncio.ensure_future(run_task(child))] = child
+                else:
+                    state.mark_failed(task_id)
+                    await report_skips()
+
+        results = state.finish()
+        await report_skips()
+        return results
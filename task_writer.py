@@ -0,0 +1,217 @@
+# task_writer.py
+import os
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+from db_manager import DBManager
+from concurrency import run_blocking
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Opt-in: buffer task state updates and commit them in batches instead of one commit per update
+TASK_WRITE_BEHIND = os.getenv("TASK_WRITE_BEHIND") == "1"
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "200"))
+
+# The task columns agents record their outcome in, in the order they are written
+TASK_FIELDS = ("code", "output", "status", "test_status")
+
+# The worker whose lease the current task runs under (see worker.py). While set, outcome
+# writes only land if that worker still holds the lease, so a worker whose lease expired
+# and was reclaimed cannot overwrite the outcome of the task's new run.
+_lease_owner = contextvars.ContextVar("task_lease_owner", default=None)
+
+@contextmanager
+def task_lease(worker_id: str):
+    token = _lease_owner.set(worker_id)
+    try:
+        yield
+    finally:
+        _lease_owner.reset(token)
+
+
+def _fields_in_order(fields: dict) -> list:
+    unknown = set(fields) - set(TASK_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown task fields: {sorted(unknown)}")
+    return [name for name in TASK_FIELDS if name in fields]
+
+def _update_statement(task_id: int, fields: dict) -> tuple:
+    names = _fields_in_order(fields)
+    assignments = ", ".join(f"{name} = %s" for name in names)
+    sql, params = f"UPDATE tasks SET {assignments} WHERE id = %s", tuple(fields[name] for name in names) + (task_id,)
+    lease_owner = _lease_owner.get()
+    if lease_owner is not None:
+        sql, params = sql + " AND lease_owner = %s", params + (lease_owner,)
+    return sql, params
+
+def write_task_now(db, task_id: int, fields: dict):
+    """Writes one task's fields with a single UPDATE (committed unless inside a transaction)."""
+    db.execute(*_update_statement(task_id, fields))
+
+
+class TaskWriter:
+    """
+    Write-behind buffer for task state. Updates to the same task are coalesced (later
+    fields win) and a background thread commits everything buffered in one transaction
+    when `batch_size` tasks are waiting or `flush_interval` seconds have passed, so many
+    parallel tasks share a commit instead of paying one each.
+
+    `pending_status()` exposes buffered statuses, so readers in this process see a
+    task's outcome before it reaches the database. A caller that must not proceed until
+    its write is committed passes `durable=True` (or calls `flush()`).
+    """
+    def __init__(self, db: DBManager = None, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_MS / 1000):
+        self.db = db or DBManager()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="task-writer", daemon=True)
+            self._thread.start()
+
+    def update(self, task_id: int, durable: bool = False, **fields):
+        _fields_in_order(fields)
+        lease_owner = _lease_owner.get()
+        if lease_owner is not None:
+            fields["lease_owner"] = lease_owner
+        with self._lock:
+            self._buffer.setdefault(task_id, {}).update(fields)
+            full = len(self._buffer) >= self.batch_size
+            self._ensure_thread()
+        if durable:
+            self.flush()
+        elif full:
+            self._wake.set()
+
+    def pending_status(self, task_id: int):
+        """The task's status if an update for it is buffered or being written, else None."""
+        with self._lock:
+            for fields in (self._buffer.get(task_id), self._inflight.get(task_id)):
+                if fields and "status" in fields:
+                    return fields["status"]
+        return None
+
+    def _write(self, batch: dict):
+        # One UPDATE ... FROM (VALUES ...) per distinct set of columns, all in one commit
+        # Updates made under a lease carry its owner and only apply while it still holds it
+        groups = {}
+        for task_id, fields in batch.items():
+            fields = dict(fields)
+            lease_owner = fields.pop("lease_owner", None)
+            names = tuple(_fields_in_order(fields))
+            key = (task_id, lease_owner) if lease_owner is not None else (task_id,)
+            groups.setdefault((names, lease_owner is not None), []).append(key + tuple(fields[name] for name in names))
+        with self.db.transaction():
+            for (names, leased), rows in groups.items():
+                assignments = ", ".join(f"{name} = data.{name}" for name in names)
+                columns = ("id", "lease_owner") + names if leased else ("id",) + names
+                condition = "tasks.id = data.id" + (" AND tasks.lease_owner = data.lease_owner" if leased else "")
+                self.db.execute_values(
+                    f"UPDATE tasks SET {assignments} FROM (VALUES %s) AS data ({', '.join(columns)}) WHERE {condition}",
+                    rows
+                )
+
+    def flush(self) -> int:
+        """Commits everything buffered so far and returns the number of tasks written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, {}
+                self._inflight = batch
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except Exception:
+                # Keep the updates for the next attempt, under anything newer that arrived meanwhile
+                with self._lock:
+                    for task_id, fields in batch.items():
+                        self._buffer[task_id] = {**fields, **self._buffer.get(task_id, {})}
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+            return len(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Write-behind flush failed; will retry.", extra={"error": str(e)})
+
+    def close(self):
+        """Stops the background thread and commits whatever is still buffered."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        written = self.flush()
+        if written:
+            logger.info("Flushed buffered task updates on shutdown.", extra={"tasks": written})
+
+
+_task_writer = None
+_task_writer_lock = threading.Lock()
+
+def get_task_writer() -> TaskWriter:
+    """Creates and reuses the process-wide write-behind writer, flushed at interpreter exit."""
+    global _task_writer
+    with _task_writer_lock:
+        if _task_writer is None:
+            _task_writer = TaskWriter()
+            atexit.register(_task_writer.close)
+    return _task_writer
+
+def update_task(db, task_id: int, durable: bool = False, **fields):
+    """
+    Records a task's state, e.g. update_task(db, 7, output=..., status='completed').
+    Written immediately through `db` unless TASK_WRITE_BEHIND is on.
+    """
+    if TASK_WRITE_BEHIND:
+        get_task_writer().update(task_id, durable=durable, **fields)
+    else:
+        write_task_now(db, task_id, fields)
+
+async def update_task_async(async_db, task_id: int, durable: bool = False, **fields):
+    if TASK_WRITE_BEHIND and not durable:
+        get_task_writer().update(task_id, **fields)
+    elif TASK_WRITE_BEHIND:
+        await run_blocking("db", get_task_writer().update, task_id, durable=True, **fields)
+    else:
+        await async_db.execute(*_update_statement(task_id, fields))
+
+def task_status(db, task_id: int):
+    """A task's current status, including an outcome still waiting in the write-behind buffer."""
+    if TASK_WRITE_BEHIND:
+        status = get_task_writer().pending_status(task_id)
+        if status is not None:
+            return status
+    row = db.query_one("SELECT status FROM tasks WHERE id = %s", (task_id,))
+    return row['status'] if row else None
+
+async def task_status_async(async_db, task_id: int):
+    if TASK_WRITE_BEHIND:
+        status = get_task_writer().pending_status(task_id)
+        if status is not None:
+            return status
+    row = await async_db.query_one("SELECT status FROM tasks WHERE id = %s", (task_id,))
+    return row['status'] if row else None
+
+def flush_task_writes():
+    """Makes every buffered update visible in the database before reading other tasks' state."""
+    if TASK_WRITE_BEHIND:
+        get_task_writer().flush()
@@ -0,0 +1,20 @@
+# tests/conftest.py
+import pytest
+import llm
+from cache import get_generation_cache, get_sandbox_result_cache
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """
+    Keeps memoized LLM generations and sandbox results, and per-model circuit breakers
+    and latency history, from leaking between tests.
+    """
+    get_generation_cache().clear()
+    get_sandbox_result_cache().clear()
+    llm._breakers.clear()
+    llm._latency_trackers.clear()
+    yield
+    get_generation_cache().clear()
+    get_sandbox_result_cache().clear()
+    llm._breakers.clear()
+    llm._latency_trackers.clear()
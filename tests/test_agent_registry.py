@@ -0,0 +1,97 @@
+# tests/test_agent_registry.py
+import os
+import sys
+import time
+import threading
+import pytest
+import agent_registry
+from agent_registry import AgentRegistry, task_type_for
+
+AGENT_SOURCE = """
+class {name}:
+    version = {version}
+
+    def execute_task(self, task_id: int):
+        return task_id
+"""
+
+@pytest.fixture
+def plugin_dir(tmp_path, monkeypatch):
+    package_dir = tmp_path / "plugin_agents"
+    package_dir.mkdir()
+    (package_dir / "__init__.py").write_text("")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield package_dir
+    for name in [m for m in sys.modules if m.startswith("plugin_agents")]:
+        del sys.modules[name]
+
+def write_agent(package_dir, file_name, name, version=1):
+    path = package_dir / file_name
+    path.write_text(AGENT_SOURCE.format(name=name, version=version))
+    # Make the change visible even on filesystems with coarse timestamps
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + version * 1_000_000_000))
+
+def make_registry(mocker, package_dir, agent_names=()):
+    mock_db_instance = mocker.MagicMock()
+    mock_db_instance.query_all.return_value = [{'name': name} for name in agent_names]
+    return AgentRegistry(db=mock_db_instance, agents_dir=str(package_dir), package="plugin_agents"), mock_db_instance
+
+def test_task_type_for_generated_agent_names():
+    assert task_type_for("OpenMeteoWeatherAgent") == "open_meteo_weather"
+
+def test_generated_agent_is_imported_on_first_dispatch_and_cached(mocker, plugin_dir):
+    write_agent(plugin_dir, "open_meteo_weather_agent.py", "OpenMeteoWeatherAgent")
+    registry, _ = make_registry(mocker, plugin_dir, ["OpenMeteoWeatherAgent"])
+
+    assert "open_meteo_weather" in registry
+    assert "plugin_agents.open_meteo_weather_agent" not in sys.modules
+
+    agent = registry["open_meteo_weather"]
+    assert agent.execute_task(5) == 5
+    assert registry["open_meteo_weather"] is agent
+
+def test_new_agent_is_picked_up_without_a_restart(mocker, plugin_dir, monkeypatch):
+    monkeypatch.setattr(agent_registry, "MISS_REFRESH_SECONDS", 0)
+    registry, mock_db_instance = make_registry(mocker, plugin_dir)
+    assert "file_sorter" not in registry
+
+    write_agent(plugin_dir, "file_sorter_agent.py", "FileSorterAgent")
+    mock_db_instance.query_all.return_value = [{'name': 'FileSorterAgent'}]
+
+    assert registry["file_sorter"].version == 1
+
+def test_changed_module_is_reloaded(mocker, plugin_dir):
+    write_agent(plugin_dir, "file_sorter_agent.py", "FileSorterAgent")
+    registry, _ = make_registry(mocker, plugin_dir, ["FileSorterAgent"])
+    first = registry["file_sorter"]
+
+    write_agent(plugin_dir, "file_sorter_agent.py", "FileSorterAgent", version=2)
+    second = registry["file_sorter"]
+
+    assert second is not first and second.version == 2
+
+def test_builtin_task_types_are_always_registered(mocker, plugin_dir):
+    registry, mock_db_instance = make_registry(mocker, plugin_dir)
+    mock_db_instance.query_all.side_effect = Exception("database is down")
+
+    registry.refresh()
+
+    assert {"code_writing", "repo_init", "documentation", "api_integration"} <= set(registry.task_types())
+
+def test_loaded_agent_is_served_while_a_rescan_is_blocked(mocker, plugin_dir):
+    write_agent(plugin_dir, "file_sorter_agent.py", "FileSorterAgent")
+    registry, mock_db_instance = make_registry(mocker, plugin_dir, ["FileSorterAgent"])
+    agent = registry["file_sorter"]
+
+    release = threading.Event()
+    mock_db_instance.query_all.side_effect = lambda *args: release.wait(5) and []
+    rescan = threading.Thread(target=registry.refresh)
+    rescan.start()
+    try:
+        started = time.monotonic()
+        assert registry["file_sorter"] is agent
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        rescan.join()
@@ -0,0 +1,34 @@
+# tests/test_archive.py
+import io
+import tarfile
+from executor import _build_archive, _fetch_artifacts
+
+def test_archive_contains_files_and_parent_directories():
+    archive = _build_archive({'main.py': "print('hi')", 'task_1/tests/test_main.py': "def test(): pass"})
+
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        names = tar.getnames()
+        assert tar.extractfile('main.py').read() == b"print('hi')"
+
+    assert names.index('task_1') < names.index('task_1/tests') < names.index('task_1/tests/test_main.py')
+
+def test_fetch_artifacts_reads_archives_back(mocker):
+    container = mocker.MagicMock()
+    archive = _build_archive({'report.xml': "<testsuites/>"})
+    container.get_archive.return_value = (iter([archive[:100], archive[100:]]), {})
+
+    assert _fetch_artifacts(container, ['report.xml']) == {'report.xml': "<testsuites/>"}
+    container.get_archive.assert_called_once_with('/app/report.xml')
+
+def test_fetch_artifacts_keys_nested_paths_by_the_requested_path(mocker):
+    container = mocker.MagicMock()
+    # get_archive names members relative to the requested path's parent
+    archives = {
+        '/app/out/a.json': _build_archive({'a.json': "out"}),
+        '/app/logs/a.json': _build_archive({'a.json': "logs"}),
+        '/app/build/reports': _build_archive({'reports/t.xml': "<testsuites/>"}),
+    }
+    container.get_archive.side_effect = lambda path: (iter([archives[path]]), {})
+
+    assert _fetch_artifacts(container, ['out/a.json', 'logs/a.json', 'build/reports']) == {
+        'out/a.json': "out", 'logs/a.json': "logs", 'build/reports/t.xml': "<testsuites/>"}
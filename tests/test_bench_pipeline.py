@@ -0,0 +1,39 @@
+# tests/test_bench_pipeline.py
+import pytest
+from benchmarks.bench_pipeline import FakeSandbox, Latency, SQLiteDBManager, make_plan, offline, run_pipeline
+
+def test_plan_is_a_dag_ending_in_documentation():
+    tasks = make_plan(20)['tasks']
+    assert [t['task_id'] for t in tasks] == list(range(1, 21))
+    assert all(dep < t['task_id'] for t in tasks for dep in t['dependencies'])
+    assert tasks[-1]['task_type'] == 'documentation' and tasks[-1]['dependencies']
+
+def test_latency_is_reproducible_per_key():
+    latency = Latency("lognormal:0.5,0.4", seed=3)
+    assert latency.sample("a") == latency.sample("a")
+    assert Latency("uniform:1,2").sample("x") >= 1
+    with pytest.raises(ValueError):
+        Latency("normal:1")
+
+@pytest.mark.parametrize("mode", ["thread", "async"])
+def test_pipeline_runs_offline_end_to_end(mode):
+    result = run_pipeline(tasks=12, workers=4, mode=mode, trace_memory=False)
+
+    assert result['completed'] == 12
+    assert result['tasks_per_sec'] > 0
+    assert result['p50_ms'] <= result['p99_ms']
+
+def test_failed_root_skips_the_rest_of_the_plan():
+    result = run_pipeline(tasks=6, workers=2, sandbox=FakeSandbox(fail_rate=1.0), trace_memory=False)
+    assert (result['completed'], result['failed'], result['skipped']) == (0, 1, 5)
+
+def test_sqlite_stand_in_stores_remapped_dependencies():
+    from agents.orchestrator import ChiefOrchestratorAgent
+    import benchmarks.bench_pipeline as bench
+
+    with offline(make_plan(4), Latency(), FakeSandbox()):
+        bench._reset_database("sqlite")
+        ChiefOrchestratorAgent().plan_and_store_tasks(1, "goal")
+        rows = SQLiteDBManager().query_all("SELECT id, dependencies FROM tasks ORDER BY id")
+
+    assert [(row['id'], row['dependencies']) for row in rows] == [(1, '[]'), (2, '[1]'), (3, '[1]'), (4, '[2, 3]')]
@@ -0,0 +1,58 @@
+# tests/test_cache.py
+from cache import TwoTierCache, cache_generation, get_generation_cache
+
+class FakeAgent:
+    def __init__(self, model_name="gemini-1.5-pro"):
+        self.model_name = model_name
+        self.calls = 0
+
+    @cache_generation(prompt_version="1", cache_if=lambda text: not text.startswith("error"))
+    def _generate(self, prompt: str) -> str:
+        self.calls += 1
+        return "error" if prompt == "bad" else f"code for {prompt}"
+
+def test_repeated_generation_hits_local_tier(mocker):
+    mocker.patch('cache.get_redis_client', return_value=None)
+    agent = FakeAgent()
+    stats_before = dict(get_generation_cache().stats)
+
+    assert agent._generate("hello") == "code for hello"
+    assert agent._generate("hello") == "code for hello"
+
+    assert agent.calls == 1
+    assert get_generation_cache().stats["local_hits"] == stats_before["local_hits"] + 1
+
+def test_model_name_is_part_of_the_key(mocker):
+    mocker.patch('cache.get_redis_client', return_value=None)
+    pro, flash = FakeAgent("gemini-1.5-pro"), FakeAgent("gemini-1.5-flash")
+    pro._generate("hello")
+    flash._generate("hello")
+    assert pro.calls == 1 and flash.calls == 1
+
+def test_error_results_are_not_cached(mocker):
+    mocker.patch('cache.get_redis_client', return_value=None)
+    agent = FakeAgent()
+    agent._generate("bad")
+    agent._generate("bad")
+    assert agent.calls == 2
+
+def test_remote_tier_uses_hashed_keys(mocker):
+    mock_redis = mocker.MagicMock()
+    mock_redis.get.return_value = None
+    mocker.patch('cache.get_redis_client', return_value=mock_redis)
+
+    FakeAgent()._generate("my secret prompt")
+
+    key = mock_redis.setex.call_args[0][0]
+    assert key.startswith("gen:") and "secret" not in key
+
+def test_lru_evicts_oldest_entry():
+    cache = TwoTierCache(max_entries=2)
+    cache.put_local("a", 1)
+    cache.put_local("b", 2)
+    cache.get_local("a")
+    cache.put_local("c", 3)
+
+    assert cache.get_local("b") is None
+    assert cache.get_local("a") == 1
+    assert cache.stats["evictions"] == 1
@@ -1,4 +1,5 @@
 # tests/test_code_writer.py
+import asyncio
 import pytest
 from agents.code_writer import CodeWriterAgent
 
@@ -19,7 +20,7 @@ def test_execute_task_success(mocker):
     mock_gemini_response.text = "print('Hello, World!')"
     mock_gemini_model_instance = mocker.MagicMock()
     mock_gemini_model_instance.generate_content.return_value = mock_gemini_response
-    mocker.patch('agents.code_writer.GenerativeModel', return_value=mock_gemini_model_instance)
+    mocker.patch('agents.code_writer.get_model', return_value=mock_gemini_model_instance)
     
     # Mock the sandbox executor's response
     mock_executor_result = {'stdout': 'Hello, World!', 'stderr': '', 'exit_code': 0}
@@ -39,3 +40,60 @@ def test_execute_task_success(mocker):
     update_args = mock_db_instance.execute.call_args[0]
     update_status = update_args[1][2] # The status is the 3rd element in the params tuple
     assert update_status == 'completed'
+
+def test_execute_task_async_success(mocker):
+    """
+    The asyncio variant goes through the async model call and sandbox and records the
+    same 'completed' update as the blocking path.
+    """
+    mock_db_instance = mocker.MagicMock()
+    mock_db_instance.query_one.return_value = {'description': 'Create a hello world script.'}
+    mocker.patch('agents.code_writer.DBManager', return_value=mock_db_instance)
+
+    mock_gemini_response = mocker.MagicMock()
+    mock_gemini_response.text = "```python\nprint('Hello, World!')\n```"
+    mock_gemini_model_instance = mocker.MagicMock()
+    mock_gemini_model_instance.generate_content_async = mocker.AsyncMock(return_value=mock_gemini_response)
+    mocker.patch('agents.code_writer.get_model', return_value=mock_gemini_model_instance)
+
+    mock_executor_result = {'stdout': 'Hello, World!', 'stderr': '', 'exit_code': 0}
+    mocker.patch('agents.code_writer.run_in_sandbox_async', mocker.AsyncMock(return_value=mock_executor_result))
+
+    code_writer_agent = CodeWriterAgent()
+    asyncio.run(code_writer_agent.execute_task_async(task_id=1))
+
+    update_args = mock_db_instance.execute.call_args[0]
+    assert update_args[1][0] == "print('Hello, World!')"
+    assert update_args[1][2] == 'completed'
+
+def test_execute_task_streaming_stops_at_closing_fence(mocker):
+    """
+    With streaming enabled the agent stops reading the model stream at the closing
+    fence and runs the code without waiting for trailing text.
+    """
+    mock_db_instance = mocker.MagicMock()
+    mock_db_instance.query_one.return_value = {'description': 'Create a hello world script.'}
+    mocker.patch('agents.code_writer.DBManager', return_value=mock_db_instance)
+    mocker.patch('agents.code_writer.LLM_STREAMING', True)
+    mocker.patch('agents.code_writer.prewarm_sandbox')
+
+    chunks = [mocker.MagicMock(text=text) for text in ("```python\nprint('Hello, ", "World!')\n```\n", "Trailing prose.")]
+    consumed = []
+
+    def stream(prompt, stream=False):
+        for chunk in chunks:
+            consumed.append(chunk)
+            yield chunk
+
+    mock_gemini_model_instance = mocker.MagicMock()
+    mock_gemini_model_instance.generate_content.side_effect = stream
+    mocker.patch('agents.code_writer.get_model', return_value=mock_gemini_model_instance)
+
+    mock_executor_result = {'stdout': 'Hello, World!', 'stderr': '', 'exit_code': 0}
+    mock_run = mocker.patch('agents.code_writer.run_in_sandbox', return_value=mock_executor_result)
+
+    CodeWriterAgent().execute_task(task_id=1)
+
+    assert len(consumed) == 2
+    assert mock_run.call_args[0][1] == {'main.py': "print('Hello, World!')"}
+    assert mock_db_instance.execute.call_args[0][1][2] == 'completed'
@@ -0,0 +1,105 @@
+# tests/test_dashboard.py
+import threading
+import pytest
+import dashboard
+
+class FakeListener:
+    def __init__(self):
+        self.connected = threading.Event()
+        self.connected.set()
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return lambda: self.subscribers.remove(callback)
+
+@pytest.fixture
+def client(mocker):
+    mocker.patch('dashboard.get_task_event_listener', return_value=FakeListener())
+    mocker.patch('dashboard._subscribed', False)
+    dashboard.page_cache.invalidate()
+    mock_db_instance = mocker.patch('dashboard.db')
+    yield dashboard.app.test_client(), mock_db_instance
+    dashboard.page_cache.invalidate()
+
+def task_rows(*ids):
+    return [{'id': i, 'project_id': 1, 'task_type': 'code_writing', 'description': f'task {i}', 'status': 'pending'} for i in ids]
+
+def test_api_pages_by_keyset_with_filters(client):
+    test_client, mock_db_instance = client
+    mock_db_instance.query_all.return_value = task_rows(90, 80, 70)
+
+    body = test_client.get('/api/tasks?project_id=1&status=pending&before=100&limit=2').get_json()
+
+    sql, params = mock_db_instance.query_all.call_args.args
+    assert "project_id = %s AND status = %s AND id < %s" in sql and "ORDER BY id DESC" in sql
+    assert params == (1, 'pending', 100, 3)
+    assert [t['id'] for t in body['tasks']] == [90, 80]
+    assert body['next_before'] == 80
+
+def test_unchanged_page_is_a_304_without_a_query(client):
+    test_client, mock_db_instance = client
+    mock_db_instance.query_all.return_value = task_rows(3, 2, 1)
+    etag = test_client.get('/api/tasks').headers['ETag']
+
+    response = test_client.get('/api/tasks', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert mock_db_instance.query_all.call_count == 1
+
+def test_task_event_invalidates_cached_pages(client):
+    test_client, mock_db_instance = client
+    mock_db_instance.query_all.return_value = task_rows(1)
+    test_client.get('/api/tasks')
+    listener = dashboard.get_task_event_listener()
+
+    for callback in listener.subscribers:
+        callback({"op": "update", "id": 1, "status": "completed"})
+    test_client.get('/api/tasks')
+
+    assert mock_db_instance.query_all.call_count == 2
+
+def send(event):
+    for callback in dashboard.get_task_event_listener().subscribers:
+        callback(event)
+
+def test_events_only_invalidate_the_pages_they_can_change(client):
+    test_client, mock_db_instance = client
+    mock_db_instance.query_all.return_value = task_rows(1)
+    urls = ['/api/tasks?project_id=1', '/api/tasks?project_id=2', '/api/tasks?before=50', '/api/tasks?status=failed']
+    for url in urls:
+        test_client.get(url)
+    assert mock_db_instance.query_all.call_count == 4
+
+    # A new pending task in project 1: only the unfiltered first page of project 1 can show it
+    send({"op": "insert", "id": 100, "project_id": 1, "status": "pending", "previous_status": None})
+    for url in urls:
+        test_client.get(url)
+    assert mock_db_instance.query_all.call_count == 5
+
+    # An older task of project 2 failing touches project 2, older pages and the 'failed' filter
+    send({"op": "update", "id": 10, "project_id": 2, "status": "failed", "previous_status": "running"})
+    for url in urls:
+        test_client.get(url)
+    assert mock_db_instance.query_all.call_count == 8
+
+    # A reconnect may have missed events, so everything is reloaded
+    send({"op": "reconnect"})
+    for url in urls:
+        test_client.get(url)
+    assert mock_db_instance.query_all.call_count == 12
+
+def test_page_loaded_during_an_unrelated_event_is_still_cached(client):
+    test_client, mock_db_instance = client
+
+    def load_while_an_event_arrives(*args):
+        send({"op": "update", "id": 5, "project_id": 2, "status": "completed", "previous_status": "running"})
+        return task_rows(1)
+    mock_db_instance.query_all.side_effect = load_while_an_event_arrives
+
+    test_client.get('/api/tasks?project_id=1')
+    test_client.get('/api/tasks?project_id=1')
+    test_client.get('/api/tasks?project_id=2')
+    test_client.get('/api/tasks?project_id=2')
+
+    assert mock_db_instance.query_all.call_count == 3
@@ -0,0 +1,81 @@
+# tests/test_db_manager.py
+import threading
+import pytest
+import psycopg2.pool
+from db_manager import DBManager
+
+@pytest.fixture
+def mock_pool(mocker):
+    pool = mocker.MagicMock()
+    conn = mocker.MagicMock()
+    conn.closed = 0
+    pool.getconn.return_value = conn
+    mocker.patch('db_manager.get_connection_pool', return_value=pool)
+    return pool, conn
+
+def test_execute_borrows_and_commits(mock_pool):
+    pool, conn = mock_pool
+    DBManager().execute("UPDATE tasks SET status = %s", ('completed',))
+
+    conn.commit.assert_called_once()
+    pool.putconn.assert_called_once_with(conn, close=False)
+
+def test_transaction_shares_one_commit(mock_pool):
+    pool, conn = mock_pool
+    db = DBManager()
+    with db.transaction():
+        db.execute("UPDATE tasks SET status = 'failed' WHERE id = 1")
+        db.execute("UPDATE tasks SET status = 'failed' WHERE id = 2")
+
+    assert pool.getconn.call_count == 1
+    conn.commit.assert_called_once()
+
+def test_transaction_rolls_back_on_error(mock_pool):
+    pool, conn = mock_pool
+    db = DBManager()
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.execute("UPDATE tasks SET status = 'failed' WHERE id = 1")
+            raise RuntimeError("boom")
+
+    conn.commit.assert_not_called()
+    conn.rollback.assert_called_once()
+    pool.putconn.assert_called_once()
+
+def test_iter_query_streams_through_a_named_cursor(mock_pool):
+    pool, conn = mock_pool
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.__iter__.return_value = iter([(1, 'pending'), (2, 'completed')])
+
+    rows = DBManager().iter_query("SELECT id, status FROM tasks", fetch_size=500, row_type="tuple")
+    pool.getconn.assert_not_called()  # nothing runs until iteration starts
+
+    assert list(rows) == [(1, 'pending'), (2, 'completed')]
+    assert conn.cursor.call_args.kwargs['name'].startswith("stream_")
+    assert cur.itersize == 500
+    conn.commit.assert_called_once()
+    pool.putconn.assert_called_once_with(conn, close=False)
+
+def test_exhausted_pool_waits_for_a_free_connection_then_times_out(mock_pool, mocker):
+    mocker.patch('db_manager._pool_slots', threading.BoundedSemaphore(1))
+    mocker.patch('db_manager.DB_POOL_TIMEOUT_SECONDS', 0.05)
+    pool, conn = mock_pool
+    db = DBManager()
+    errors = []
+
+    def borrow():
+        try:
+            db.execute("SELECT 1")
+        except psycopg2.pool.PoolError as e:
+            errors.append(e)
+
+    with db.transaction():
+        # The only connection is checked out by this thread, so another thread's query times out
+        thread = threading.Thread(target=borrow)
+        thread.start()
+        thread.join()
+    assert len(errors) == 1 and pool.getconn.call_count == 1
+
+    # Once it is returned, the next borrower gets it
+    borrow()
+    assert len(errors) == 1 and pool.getconn.call_count == 2
@@ -0,0 +1,19 @@
+# tests/test_dispatcher.py
+import asyncio
+from dispatcher import dispatch_task, dispatch_task_async
+
+def test_missing_task_is_logged_and_not_dispatched(mocker):
+    mock_db_instance = mocker.MagicMock()
+    mock_db_instance.query_one.return_value = None
+    agents = {"code_writing": mocker.MagicMock()}
+
+    assert dispatch_task(mock_db_instance, agents, 404) is False
+    agents["code_writing"].execute_task.assert_not_called()
+
+def test_missing_task_is_not_dispatched_in_async_mode(mocker):
+    async_db = mocker.MagicMock()
+    async_db.query_one = mocker.AsyncMock(return_value=None)
+    agents = {"code_writing": mocker.MagicMock()}
+
+    assert asyncio.run(dispatch_task_async(async_db, agents, 404)) is False
+    agents["code_writing"].execute_task.assert_not_called()
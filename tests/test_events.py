@@ -0,0 +1,48 @@
+# tests/test_events.py
+import threading
+from collections import namedtuple
+from events import TaskEventListener
+from worker import TaskWorker
+
+Notify = namedtuple("Notify", "pid channel payload")
+
+class FakeConnection:
+    def __init__(self, payloads):
+        self.notifies = [Notify(1, "task_events", payload) for payload in payloads]
+
+    def poll(self):
+        pass
+
+def test_notifications_are_decoded_and_fanned_out():
+    listener = TaskEventListener()
+    received = []
+    listener._subscribers = [received.append, lambda event: 1 / 0]
+
+    listener._drain(FakeConnection(['{"op": "update", "id": 7, "status": "completed"}', 'not json']))
+
+    assert received[0] == {"op": "update", "id": 7, "status": "completed"}
+    assert received[1]["op"] == "unknown"
+
+def test_idle_worker_waits_for_a_task_event_instead_of_polling(mocker):
+    worker = TaskWorker(db=mocker.MagicMock(), agents={}, worker_id="test-worker")
+    stop, wake = threading.Event(), threading.Event()
+    attempts = []
+
+    def run_one():
+        attempts.append(1)
+        if len(attempts) == 2:
+            stop.set()  # as the signal handler does
+            wake.set()
+        return False
+
+    mocker.patch.object(worker, 'reclaim_expired_leases')
+    mocker.patch.object(worker, 'run_one', side_effect=run_one)
+    thread = threading.Thread(target=worker.run_forever, args=(stop, wake))
+    thread.start()
+
+    thread.join(timeout=0.2)
+    assert thread.is_alive() and len(attempts) == 1  # parked until something happens
+
+    wake.set()
+    thread.join(timeout=2)
+    assert not thread.is_alive() and len(attempts) == 2
@@ -0,0 +1,75 @@
+# tests/test_executor_pool.py
+from executor import ContainerPool
+
+def make_client(mocker):
+    """A fake Docker client whose containers are always running and exec successfully."""
+    client = mocker.MagicMock()
+    counter = iter(range(1000))
+
+    def create(**kwargs):
+        container = mocker.MagicMock()
+        container.id = f"c{next(counter)}"
+        container.status = "running"
+        container.exec_run.return_value = mocker.MagicMock(exit_code=0)
+        return container
+
+    client.containers.create.side_effect = create
+    return client
+
+def test_released_container_is_reused(mocker):
+    client = make_client(mocker)
+    pool = ContainerPool(client=client, pool_size=1, max_uses=10)
+
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+
+    assert second is first
+    assert client.containers.create.call_count == 1
+
+def test_pool_is_keyed_by_network_mode(mocker):
+    client = make_client(mocker)
+    pool = ContainerPool(client=client, pool_size=1, max_uses=10)
+
+    offline = pool.acquire(network_enabled=False)
+    pool.release(offline, network_enabled=False)
+    online = pool.acquire(network_enabled=True)
+
+    assert online is not offline
+    assert client.containers.create.call_args.kwargs['network_disabled'] is False
+
+def test_container_recycled_after_max_uses(mocker):
+    client = make_client(mocker)
+    pool = ContainerPool(client=client, pool_size=1, max_uses=2)
+
+    container = pool.acquire()
+    pool.release(container)
+    assert pool.acquire() is container
+    pool.release(container)
+
+    container.remove.assert_called_once_with(force=True)
+    assert pool.acquire() is not container
+
+def test_unhealthy_container_is_replaced(mocker):
+    client = make_client(mocker)
+    pool = ContainerPool(client=client, pool_size=1, max_uses=10)
+
+    container = pool.acquire()
+    pool.release(container)
+    container.status = "exited"
+
+    assert pool.acquire() is not container
+    container.remove.assert_called_once_with(force=True)
+
+def test_container_with_leftover_processes_is_recycled(mocker):
+    client = make_client(mocker)
+    pool = ContainerPool(client=client, pool_size=1, max_uses=10)
+
+    container = pool.acquire()
+    container.exec_run.return_value = mocker.MagicMock(exit_code=1)  # the reset found a stray process
+    pool.release(container)
+
+    reset_script = container.exec_run.call_args.args[0][2]
+    assert "/proc/" in reset_script and "/tmp" in reset_script
+    container.remove.assert_called_once_with(force=True)
+    assert pool.acquire() is not container
@@ -0,0 +1,253 @@
+# tests/test_llm.py
+import asyncio
+import threading
+import time
+import subprocess
+import concurrent.futures
+import sys
+import pytest
+from prometheus_client import REGISTRY
+import llm
+from llm import (CircuitBreaker, CodeFenceStripper, LLMDeadlineExceeded, LLMQueueTimeout, LLMRateLimiter, LLMUnavailableError,
+                 generate, generate_async, get_model, get_rate_limiter)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_requests_per_minute_bucket_refills_over_time():
+    clock = FakeClock()
+    limiter = LLMRateLimiter(rpm=2, tpm=10_000, max_in_flight=10, clock=clock)
+    limiter.acquire(10)
+    limiter.acquire(10)
+
+    with limiter._cond:
+        ticket = limiter._enqueue(0)
+        assert limiter._try_take(ticket, 10) == 30.0
+        clock.now = 30.0
+        assert limiter._try_take(ticket, 10) is None
+
+def test_token_estimate_and_usage_reconciliation():
+    clock = FakeClock()
+    limiter = LLMRateLimiter(rpm=100, tpm=1000, max_in_flight=10, clock=clock)
+    charged = limiter.acquire(400)
+    limiter.release(charged, actual_tokens=900)
+
+    # 1000 - 400 charged - 500 under-estimated leaves 100, so a 400-token call waits for 300 more
+    with limiter._cond:
+        ticket = limiter._enqueue(0)
+        assert limiter._try_take(ticket, 400) == 18.0
+
+def test_queued_calls_start_in_priority_order():
+    limiter = LLMRateLimiter(rpm=1000, tpm=1_000_000, max_in_flight=1)
+    held = limiter.acquire(1)
+    order = []
+
+    def call(priority):
+        limiter.acquire(1, priority=priority)
+        order.append(priority)
+        limiter.release(1)
+
+    threads = [threading.Thread(target=call, args=(priority,)) for priority in (5, 1, 3)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    limiter.release(held)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == [1, 3, 5]
+
+def test_generate_releases_slot_when_the_call_fails(mocker):
+    model = mocker.MagicMock()
+    model.generate_content.side_effect = RuntimeError("quota")
+    in_flight_before = get_rate_limiter().in_flight
+
+    try:
+        generate(model, "prompt")
+    except RuntimeError:
+        pass
+
+    assert get_rate_limiter().in_flight == in_flight_before
+
+def test_fence_stripper_closes_on_end_of_code_block():
+    stripper = CodeFenceStripper()
+    for chunk in ["```pyt", "hon\nimport os\nprint(", "os.getcwd())\n``", "`\nThis script prints the cwd."]:
+        stripper.feed(chunk)
+        if stripper.closed:
+            break
+
+    assert stripper.closed
+    assert stripper.finish() == "import os\nprint(os.getcwd())"
+
+def test_fence_stripper_passes_unfenced_code_through():
+    stripper = CodeFenceStripper()
+    stripper.feed("print('a')\nprint('b')")
+    assert not stripper.closed
+    assert stripper.finish() == "print('a')\nprint('b')"
+
+def test_model_registry_builds_each_client_once(mocker):
+    mocker.patch.dict(llm._models, clear=True)
+    model_cls = mocker.patch('vertexai.generative_models.GenerativeModel', side_effect=lambda *a, **kw: object())
+
+    assert get_model("gemini-1.5-pro") is get_model("gemini-1.5-pro")
+    json_model = get_model("gemini-1.5-pro", generation_config={"response_mime_type": "application/json"})
+    assert json_model is not get_model("gemini-1.5-pro")
+    assert model_cls.call_count == 2
+
+def test_importing_the_dispatcher_loads_neither_vertexai_nor_docker():
+    probe = "import sys, dispatcher; print(sorted(m for m in ('vertexai', 'docker') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+@pytest.fixture
+def fresh_resilience(mocker):
+    mocker.patch.dict(llm._breakers, clear=True)
+    mocker.patch.dict(llm._latency_trackers, clear=True)
+
+class SlowFirstModel:
+    """The first request is slow, every later one (e.g. a hedge) is fast."""
+    def __init__(self, name, slow=0.5):
+        self._model_name = name
+        self.slow = slow
+        self.calls = 0
+
+    def _answer(self):
+        self.calls += 1
+        return fake_response(f"answer {self.calls}"), (self.slow if self.calls == 1 else 0.0)
+
+    def generate_content(self, prompt, **kwargs):
+        response, delay = self._answer()
+        time.sleep(delay)
+        return response
+
+    async def generate_content_async(self, prompt, **kwargs):
+        response, delay = self._answer()
+        await asyncio.sleep(delay)
+        return response
+
+def fake_response(text):
+    return type("Response", (), {"text": text, "usage_metadata": None})()
+
+def hedged_total(model, winner):
+    return REGISTRY.get_sample_value("metamorph_llm_hedged_total", {"model": model, "winner": winner}) or 0
+
+def test_circuit_breaker_opens_then_lets_one_probe_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30, clock=clock)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    with pytest.raises(LLMUnavailableError):
+        breaker.before_call()
+
+    clock.now = 30.0
+    breaker.before_call()  # the probe
+    with pytest.raises(LLMUnavailableError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+def test_slow_call_is_hedged_and_the_faster_answer_wins(fresh_resilience):
+    model = SlowFirstModel("hedge-sync")
+    _, tracker = llm._resilience_for("hedge-sync")
+    for _ in range(llm.LLM_HEDGE_MIN_SAMPLES):
+        tracker.observe(0.01)
+    before = hedged_total("hedge-sync", "hedge")
+
+    started = time.monotonic()
+    response = generate(model, "prompt", deadline=5)
+
+    assert response.text == "answer 2"
+    assert time.monotonic() - started < model.slow
+    assert hedged_total("hedge-sync", "hedge") == before + 1
+
+def test_calls_are_not_hedged_without_latency_history(fresh_resilience):
+    model = SlowFirstModel("no-history", slow=0.05)
+    assert generate(model, "prompt", deadline=5).text == "answer 1"
+    assert model.calls == 1
+
+def test_deadline_fails_the_call_and_feeds_the_breaker(fresh_resilience):
+    model = SlowFirstModel("deadline-sync")
+    breaker, _ = llm._resilience_for("deadline-sync")
+    breaker.failure_threshold = 1
+
+    with pytest.raises(LLMDeadlineExceeded):
+        generate(model, "prompt", deadline=0.05)
+    with pytest.raises(LLMUnavailableError):
+        generate(model, "prompt", deadline=0.05)
+
+def test_async_hedge_cancels_the_slow_request(fresh_resilience):
+    model = SlowFirstModel("hedge-async", slow=5)
+    _, tracker = llm._resilience_for("hedge-async")
+    for _ in range(llm.LLM_HEDGE_MIN_SAMPLES):
+        tracker.observe(0.01)
+    in_flight_before = get_rate_limiter().in_flight
+
+    async def call():
+        started = time.monotonic()
+        response = await generate_async(model, "prompt", deadline=10)
+        return response, time.monotonic() - started
+
+    response, elapsed = asyncio.run(call())
+    assert response.text == "answer 2" and elapsed < 1
+    assert get_rate_limiter().in_flight == in_flight_before
+
+@pytest.fixture
+def one_slot(mocker):
+    """A process rate limiter with a single in-flight slot."""
+    limiter = LLMRateLimiter(rpm=1000, tpm=1_000_000, max_in_flight=1)
+    mocker.patch('llm._rate_limiter', limiter)
+    return limiter
+
+def test_waiting_for_quota_is_not_a_model_failure(one_slot):
+    model = SlowFirstModel("queued-sync", slow=0)
+    breaker, tracker = llm._resilience_for("queued-sync")
+    breaker.failure_threshold = 1
+    held = one_slot.acquire(1)
+
+    with pytest.raises(LLMQueueTimeout):
+        generate(model, "prompt", deadline=0.05)
+    assert model.calls == 0 and breaker.state == "closed" and not one_slot._queue
+
+    # Time spent queued isn't part of the latency history that hedge delays come from
+    threading.Timer(0.2, one_slot.release, args=(held,)).start()
+    assert generate(model, "prompt", deadline=1).text == "answer 1"
+    assert max(tracker._latencies) < 0.1
+
+def test_hedges_only_use_spare_quota(one_slot):
+    held = one_slot.acquire(1)
+    assert one_slot.try_acquire(1) is None
+    one_slot.release(held)
+    assert one_slot.try_acquire(1) == 1
+
+def test_abandoned_call_gives_its_slot_back(one_slot):
+    model = SlowFirstModel("abandoned-sync", slow=0.2)
+
+    with pytest.raises(LLMDeadlineExceeded):
+        generate(model, "prompt", deadline=0.05)
+    assert one_slot.in_flight == 1  # the request was already sent and can't be recalled
+
+    deadline = time.monotonic() + 2
+    while one_slot.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert one_slot.in_flight == 0
+
+def test_abandoned_request_that_has_not_started_never_calls_the_model(one_slot, mocker):
+    model = mocker.MagicMock()
+    gate = threading.Event()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    mocker.patch('llm._get_call_pool', return_value=pool)
+    pool.submit(gate.wait)  # keeps the only pool thread busy
+
+    request = llm._PooledRequest(model, "prompt", one_slot.acquire(1), {})
+    request.abandon()
+    gate.set()
+    pool.shutdown(wait=True)
+
+    model.generate_content.assert_not_called()
+    assert one_slot.in_flight == 0
@@ -0,0 +1,57 @@
+# tests/test_metrics.py
+from prometheus_client import REGISTRY
+from cache import TwoTierCache
+from metrics import task_type_context, record_retry
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+def test_cache_lookups_are_counted_by_task_type():
+    cache = TwoTierCache(4, name="test_cache")
+    labels = {"cache": "test_cache", "result": "local_hit", "task_type": "code_writing"}
+    before = sample("metamorph_cache_requests_total", **labels)
+
+    cache.put_local("k", "v")
+    with task_type_context("code_writing"):
+        assert cache.get_local("k") == "v"
+        assert cache.get_local("absent") is None
+
+    assert sample("metamorph_cache_requests_total", **labels) == before + 1
+
+def test_task_type_label_resets_after_the_context():
+    before = sample("metamorph_retries_total", function="f", task_type="none")
+    with task_type_context("testing"):
+        pass
+    record_retry("f")
+    assert sample("metamorph_retries_total", function="f", task_type="none") == before + 1
+
+def test_dashboard_serves_prometheus_text(mocker):
+    import dashboard
+    mock_db_instance = mocker.patch('dashboard.db')
+    response = dashboard.app.test_client().get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert b"metamorph_db_query_seconds" in response.data
+    mock_db_instance.query_all.assert_not_called()
+
+def test_streamed_query_time_includes_the_fetches_but_not_the_caller(mocker):
+    import time
+    from db_manager import DBManager
+    pool = mocker.MagicMock()
+    conn = pool.getconn.return_value
+    conn.closed = 0
+    mocker.patch('db_manager.get_connection_pool', return_value=pool)
+
+    def slow_fetches():
+        for row in [(1,), (2,)]:
+            time.sleep(0.05)
+            yield row
+    conn.cursor.return_value.__enter__.return_value.__iter__.side_effect = slow_fetches
+    before = sample("metamorph_db_query_seconds_sum", operation="iter_query")
+
+    for _ in DBManager().iter_query("SELECT id FROM tasks", row_type="tuple"):
+        time.sleep(0.2)
+
+    elapsed = sample("metamorph_db_query_seconds_sum", operation="iter_query") - before
+    assert 0.1 <= elapsed < 0.3
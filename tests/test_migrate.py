@@ -0,0 +1,64 @@
+# tests/test_migrate.py
+import pytest
+import migrate
+from migrate import discover_migrations
+
+def test_repo_migrations_are_ordered_and_indexes_run_outside_a_transaction():
+    migrations = discover_migrations()
+    assert [m.version for m in migrations] == sorted(m.version for m in migrations)
+    indexes = next(m for m in migrations if m.name == "queue_indexes")
+    assert not indexes.transactional
+    assert all(stmt.startswith("CREATE INDEX CONCURRENTLY") for stmt in indexes.statements())
+
+def test_migrate_applies_only_pending_versions(mocker, tmp_path):
+    (tmp_path / "0001_first.sql").write_text("CREATE TABLE a (id INT);")
+    (tmp_path / "0002_second.sql").write_text("CREATE TABLE b (id INT);")
+    (tmp_path / "0003_third.sql").write_text("CREATE TABLE c (id INT);")
+    pool = mocker.MagicMock()
+    conn = pool.getconn.return_value
+    conn.closed = 0
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.return_value = [(1,)]
+    mocker.patch('migrate.get_connection_pool', return_value=pool)
+
+    assert migrate.migrate(target=2, directory=str(tmp_path)) == [2]
+
+    executed = [c.args[0] for c in cur.execute.call_args_list]
+    assert "CREATE TABLE b (id INT);" in executed
+    assert "CREATE TABLE c (id INT);" not in executed
+    conn.commit.assert_called_once()
+    assert "pg_advisory_unlock" in executed[-1]
+
+def test_rerun_rebuilds_an_index_an_interrupted_build_left_invalid(mocker, tmp_path):
+    (tmp_path / "0001_indexes.sql").write_text(
+        "-- migrate: no-transaction\nCREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx ON a (id);\n")
+    pool = mocker.MagicMock()
+    conn = pool.getconn.return_value
+    conn.closed = 0
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.side_effect = [[], []]  # nothing applied yet; no invalid index at the end
+    cur.fetchone.return_value = (True,)  # a_idx exists but is INVALID
+    mocker.patch('migrate.get_connection_pool', return_value=pool)
+
+    assert migrate.migrate(directory=str(tmp_path)) == [1]
+
+    executed = [c.args[0] for c in cur.execute.call_args_list]
+    drop = executed.index("DROP INDEX CONCURRENTLY IF EXISTS a_idx")
+    assert executed[drop + 1].startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx")
+
+def test_index_still_invalid_after_the_build_fails_the_migration(mocker, tmp_path):
+    (tmp_path / "0001_indexes.sql").write_text(
+        "-- migrate: no-transaction\nCREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx ON a (id);\n")
+    pool = mocker.MagicMock()
+    conn = pool.getconn.return_value
+    conn.closed = 0
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.side_effect = [[], [("a_idx",)]]
+    cur.fetchone.return_value = None
+    mocker.patch('migrate.get_connection_pool', return_value=pool)
+
+    with pytest.raises(RuntimeError, match="a_idx"):
+        migrate.migrate(directory=str(tmp_path))
+
+    executed = [c.args[0] for c in cur.execute.call_args_list]
+    assert not any("INSERT INTO schema_migrations" in sql for sql in executed)
@@ -0,0 +1,62 @@
+# tests/test_orchestrator.py
+import json
+from agents.orchestrator import ChiefOrchestratorAgent, planner_version, planning_task_types
+
+def test_plan_is_stored_in_one_transaction_with_real_dependency_ids(mocker):
+    mock_db_instance = mocker.MagicMock()
+    mock_db_instance.execute_values.side_effect = [[{'id': 40}, {'id': 41}, {'id': 42}], None]
+    mocker.patch('agents.orchestrator.DBManager', return_value=mock_db_instance)
+    plan = {"tasks": [
+        {"task_id": 1, "description": "Init repo", "dependencies": [], "task_type": "repo_init"},
+        {"task_id": 2, "description": "Write code", "dependencies": [1], "task_type": "code_writing"},
+        {"task_id": 3, "description": "Document", "dependencies": [1, 2, 9], "task_type": "documentation"},
+    ]}
+    agent = ChiefOrchestratorAgent()
+    mocker.patch.object(agent, '_call_llm_for_planning', return_value=plan)
+
+    agent.plan_and_store_tasks(7, "Build a tool")
+
+    mock_db_instance.transaction.assert_called_once()
+    mock_db_instance.execute.assert_not_called()
+    insert_call, update_call = mock_db_instance.execute_values.call_args_list
+    assert [row[0] for row in insert_call.args[1]] == [7, 7, 7]
+    assert insert_call.kwargs['fetch'] is True
+    assert [(task_id, json.loads(deps)) for task_id, deps in update_call.args[1]] == [(41, [40]), (42, [40, 41])]
+
+def test_similar_goal_reuses_cached_plan_without_calling_the_llm(mocker):
+    mock_db_instance = mocker.MagicMock()
+    mock_db_instance.execute_values.side_effect = [[{'id': 1}], None]
+    mocker.patch('agents.orchestrator.DBManager', return_value=mock_db_instance)
+    plan_cache = mocker.MagicMock()
+    plan_cache.lookup.return_value = {"tasks": [{"task_id": 1, "description": "Init repo", "dependencies": [], "task_type": "repo_init"}]}
+    mocker.patch('agents.orchestrator.get_plan_cache', return_value=plan_cache)
+    agent = ChiefOrchestratorAgent()
+    planning = mocker.patch.object(agent, '_call_llm_for_planning')
+
+    agent.plan_and_store_tasks(7, "build  a tool")
+
+    planning.assert_not_called()
+    plan_cache.store.assert_not_called()
+    assert plan_cache.lookup.call_args.kwargs['planner_version'] == planner_version(planning_task_types())
+    assert mock_db_instance.execute_values.call_args_list[0].args[1][0][1] == "Init repo"
+
+def test_planner_may_assign_task_types_of_generated_agents(mocker):
+    registry = mocker.MagicMock()
+    registry.task_types.return_value = ["api_integration", "code_writing", "documentation", "open_meteo_weather", "repo_init"]
+    mocker.patch('agents.orchestrator.get_agent_registry', return_value=registry)
+    mocker.patch('agents.orchestrator.DBManager')
+    mocker.patch('cache.get_redis_client', return_value=None)
+    generate = mocker.patch('agents.orchestrator.generate', return_value=mocker.MagicMock(text='{"tasks": []}'))
+    mocker.patch('agents.orchestrator.get_model')
+
+    task_types = planning_task_types()
+    ChiefOrchestratorAgent()._call_llm_for_planning("Get the weather", task_types)
+
+    assert [task_type for task_type, _ in task_types] == [
+        "repo_init", "documentation", "api_integration", "open_meteo_weather", "code_writing"]
+    assert '- "open_meteo_weather":' in generate.call_args.args[1]
+
+def test_planner_version_changes_with_the_task_types():
+    task_types = [["code_writing", "For general Python code."]]
+    assert planner_version(task_types) == planner_version([list(pair) for pair in task_types])
+    assert planner_version(task_types) != planner_version([["open_meteo_weather", "Weather."]] + task_types)
@@ -0,0 +1,32 @@
+# tests/test_output_capture.py
+from executor import OutputCapture
+
+def test_small_output_is_kept_whole():
+    capture = OutputCapture(limit=100)
+    capture.feed(b"hello ", None)
+    capture.feed(b"world\n", b"warn\n")
+    result = capture.result(0)
+
+    assert result["stdout"] == "hello world"
+    assert result["stderr"] == "warn"
+    assert result["exit_code"] == 0
+    assert result["time_to_first_byte"] is not None
+
+def test_large_output_keeps_head_and_tail():
+    capture = OutputCapture(limit=10)
+    for chunk in (b"AAAAA", b"BBBBBBBBBB", b"CCCCC"):
+        capture.feed(chunk, None)
+
+    assert capture.result(0)["stdout"] == "AAAAA\n... [10 bytes truncated] ...\nCCCCC"
+
+def test_lines_are_forwarded_across_chunk_boundaries():
+    lines = []
+    capture = OutputCapture(limit=1000, on_output=lambda stream, line: lines.append((stream, line)))
+    capture.feed(b"one\ntw", None)
+    capture.feed(b"o\nthree", b"oops\n")
+    capture.result(1)
+
+    assert lines == [("stdout", "one"), ("stdout", "two"), ("stderr", "oops"), ("stdout", "three")]
+
+def test_no_output_has_no_first_byte_time():
+    assert OutputCapture().result(0)["time_to_first_byte"] is None
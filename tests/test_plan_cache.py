@@ -0,0 +1,108 @@
+# tests/test_plan_cache.py
+import json
+import time
+import pytest
+import numpy as np
+from plan_cache import GoalVectorizer, PlanIndex, SemanticPlanCache
+
+# A long goal, where one changed or added clause moves the cosine similarity very little
+LONG_GOAL = ("Build a Flask REST API that fetches the current Bitcoin price from the CoinDesk API every minute, "
+             "stores each price snapshot in a SQLite database, exposes endpoints for the latest price and the "
+             "price history, and write pytest unit tests for the storage layer and the API endpoints.")
+
+GOAL = ("Initialize a git repository, then write a Python script to fetch the current price of Bitcoin "
+        "from the CoinDesk API and print the USD rate, and finally, create a README.md file for the project.")
+
+class FakeDB:
+    """Just enough of DBManager for the plan_cache table."""
+    def __init__(self):
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        goal, vectorizer, embedding, plan, planner_version, expires_at = params
+        self.rows.append((len(self.rows) + 1, goal, vectorizer, embedding, planner_version, expires_at, plan))
+
+    def iter_query(self, sql, params=None, row_type="dict"):
+        last_id, now = params
+        return iter([row[:6] for row in self.rows if row[0] > last_id and row[5] > now])
+
+    def query_one(self, sql, params=None):
+        row = self.rows[params[0] - 1]
+        return {'goal': row[1], 'plan': row[6]}
+
+def test_rewording_scores_high_and_other_goals_low():
+    vectorizer = GoalVectorizer()
+    goal = vectorizer.embed(GOAL)
+    reworded = vectorizer.embed("initialize the git repository and then write a python script that fetches the current "
+                                "price of bitcoin from the coindesk API and prints the USD rate.  Finally create the "
+                                "README.md file for this project")
+    unrelated = vectorizer.embed("Build a Flask web app with user login and a SQLite database.")
+
+    assert abs(float(np.linalg.norm(goal)) - 1) < 1e-5
+    assert float(goal @ reworded) > 0.95
+    assert float(goal @ unrelated) < 0.3
+
+def test_index_finds_the_closest_live_vector_with_the_key_across_growth():
+    index = PlanIndex(dim=8)
+    vectors = np.eye(8, dtype=np.float32)
+    now = time.time()
+    for plan_id in range(1, 2001):
+        index.add([plan_id], vectors[plan_id % 8], [plan_id % 2], [now - 1 if plan_id > 1000 else now + 60])
+    assert len(index) == 2000
+    plan_id, score = index.best(vectors[3], 1, now)
+    assert plan_id % 8 == 3 and plan_id <= 1000 and score == 1.0
+    # Only even ids have key 0, so no exact match for an odd axis
+    assert index.best(vectors[3], 0, now)[1] == 0.0
+    assert index.best(vectors[3], 2, now) is None
+
+def test_near_duplicate_goal_reuses_the_stored_plan():
+    db = FakeDB()
+    plan = {"tasks": [{"task_id": 1, "description": "Init repo", "dependencies": [], "task_type": "repo_init"}]}
+    cache = SemanticPlanCache(db=db, threshold=0.95)
+    assert cache.lookup(GOAL) is None
+
+    cache.store(GOAL, plan)
+
+    assert cache.lookup("  " + GOAL.upper().replace(",", "") + "  ") == plan
+    assert cache.lookup(GOAL.replace("Bitcoin", "Ethereum").replace("CoinDesk", "CoinGecko")) is None
+
+@pytest.mark.parametrize("changed", [
+    LONG_GOAL.replace("Bitcoin", "Ethereum"),
+    LONG_GOAL.replace("SQLite", "PostgreSQL"),
+    LONG_GOAL.replace("Flask", "FastAPI"),
+    LONG_GOAL.rstrip(".") + ", and write a README documenting setup.",
+])
+def test_goal_with_a_changed_or_added_clause_gets_its_own_plan(changed):
+    vectorizer = GoalVectorizer()
+    # Cosine similarity alone can't tell these goals apart...
+    assert float(vectorizer.embed(LONG_GOAL) @ vectorizer.embed(changed)) > 0.94
+    cache = SemanticPlanCache(db=FakeDB(), vectorizer=vectorizer)
+    cache.store(LONG_GOAL, {"tasks": []})
+
+    # ...but their content words differ, so the stored plan isn't a candidate
+    assert cache.lookup(changed) is None
+    assert cache.lookup(LONG_GOAL.replace("fetches", "fetch").replace(", and write", ". Write")) == {"tasks": []}
+
+def test_plans_of_another_planner_version_or_expired_are_not_served(mocker):
+    db = FakeDB()
+    cache = SemanticPlanCache(db=db, ttl_seconds=60)
+    cache.store(GOAL, {"tasks": []}, planner_version="v1")
+    assert cache.lookup(GOAL, planner_version="v1") == {"tasks": []}
+    assert cache.lookup(GOAL, planner_version="v2") is None
+
+    mocker.patch('plan_cache.time.time', return_value=time.time() + 61)
+    assert cache.lookup(GOAL, planner_version="v1") is None
+    # Nor loaded by a process that starts after they expired
+    fresh = SemanticPlanCache(db=db)
+    assert fresh.lookup(GOAL, planner_version="v1") is None
+    assert len(fresh.index) == 0
+
+def test_plans_stored_by_other_processes_are_picked_up_on_refresh():
+    db = FakeDB()
+    other_process = SemanticPlanCache(db=db)
+    other_process.store(GOAL, {"tasks": []})
+
+    cache = SemanticPlanCache(db=db, refresh_seconds=3600)
+    assert cache.lookup(GOAL) == {"tasks": []}
+    assert json.loads(db.rows[0][6]) == {"tasks": []}
+    assert len(cache.index) == 1
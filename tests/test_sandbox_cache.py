@@ -0,0 +1,42 @@
+# tests/test_sandbox_cache.py
+import pytest
+import executor
+
+@pytest.fixture
+def sandbox(mocker):
+    mocker.patch('cache.get_redis_client', return_value=None)
+    mocker.patch('executor._sandbox_image_id', return_value="sha256:image-a")
+    mocker.patch('executor.SANDBOX_POOL_SIZE', 1)
+    return mocker.patch('executor._run_pooled', return_value={'stdout': 'hi', 'stderr': '', 'exit_code': 0})
+
+def test_identical_offline_run_is_served_from_cache(sandbox):
+    files = {'main.py': "print('hi')"}
+    first = executor.run_in_sandbox("python main.py", files)
+    second = executor.run_in_sandbox("python main.py", files)
+
+    assert first == second == {'stdout': 'hi', 'stderr': '', 'exit_code': 0}
+    assert sandbox.call_count == 1
+
+def test_changed_file_contents_miss(sandbox):
+    executor.run_in_sandbox("python main.py", {'main.py': "print('hi')"})
+    executor.run_in_sandbox("python main.py", {'main.py': "print('bye')"})
+    assert sandbox.call_count == 2
+
+def test_network_runs_and_opt_outs_are_never_cached(sandbox):
+    for _ in range(2):
+        executor.run_in_sandbox("python main.py", network_enabled=True)
+        executor.run_in_sandbox("python main.py", use_cache=False)
+    assert sandbox.call_count == 4
+
+def test_executor_errors_are_not_cached(sandbox):
+    sandbox.return_value = {'stdout': '', 'stderr': 'An unexpected executor error: boom', 'exit_code': -1}
+    executor.run_in_sandbox("python main.py")
+    executor.run_in_sandbox("python main.py")
+    assert sandbox.call_count == 2
+
+@pytest.mark.parametrize("exit_code", [1, 137])
+def test_failed_and_killed_runs_are_not_cached(sandbox, exit_code):
+    sandbox.return_value = {'stdout': '', 'stderr': 'Killed', 'exit_code': exit_code}
+    executor.run_in_sandbox("python main.py")
+    executor.run_in_sandbox("python main.py")
+    assert sandbox.call_count == 2
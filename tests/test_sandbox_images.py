@@ -0,0 +1,75 @@
+# tests/test_sandbox_images.py
+import docker
+import sandbox_images
+from sandbox_images import ImageBuilder, detect_imports, image_tag_for, required_packages
+
+def test_detect_imports_finds_top_level_modules():
+    code = "import os, requests.adapters\nfrom bs4 import BeautifulSoup\nfrom . import sibling\n"
+    assert detect_imports(code) == {"os", "requests", "bs4"}
+
+def test_required_packages_skips_stdlib_local_and_base(mocker):
+    mocker.patch.object(sandbox_images, '_package_index', {"requests": "requests", "bs4": "beautifulsoup4", "pytest": "pytest"})
+    files = {
+        'main.py': "import json\nimport requests\nfrom bs4 import BeautifulSoup\n",
+        'test_main.py': "import pytest\nimport main\n",
+    }
+    assert required_packages(files) == {"requests", "beautifulsoup4"}
+
+def test_modules_missing_from_the_index_are_never_installed(mocker):
+    mocker.patch.object(sandbox_images, '_package_index', {"requests": "requests"})
+    files = {'main.py': "import requests\nimport reqeusts\nimport totally_real_sdk\n"}
+    assert required_packages(files) == {"requests"}
+
+def docker_with_base(mocker, base_id="sha256:base1"):
+    """A Docker client mock that has only the base sandbox image."""
+    client = mocker.MagicMock()
+    base = mocker.MagicMock(id=base_id)
+
+    def get(tag):
+        if tag == "metamorph-tester":
+            return base
+        raise docker.errors.ImageNotFound("missing")
+    client.images.get.side_effect = get
+    return client, base
+
+def test_variant_is_built_once(mocker):
+    client, _ = docker_with_base(mocker)
+    builder = ImageBuilder(client=client)
+
+    first = builder.ensure({"requests"})
+    second = builder.ensure({"requests"})
+
+    assert first == second == image_tag_for({"requests"}, "sha256:base1")
+    assert client.images.build.call_count == 1
+    dockerfile = client.images.build.call_args.kwargs['fileobj'].getvalue().decode()
+    assert dockerfile.startswith("FROM sha256:base1\n")
+    assert "pip install --no-cache-dir requests" in dockerfile
+
+def test_rebuilt_base_image_gets_new_variants(mocker):
+    client, base = docker_with_base(mocker)
+    builder = ImageBuilder(client=client)
+    old = builder.ensure({"requests"})
+
+    base.id = "sha256:base2"
+    mocker.patch('sandbox_images.IMAGE_ID_REFRESH_SECONDS', 0)
+    new = builder.ensure({"requests"})
+
+    assert new != old and new == image_tag_for({"requests"}, "sha256:base2")
+    assert client.images.build.call_count == 2
+
+def test_no_packages_uses_base_image(mocker):
+    client = mocker.MagicMock()
+    assert ImageBuilder(client=client).ensure(set()) == "metamorph-tester"
+    client.images.build.assert_not_called()
+
+def test_failed_build_is_not_retried_on_every_run(mocker):
+    client, _ = docker_with_base(mocker)
+    client.images.build.side_effect = docker.errors.BuildError("pip failed", build_log=[])
+    builder = ImageBuilder(client=client, retry_seconds=600)
+    mocker.patch('sandbox_images.get_image_builder', return_value=builder)
+    mocker.patch.object(sandbox_images, '_package_index', {"requests": "requests"})
+
+    files = {'main.py': "import requests\n"}
+    assert sandbox_images.image_for_files(files) == "metamorph-tester"
+    assert sandbox_images.image_for_files(files) == "metamorph-tester"
+    assert client.images.build.call_count == 1
@@ -0,0 +1,81 @@
+# tests/test_scheduler.py
+import asyncio
+import threading
+from scheduler import DAGScheduler, AsyncDAGScheduler, build_task_graph
+
+def test_build_task_graph_uses_stored_task_ids():
+    tasks = [
+        {'id': 40, 'dependencies': '[]'},
+        {'id': 41, 'dependencies': '[40]'},
+        {'id': 42, 'dependencies': [40, 41]},
+    ]
+    assert build_task_graph(tasks) == {40: [], 41: [40], 42: [40, 41]}
+
+def test_build_task_graph_maps_legacy_plan_ids_by_position():
+    """Projects planned before ids were remapped at ingestion still store plan-local ids."""
+    tasks = [
+        {'id': 40, 'dependencies': '[]'},
+        {'id': 41, 'dependencies': '[1]'},
+        {'id': 42, 'dependencies': [1, 2]},
+    ]
+    assert build_task_graph(tasks) == {40: [], 41: [40], 42: [40, 41]}
+
+def test_children_wait_for_parents():
+    """A task is never started before all of its parents have completed."""
+    graph = {1: [], 2: [1], 3: [1], 4: [2, 3]}
+    finished = []
+    lock = threading.Lock()
+
+    def run_task(task_id):
+        with lock:
+            assert all(parent in finished for parent in graph[task_id])
+            finished.append(task_id)
+        return True
+
+    results = DAGScheduler(max_workers=4).run(graph, run_task)
+
+    assert results == {1: 'completed', 2: 'completed', 3: 'completed', 4: 'completed'}
+    assert finished[0] == 1 and finished[-1] == 4
+
+def test_failure_skips_downstream_only():
+    """Descendants of a failed task are skipped, independent branches still run."""
+    graph = {1: [], 2: [1], 3: [2], 4: []}
+    started = []
+    skipped = []
+
+    def run_task(task_id):
+        started.append(task_id)
+        return task_id != 1
+
+    results = DAGScheduler(max_workers=2).run(graph, run_task, on_skip=lambda task_id, reason: skipped.append(task_id))
+
+    assert results == {1: 'failed', 2: 'skipped', 3: 'skipped', 4: 'completed'}
+    assert sorted(started) == [1, 4]
+    assert sorted(skipped) == [2, 3]
+
+def test_previously_finished_dependencies():
+    """Already-completed parents release their children; already-failed ones skip them."""
+    graph = {5: [1], 6: [2]}
+    results = DAGScheduler().run(graph, lambda task_id: True, completed={1}, failed={2})
+    assert results == {5: 'completed', 6: 'skipped'}
+
+def test_cycle_is_skipped():
+    """Tasks on a dependency cycle can never become ready and are skipped."""
+    results = DAGScheduler().run({1: [2], 2: [1]}, lambda task_id: True)
+    assert results == {1: 'skipped', 2: 'skipped'}
+
+def test_async_scheduler_matches_thread_scheduler():
+    """The asyncio scheduler follows the same release and skip rules."""
+    graph = {1: [], 2: [1], 3: [2], 4: []}
+    skipped = []
+
+    async def run_task(task_id):
+        return task_id != 2
+
+    async def on_skip(task_id, reason):
+        skipped.append(task_id)
+
+    results = asyncio.run(AsyncDAGScheduler().run(graph, run_task, on_skip=on_skip))
+
+    assert results == {1: 'completed', 2: 'failed', 3: 'skipped', 4: 'completed'}
+    assert skipped == [3]
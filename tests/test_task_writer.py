@@ -0,0 +1,80 @@
+# tests/test_task_writer.py
+import pytest
+import task_writer
+from task_writer import TaskWriter, task_lease, task_status, update_task
+
+def make_writer(mocker, batch_size=50):
+    mock_db_instance = mocker.MagicMock()
+    return TaskWriter(db=mock_db_instance, batch_size=batch_size, flush_interval=60), mock_db_instance
+
+def test_updates_are_coalesced_into_one_transaction(mocker):
+    writer, mock_db_instance = make_writer(mocker)
+    writer.update(1, status='running')
+    writer.update(1, output='ok', status='completed')
+    writer.update(2, output='boom', status='failed')
+    writer.update(3, test_status='pass')
+
+    assert writer.flush() == 3
+
+    mock_db_instance.transaction.assert_called_once()
+    calls = mock_db_instance.execute_values.call_args_list
+    assert len(calls) == 2
+    sql, rows = calls[0].args
+    assert "SET output = data.output, status = data.status" in sql
+    assert rows == [(1, 'ok', 'completed'), (2, 'boom', 'failed')]
+    assert calls[1].args[1] == [(3, 'pass')]
+    writer.close()
+
+def test_buffered_status_is_visible_before_it_is_committed(mocker, monkeypatch):
+    writer, mock_db_instance = make_writer(mocker)
+    monkeypatch.setattr(task_writer, "TASK_WRITE_BEHIND", True)
+    monkeypatch.setattr(task_writer, "get_task_writer", lambda: writer)
+
+    update_task(mock_db_instance, 7, output='done', status='completed')
+
+    assert task_status(mock_db_instance, 7) == 'completed'
+    mock_db_instance.execute.assert_not_called()
+    mock_db_instance.query_one.assert_not_called()
+    writer.close()
+
+def test_durable_update_commits_before_returning(mocker):
+    writer, mock_db_instance = make_writer(mocker)
+    writer.update(4, durable=True, status='failed', output='x')
+
+    mock_db_instance.execute_values.assert_called_once()
+    assert writer.pending_status(4) is None
+    writer.close()
+
+def test_failed_flush_keeps_updates_for_the_next_attempt(mocker):
+    writer, mock_db_instance = make_writer(mocker)
+    mock_db_instance.execute_values.side_effect = [Exception("connection lost"), None]
+    writer.update(5, status='completed')
+
+    with pytest.raises(Exception):
+        writer.flush()
+    assert writer.pending_status(5) == 'completed'
+
+    writer.close()
+    assert mock_db_instance.execute_values.call_args.args[1] == [(5, 'completed')]
+
+def test_write_through_by_default(mocker):
+    mock_db_instance = mocker.MagicMock()
+    update_task(mock_db_instance, 9, code='c', output='o', status='completed')
+
+    mock_db_instance.execute.assert_called_once_with(
+        "UPDATE tasks SET code = %s, output = %s, status = %s WHERE id = %s", ('c', 'o', 'completed', 9)
+    )
+
+def test_buffered_updates_under_a_lease_only_apply_while_it_is_held(mocker):
+    writer, mock_db_instance = make_writer(mocker)
+    with task_lease("worker-a"):
+        writer.update(1, status='completed')
+    writer.update(2, status='failed')
+
+    writer.flush()
+
+    (leased_sql, leased_rows), (plain_sql, plain_rows) = [c.args for c in mock_db_instance.execute_values.call_args_list]
+    assert "AS data (id, lease_owner, status)" in leased_sql and "tasks.lease_owner = data.lease_owner" in leased_sql
+    assert leased_rows == [(1, 'worker-a', 'completed')]
+    assert "lease_owner" not in plain_sql and plain_rows == [(2, 'failed')]
+    writer.close()
@@ -0,0 +1,94 @@
+# tests/test_tester.py
+import pytest
+from agents import tester as tester_module
+from agents.tester import parse_junit_xml
+
+REPORT_PASS = """<?xml version="1.0" encoding="utf-8"?><testsuites><testsuite name="pytest" tests="1">
+<testcase classname="test_main" name="test_ok" time="0.004" /></testsuite></testsuites>"""
+
+REPORT_FAIL = """<?xml version="1.0" encoding="utf-8"?><testsuites><testsuite name="pytest" tests="3">
+<testcase classname="test_main" name="test_bad" time="0.010"><failure message="AssertionError: boom">trace</failure></testcase>
+<testcase classname="test_main" name="test_later" time="0"><skipped message="not yet" /></testcase>
+<testcase classname="test_main" name="test_ok" time="0.001" /></testsuite></testsuites>"""
+
+def test_parse_junit_xml_reads_outcomes_and_durations():
+    results = parse_junit_xml(REPORT_FAIL)
+    assert [(r['name'], r['outcome']) for r in results] == [('test_bad', 'failed'), ('test_later', 'skipped'), ('test_ok', 'passed')]
+    assert results[0]['duration_seconds'] == 0.01 and results[0]['message'] == "AssertionError: boom"
+
+@pytest.fixture
+def tester(mocker):
+    mock_db_instance = mocker.MagicMock()
+    mocker.patch('agents.tester.DBManager', return_value=mock_db_instance)
+    mocker.patch('agents.tester.image_for_files', return_value='metamorph-tester')
+    mocker.patch.object(tester_module.TesterAgent, '_generate_test_code', side_effect=lambda code: f"# tests for {code}")
+    return tester_module.TesterAgent(), mock_db_instance
+
+def test_batch_runs_many_tasks_in_one_sandbox_and_stores_per_test_rows(tester, mocker):
+    agent, mock_db_instance = tester
+    mock_db_instance.query_all.return_value = [{'id': 1, 'code': 'a'}, {'id': 2, 'code': 'b'}, {'id': 3, 'code': None}]
+    run = mocker.patch('agents.tester.run_in_sandbox', return_value={
+        'stdout': '', 'stderr': '', 'exit_code': 0,
+        'artifacts': {
+            'reports/task_1.xml': REPORT_PASS, 'reports/task_1.exit': '0\n',
+            'reports/task_2.xml': REPORT_FAIL, 'reports/task_2.exit': '1\n',
+        },
+    })
+
+    statuses = agent.run_tests_for_tasks([1, 2, 3])
+
+    assert statuses == {1: 'pass', 2: 'fail', 3: 'no_code'}
+    run.assert_called_once()
+    command, files = run.call_args.args
+    assert set(files) == {'task_1/main.py', 'task_1/test_main.py', 'task_2/main.py', 'task_2/test_main.py'}
+    assert "xargs -P 4" in command and run.call_args.kwargs['artifacts'] == ['reports']
+
+    sql, rows = mock_db_instance.execute_values.call_args.args
+    assert "INSERT INTO test_results" in sql
+    assert [(row[0], row[1], row[3]) for row in rows] == [
+        (1, 'test_ok', 'passed'), (2, 'test_bad', 'failed'), (2, 'test_later', 'skipped'), (2, 'test_ok', 'passed')]
+
+def test_tasks_are_split_into_batches_and_missing_reports_are_errors(tester, mocker):
+    agent, mock_db_instance = tester
+    mock_db_instance.query_all.return_value = [{'id': i, 'code': 'x'} for i in range(1, 6)]
+    run = mocker.patch('agents.tester.run_in_sandbox', return_value={'stdout': '', 'stderr': 'boom', 'exit_code': -1})
+
+    statuses = agent.run_tests_for_tasks([1, 2, 3, 4, 5], batch_size=2)
+
+    assert run.call_count == 3
+    assert statuses == {i: 'error' for i in range(1, 6)}
+    mock_db_instance.execute_values.assert_not_called()
+
+def test_each_task_runs_under_a_timeout_and_a_hung_one_is_an_error(tester, mocker):
+    agent, mock_db_instance = tester
+    mock_db_instance.query_all.return_value = [{'id': 1, 'code': 'a'}, {'id': 2, 'code': 'while True: pass'}]
+    run = mocker.patch('agents.tester.run_in_sandbox', return_value={
+        'stdout': '', 'stderr': '', 'exit_code': 0,
+        'artifacts': {'reports/task_1.xml': REPORT_PASS, 'reports/task_1.exit': '0\n', 'reports/task_2.exit': '124\n'},
+    })
+
+    assert agent.run_tests_for_tasks([1, 2]) == {1: 'pass', 2: 'error'}
+    assert f"timeout -k 5 {tester_module.TESTER_TIMEOUT_SECONDS} python -m pytest" in run.call_args.args[0]
+
+def test_verdicts_commit_with_the_results_even_with_write_behind(tester, mocker):
+    agent, mock_db_instance = tester
+    mocker.patch('task_writer.TASK_WRITE_BEHIND', True)
+    writer = mocker.patch('task_writer.get_task_writer')
+    mock_db_instance.query_all.return_value = [{'id': 1, 'code': 'a'}]
+    mocker.patch('agents.tester.run_in_sandbox', return_value={
+        'stdout': '', 'stderr': '', 'exit_code': 0,
+        'artifacts': {'reports/task_1.xml': REPORT_PASS, 'reports/task_1.exit': '0\n'},
+    })
+    calls = mocker.MagicMock()
+    mock_db_instance.transaction.return_value.__enter__.side_effect = lambda: calls.begin()
+    def commit(*exc):
+        calls.commit()
+    mock_db_instance.transaction.return_value.__exit__.side_effect = commit
+    mock_db_instance.execute.side_effect = calls.execute
+
+    agent.run_tests_for_tasks([1])
+
+    writer.assert_not_called()
+    names = [name for name, _, _ in calls.mock_calls]
+    assert names == ['begin', 'execute', 'execute', 'commit']
+    assert calls.mock_calls[2].args == ("UPDATE tasks SET test_status = %s WHERE id = %s", ('pass', 1))
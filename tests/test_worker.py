@@ -0,0 +1,100 @@
+# tests/test_worker.py
+import threading
+from task_writer import update_task
+from worker import TaskWorker
+
+def make_worker(mocker, candidates, project_tasks):
+    mock_db_instance = mocker.MagicMock()
+    mock_db_instance.query_all.return_value = candidates
+    mock_db_instance.iter_query.side_effect = lambda *args, **kwargs: iter(project_tasks)
+    return TaskWorker(db=mock_db_instance, agents={}, worker_id="test-worker"), mock_db_instance
+
+def test_claim_task_takes_first_ready_task(mocker):
+    """A task whose dependencies are still pending is passed over for one that is ready."""
+    project_tasks = [
+        {'id': 1, 'status': 'pending', 'dependencies': '[]'},
+        {'id': 2, 'status': 'pending', 'dependencies': '[1]'},
+        {'id': 3, 'status': 'completed', 'dependencies': '[]'},
+    ]
+    candidates = [{'id': 2, 'project_id': 7}, {'id': 1, 'project_id': 7}]
+    worker, mock_db_instance = make_worker(mocker, candidates, project_tasks)
+
+    claimed = worker.claim_task()
+
+    assert claimed['id'] == 1
+    claim_sql, claim_params = mock_db_instance.execute.call_args[0]
+    assert "status = 'running'" in claim_sql
+    assert claim_params[0] == "test-worker" and claim_params[2] == 1
+    assert "SKIP LOCKED" in mock_db_instance.query_all.call_args_list[0][0][0]
+
+def test_claim_task_skips_tasks_behind_a_failure(mocker):
+    project_tasks = [
+        {'id': 1, 'status': 'failed', 'dependencies': '[]'},
+        {'id': 2, 'status': 'pending', 'dependencies': '[1]'},
+    ]
+    worker, mock_db_instance = make_worker(mocker, [{'id': 2, 'project_id': 7}], project_tasks)
+
+    assert worker.claim_task() is None
+    skip_sql, skip_params = mock_db_instance.execute.call_args[0]
+    assert "status = 'skipped'" in skip_sql and skip_params[1] == 2
+
+def test_heartbeat_survives_a_database_error(mocker):
+    worker, mock_db_instance = make_worker(mocker, [], [])
+    mocker.patch('worker.HEARTBEAT_SECONDS', 0)
+    mock_db_instance.query_one.side_effect = [Exception("connection reset"), {'id': 1}, None]
+
+    worker._heartbeat(1, threading.Event())
+
+    assert mock_db_instance.query_one.call_count == 3
+
+def test_outcome_is_only_written_while_the_lease_is_held(mocker):
+    worker, mock_db_instance = make_worker(mocker, [], [])
+    mocker.patch.object(worker, 'claim_task', return_value={'id': 5, 'project_id': 7})
+
+    def agent_records_outcome(db, agents, task_id):
+        update_task(db, task_id, output='done', status='completed')
+    mocker.patch('worker.dispatch_task', side_effect=agent_records_outcome)
+
+    assert worker.run_one()
+    outcome_sql, outcome_params = mock_db_instance.execute.call_args_list[0].args
+    assert outcome_sql.endswith("WHERE id = %s AND lease_owner = %s")
+    assert outcome_params == ('done', 'completed', 5, 'test-worker')
+
+def test_claim_task_pages_past_tasks_blocked_behind_a_running_one(mocker):
+    mocker.patch('worker.CLAIM_BATCH', 2)
+    project_tasks = {
+        7: [{'id': 1, 'status': 'running', 'dependencies': '[]'},
+            {'id': 2, 'status': 'pending', 'dependencies': '[1]'},
+            {'id': 3, 'status': 'pending', 'dependencies': '[1]'}],
+        8: [{'id': 9, 'status': 'pending', 'dependencies': '[]'}],
+    }
+    worker, mock_db_instance = make_worker(mocker, [], [])
+    mock_db_instance.query_all.side_effect = [[{'id': 2, 'project_id': 7}, {'id': 3, 'project_id': 7}],
+                                              [{'id': 9, 'project_id': 8}]]
+    mock_db_instance.iter_query.side_effect = lambda sql, params: iter(project_tasks[params[0]])
+
+    assert worker.claim_task()['id'] == 9
+    assert [c.args[1] for c in mock_db_instance.query_all.call_args_list] == [(0, 2), (3, 2)]
+
+def test_notification_during_a_scan_is_not_lost(mocker):
+    worker, _ = make_worker(mocker, [], [])
+    mocker.patch.object(worker, 'reclaim_expired_leases')
+    mocker.patch('worker.WORKER_IDLE_RESCAN_SECONDS', 30)
+    stop, wake = threading.Event(), threading.Event()
+    scans = []
+
+    def scan():
+        scans.append(1)
+        if len(scans) == 1:
+            wake.set()  # a task became ready while this thread was looking
+        else:
+            stop.set()
+            wake.set()  # as main()'s signal handler does
+        return False
+    mocker.patch.object(worker, 'run_one', side_effect=scan)
+
+    thread = threading.Thread(target=worker.run_forever, args=(stop, wake))
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive() and len(scans) == 2
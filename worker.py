@@ -0,0 +1,253 @@
+# worker.py
+import os
+import socket
+import signal
+import threading
+import uuid
+from llm import init_vertex
+from dotenv import load_dotenv
+from db_manager import DBManager
+from logger import get_logger
+from scheduler import build_task_graph
+from dispatcher import build_agents, dispatch_task
+from metrics import start_metrics_server
+from task_writer import flush_task_writes, task_lease
+from events import get_task_event_listener
+
+logger = get_logger(__name__)
+
+# How long a claim is valid without a heartbeat; a crashed worker's tasks are reclaimed after this
+LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "120"))
+HEARTBEAT_SECONDS = LEASE_SECONDS / 3
+POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+# How many pending rows a claim attempt reads and locks at a time while looking for one whose dependencies are met
+CLAIM_BATCH = int(os.getenv("WORKER_CLAIM_BATCH", "20"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+# React to task events (LISTEN task_events) instead of polling; the table is then only
+# rescanned every WORKER_IDLE_RESCAN_SECONDS, for leases that expired without an event
+WORKER_USE_EVENTS = os.getenv("WORKER_USE_EVENTS", "1") == "1"
+WORKER_IDLE_RESCAN_SECONDS = float(os.getenv("WORKER_IDLE_RESCAN_SECONDS", str(HEARTBEAT_SECONDS)))
+
+
+class TaskWorker:
+    """
+    Long-running task executor that can be started on any number of processes and
+    machines against the same `tasks` table. Tasks are claimed with
+    `SELECT ... FOR UPDATE SKIP LOCKED`, so no two workers ever run the same task, and
+    each claim carries a lease that is kept alive by a heartbeat while the agent runs.
+    """
+    def __init__(self, db: DBManager = None, agents: dict = None, worker_id: str = None, project_id: int = None):
+        self.db = db or DBManager()
+        self.agents = agents if agents is not None else build_agents()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.project_id = project_id
+
+    def reclaim_expired_leases(self) -> list:
+        """Puts tasks whose lease lapsed (their worker crashed or hung) back to 'pending'."""
+        rows = self.db.query_all(
+            """
+            UPDATE tasks SET status = 'pending', lease_owner = NULL, lease_expires_at = NULL
+            WHERE status = 'running' AND lease_expires_at < now()
+            RETURNING id
+            """
+        )
+        for row in rows:
+            logger.warning("Reclaimed expired task lease.", extra={"task_id": row['id'], "worker_id": self.worker_id})
+        return [row['id'] for row in rows]
+
+    def claim_task(self):
+        """
+        Atomically claims the oldest pending task whose dependencies have all completed.
+        Pending tasks downstream of a failed or skipped task are marked 'skipped' on the way.
+        Candidates are read CLAIM_BATCH at a time until one is ready, so a project whose
+        many pending tasks wait on a running one doesn't hide the ready tasks behind them.
+        Returns the claimed row, or None when nothing is ready.
+        """
+        sql = "SELECT id, project_id FROM tasks WHERE status = 'pending' AND id > %s"
+        if self.project_id is not None:
+            sql += " AND project_id = %s"
+        sql += " ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED"
+        filters = (self.project_id,) if self.project_id is not None else ()
+
+        with self.db.transaction():
+            projects = {}
+            after = 0
+            while True:
+                candidates = self.db.query_all(sql, (after,) + filters + (CLAIM_BATCH,))
+                claimed = self._claim_ready(candidates, projects)
+                if claimed is not None:
+                    return claimed
+                if len(candidates) < CLAIM_BATCH:
+                    return None
+                after = candidates[-1]['id']
+
+    def _claim_ready(self, candidates: list, projects: dict):
+        """
+        Claims the first of `candidates` whose dependencies have completed, skipping those
+        behind a failure. `projects` caches each project's (task graph, statuses).
+        """
+        for candidate in candidates:
+            project_id = candidate['project_id']
+            if project_id not in projects:
+                project_tasks = list(self.db.iter_query(
+                    "SELECT id, status, dependencies FROM tasks WHERE project_id = %s ORDER BY id", (project_id,)
+                ))
+                statuses = {task['id']: task['status'] for task in project_tasks}
+                projects[project_id] = (build_task_graph(project_tasks), statuses)
+
+            graph, statuses = projects[project_id]
+            parent_statuses = [statuses.get(parent) for parent in graph.get(candidate['id'], [])]
+
+            blocked_by = [s for s in parent_statuses if s in ('failed', 'skipped')]
+            if blocked_by:
+                self.db.execute(
+                    "UPDATE tasks SET status = 'skipped', output = %s WHERE id = %s",
+                    ("Skipped: a dependency did not complete.", candidate['id'])
+                )
+                statuses[candidate['id']] = 'skipped'
+                continue
+
+            if all(s == 'completed' for s in parent_statuses):
+                self.db.execute(
+                    """
+                    UPDATE tasks SET status = 'running', lease_owner = %s,
+                           lease_expires_at = now() + %s * interval '1 second'
+                    WHERE id = %s
+                    """,
+                    (self.worker_id, LEASE_SECONDS, candidate['id'])
+                )
+                return candidate
+        return None
+
+    def _heartbeat(self, task_id: int, done: threading.Event):
+        """Extends the lease until `done` is set; logs if another worker took the task over."""
+        while not done.wait(HEARTBEAT_SECONDS):
+            try:
+                row = self.db.query_one(
+                    """
+                    UPDATE tasks SET lease_expires_at = now() + %s * interval '1 second'
+                    WHERE id = %s AND lease_owner = %s
+                    RETURNING id
+                    """,
+                    (LEASE_SECONDS, task_id, self.worker_id)
+                )
+            except Exception as e:
+                # A missed beat is harmless while the lease has time left; try again next tick
+                logger.error("Heartbeat failed; will retry.", extra={"task_id": task_id, "worker_id": self.worker_id, "error": str(e)})
+                continue
+            if not row:
+                logger.warning("Lost task lease.", extra={"task_id": task_id, "worker_id": self.worker_id})
+                return
+
+    def run_one(self) -> bool:
+        """Claims and executes a single task. Returns False when no task was ready."""
+        task = self.claim_task()
+        if not task:
+            return False
+
+        task_id = task['id']
+        logger.info("Claimed task.", extra={"task_id": task_id, "worker_id": self.worker_id})
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(task_id, done), daemon=True)
+        heartbeat.start()
+        try:
+            # The agent's outcome is only written while this worker still holds the lease
+            with task_lease(self.worker_id):
+                dispatch_task(self.db, self.agents, task_id)
+        finally:
+            done.set()
+            heartbeat.join()
+            # The release below reads the task's status, so its outcome must be committed first
+            try:
+                flush_task_writes()
+            except Exception as e:
+                logger.error("Could not flush task updates before releasing the lease.", extra={"task_id": task_id, "error": str(e)})
+            # Release the lease; an agent that returned without recording an outcome counts as failed
+            self.db.execute(
+                """
+                UPDATE tasks SET lease_owner = NULL, lease_expires_at = NULL,
+                       status = CASE WHEN status = 'running' THEN 'failed' ELSE status END
+                WHERE id = %s AND lease_owner = %s
+                """,
+                (task_id, self.worker_id)
+            )
+        return True
+
+    def run_forever(self, stop: threading.Event, wake: threading.Event = None):
+        """
+        Keeps claiming tasks until `stop` is set. When idle it sleeps for POLL_SECONDS, or,
+        given a `wake` event fed by task notifications, until something changes. The event
+        must be this thread's own: it is cleared here before each rescan.
+        """
+        while not stop.is_set():
+            if wake is not None:
+                # Notifications from here on are seen by the rescan or leave the event set
+                wake.clear()
+            try:
+                self.reclaim_expired_leases()
+                if self.run_one():
+                    continue
+            except Exception as e:
+                logger.error("Worker loop error.", extra={"worker_id": self.worker_id, "error": str(e)})
+            if wake is None:
+                stop.wait(POLL_SECONDS)
+            else:
+                wake.wait(WORKER_IDLE_RESCAN_SECONDS)
+
+
+def main():
+    # --- Configuration ---
+    load_dotenv()
+    try:
+        PROJECT_ID = "ai-engineer-472512"
+        LOCATION = "asia-south1"
+        init_vertex(PROJECT_ID, LOCATION)
+        logger.info("Vertex AI Initialized.", extra={"project_id": PROJECT_ID, "location": LOCATION})
+    except Exception as e:
+        logger.error("Error initializing Vertex AI", extra={"error": str(e)})
+        return
+
+    start_metrics_server()
+    project_filter = os.getenv("WORKER_PROJECT_ID")
+    agents = build_agents()
+    stop = threading.Event()
+    # One wake event per thread, so a thread clearing its own never swallows another's notification
+    wakes = [threading.Event() if WORKER_USE_EVENTS else None for _ in range(WORKER_CONCURRENCY)]
+
+    if WORKER_USE_EVENTS:
+        def on_task_event(event):
+            # New or finished tasks may be claimable now; another worker's claim never is
+            if event.get("status") != 'running':
+                for wake in wakes:
+                    wake.set()
+
+        get_task_event_listener().subscribe(on_task_event)
+
+    def request_stop(signum, frame):
+        logger.info("Shutdown requested; finishing in-flight tasks.", extra={"signal": signum})
+        stop.set()
+        for wake in wakes:
+            if wake is not None:
+                wake.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # Each thread is an independent claimer sharing the agents and the connection pool
+    threads = []
+    for wake in wakes:
+        worker = TaskWorker(agents=agents, project_id=int(project_filter) if project_filter else None)
+        thread = threading.Thread(target=worker.run_forever, args=(stop, wake))
+        thread.start()
+        threads.append(thread)
+    logger.info("Worker started.", extra={"threads": WORKER_CONCURRENCY, "project_id": project_filter, "events": WORKER_USE_EVENTS})
+
+    for thread in threads:
+        thread.join()
+    flush_task_writes()
+    if WORKER_USE_EVENTS:
+        get_task_event_listener().close()
+    logger.info("Worker stopped.")
+
+if __name__ == "__main__":
+    main()